@@ -1,12 +1,18 @@
 import argparse
 import json
+import os
 import signal
+import tempfile
+import time
+from datetime import datetime
 
 from flask import Flask, Response, render_template, request, redirect, url_for
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
 
-from fr import FRVidPlayer
-from utils import log_info
+from fr import CameraRegistry, CAPTURE_PROFILES, DEFAULT_CAM_ID, DEFAULT_STREAM_SETTINGS, VideoPlayer
+from sql_db import fetch_attendance, fetch_detections, get_detections_db
+from utils import MODEL_PACKS, log_info
 
 parser = argparse.ArgumentParser(description="Facial Recognition Program")
 
@@ -27,39 +33,284 @@ parser.add_argument(
     required=False,
     default="1333",
 )
+parser.add_argument(
+    "--max-cameras",
+    type=int,
+    help="Maximum number of cameras streaming at the same time",
+    required=False,
+    default=8,
+)
+parser.add_argument(
+    "--batch-frames",
+    type=int,
+    help="Maximum number of frames (one per camera) whose faces are embedded together",
+    required=False,
+    default=8,
+)
+parser.add_argument(
+    "--search-backend",
+    type=str,
+    choices=["auto", "exact", "voyager"],
+    help="Gallery search backend (exact brute-force search, voyager HNSW index, or auto to pick by gallery size)",
+    required=False,
+    default="auto",
+)
+parser.add_argument(
+    "--exact-max-size",
+    type=int,
+    help="Largest gallery searched exactly when the search backend is auto",
+    required=False,
+    default=1000,
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    help="Number of inference worker processes, 0 to run inference in threads of the web process",
+    required=False,
+    default=0,
+)
+parser.add_argument(
+    "--detection-interval",
+    type=float,
+    help="Minimum number of seconds between recorded detections of the same person by the same camera",
+    required=False,
+    default=5.0,
+)
+parser.add_argument(
+    "--model-pack",
+    type=str,
+    choices=list(MODEL_PACKS),
+    help="Detection and recognition models, from the most accurate (buffalo_l) to the fastest (buffalo_s_int8)",
+    required=False,
+    default="buffalo_l",
+)
+parser.add_argument(
+    "--providers",
+    type=str,
+    help="Comma separated ONNX Runtime execution providers in order of preference (e.g. CPUExecutionProvider), empty to use CUDA if available",
+    required=False,
+    default="",
+)
+parser.add_argument(
+    "--intra-op-threads",
+    type=int,
+    help="Threads running each model operator, 0 for one per physical core (or each worker's share of the cores with --workers)",
+    required=False,
+    default=0,
+)
+parser.add_argument(
+    "--inter-op-threads",
+    type=int,
+    help="Threads running independent model operators in parallel",
+    required=False,
+    default=1,
+)
+parser.add_argument(
+    "--graph-optimization",
+    type=str,
+    choices=["disable", "basic", "extended", "all"],
+    help="ONNX Runtime graph optimisation level",
+    required=False,
+    default="all",
+)
+parser.add_argument(
+    "--no-cpu-arena",
+    action="store_true",
+    help="Disable the ONNX Runtime CPU memory arena (lower memory use, more allocations per inference)",
+)
+parser.add_argument(
+    "--pin-workers",
+    action="store_true",
+    help="Pin each inference worker process (--workers) to its own share of the cores",
+)
+
+
+def create_registry(options: argparse.Namespace) -> CameraRegistry:
+    """
+    Creates the camera registry, which loads the models in the background
+
+    Arguments
+    - options: command line options
+
+    Returns
+    - camera registry
+    """
+
+    log_info("Starting FR Session")
+
+    return CameraRegistry(
+        max_cameras=options.max_cameras,
+        batch_frames=options.batch_frames,
+        search_backend=options.search_backend,
+        exact_max_size=options.exact_max_size,
+        workers=options.workers,
+        detection_interval=options.detection_interval,
+        runtime_settings={
+            "model_pack": options.model_pack,
+            "providers": [provider.strip() for provider in options.providers.split(",") if provider.strip()],
+            "intra_op_threads": options.intra_op_threads,
+            "inter_op_threads": options.inter_op_threads,
+            "graph_optimization": options.graph_optimization,
+            "cpu_mem_arena": not options.no_cpu_arena,
+        },
+        pin_workers=options.pin_workers,
+    )
 
-args = parser.parse_args()
+
+# Command line options when run as a script, the defaults when imported (e.g. by a WSGI server or a test client)
+args = parser.parse_args() if __name__ == "__main__" else parser.parse_args([])
 
 app = Flask(__name__)
 CORS(app)
 
-log_info("Starting FR Session")
+# Inference worker processes are spawned, so they re-import this script as __mp_main__ and must not create a registry of their own
+registry: CameraRegistry | None = create_registry(args) if __name__ != "__mp_main__" else None
+
+
+def camera_not_found(cam_id: str) -> Response:
+    """Response for requests made to a camera that has not been started"""
+
+    response_msg = json.dumps({"stream": False, "message": f"Camera {cam_id} not started!"})
+    return Response(response_msg, status=404, mimetype='application/json')
+
+
+def models_not_ready() -> Response:
+    """Response for requests that need the models before they have loaded"""
+
+    response_msg = json.dumps({
+        "message": registry.load_error or "Models are still loading, try again shortly!",
+        **registry.readiness(),
+    })
+    return Response(response_msg, status=503, mimetype='application/json')
+
+
+def form_number(name: str, cast: type, default: float) -> float:
+    """
+    Reads a number from the submitted form
+
+    Arguments
+    - name: name of the form field
+    - cast: int or float
+    - default: value used when the field is not given
+
+    Returns
+    - value of the field
+    """
+
+    value = request.form.get(name, default)
+
+    try:
+        return cast(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}") from None
+
+
+def parse_rois(rois: str) -> list[list[float]]:
+    """
+    Parses regions of interest
+
+    Arguments
+    - rois: regions of interest separated by semicolons, each as "x_min,y_min,x_max,y_max" fractions of the frame
+
+    Returns
+    - regions of interest in xyxy format (fraction of the frame)
+    """
+
+    roi_list = []
+    for roi in rois.split(";"):
+        if not roi.strip():
+            continue
+
+        try:
+            values = [float(value) for value in roi.split(",")]
+        except ValueError:
+            raise ValueError(f"Invalid region of interest: {roi.strip()}") from None
 
-fr_instance = FRVidPlayer()
+        if len(values) != 4 or not (0 <= values[0] < values[2] <= 1 and 0 <= values[1] < values[3] <= 1):
+            raise ValueError(f"Invalid region of interest: {roi.strip()}")
+
+        roi_list.append(values)
+
+    return roi_list
+
+
+def parse_time(value: str | None, default: float) -> float:
+    """
+    Parses a time given as a query parameter
+
+    Arguments
+    - value: unix timestamp, or date and time in ISO 8601 format (local time unless it has an offset), None to use the default
+    - default: unix timestamp used when no time is given
+
+    Returns
+    - unix timestamp
+    """
+
+    if value is None or not value.strip():
+        return default
+
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.strip()).timestamp()
+
+
+def format_time(timestamp: float) -> str:
+    """Formats a unix timestamp as a local date and time in ISO 8601 format"""
+
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds")
 
 
 @app.route("/start", methods=["POST"])
 def start():
     """API for frontend to start FR"""
 
-    if fr_instance.is_started:        
-        response_msg = json.dumps({"stream": False, "message": "Stream already started!"})
-        return Response(response_msg, status=200, mimetype='application/json')
-
+    cam_id = request.form.get("cam_id", DEFAULT_CAM_ID).strip() or DEFAULT_CAM_ID
     stream_src = request.form.get("stream_src", None)
     data_file = request.form.get("data_file", None)
 
-    fr_instance.start_stream(stream_src)
+    # Settings not given come from the capture profile
+    capture_profile = request.form.get("capture_profile", DEFAULT_STREAM_SETTINGS["capture_profile"])
+    defaults = {**DEFAULT_STREAM_SETTINGS, **CAPTURE_PROFILES.get(capture_profile, {})}
+
+    try:
+        VideoPlayer.check_source(stream_src or "")
+        weight = form_number("weight", int, 1)
+        stream_settings = {
+            "capture_profile": capture_profile,
+            "capture_width": form_number("capture_width", int, defaults["capture_width"]),
+            "capture_height": form_number("capture_height", int, defaults["capture_height"]),
+            "capture_fps": form_number("capture_fps", float, defaults["capture_fps"]),
+            "pix_fmt": request.form.get("pix_fmt", defaults["pix_fmt"]),
+            "decode_threads": form_number("decode_threads", int, defaults["decode_threads"]),
+            "det_size": form_number("det_size", int, defaults["det_size"]),
+            "max_fps": form_number("max_fps", float, defaults["max_fps"]),
+            "use_motion_gate": "use_motion_gate" in request.form,
+            "motion_threshold": form_number("motion_threshold", float, defaults["motion_threshold"]),
+            "motion_refresh": form_number("motion_refresh", float, defaults["motion_refresh"]),
+            "broadcast_width": form_number("broadcast_width", int, defaults["broadcast_width"]),
+            "broadcast_quality": form_number("broadcast_quality", int, defaults["broadcast_quality"]),
+            "broadcast_fps": form_number("broadcast_fps", float, defaults["broadcast_fps"]),
+            "use_tracker": "use_tracker" in request.form,
+            "track_reembed_interval": form_number("track_reembed_interval", int, defaults["track_reembed_interval"]),
+            "track_reembed_iou": form_number("track_reembed_iou", float, defaults["track_reembed_iou"]),
+            "track_conf_drop": form_number("track_conf_drop", float, defaults["track_conf_drop"]),
+            "reconnect_delay": form_number("reconnect_delay", float, defaults["reconnect_delay"]),
+            "max_reconnect_delay": form_number("max_reconnect_delay", float, defaults["max_reconnect_delay"]),
+            "stall_timeout": form_number("stall_timeout", float, defaults["stall_timeout"]),
+        }
+        stream_settings["rois"] = parse_rois(request.form.get("rois", ""))
+    except ValueError as err:
+        response_msg = json.dumps({"stream": False, "message": str(err)})
+        return Response(response_msg, status=400, mimetype='application/json')
 
     try:
-        fr_instance.load_embeddings(data_file)
+        enrolment = registry.start_camera(cam_id, stream_src, data_file, weight, stream_settings)
     except (ValueError, FileNotFoundError) as err:
-        fr_instance.end_event.set()
         response_msg = json.dumps({"stream": False, "message": str(err)})
         return Response(response_msg, status=200, mimetype='application/json')
 
-    fr_instance.start_inference()
-    response_msg = json.dumps({"stream": True, "message": "Success!"})
+    response_msg = json.dumps({"stream": True, "message": "Success!", "enrolment": enrolment})
     return Response(response_msg, status=200, mimetype='application/json')
 
 
@@ -67,11 +318,13 @@ def start():
 def end():
     """API for frontend to end FR"""
 
-    if not fr_instance.is_started:
+    cam_id = request.form.get("cam_id", DEFAULT_CAM_ID).strip() or DEFAULT_CAM_ID
+
+    if not registry.is_started(cam_id):
         response_msg = json.dumps({"stream": False, "message": "Stream not started!"})
         return Response(response_msg, status=200, mimetype='application/json')
     
-    fr_instance.end_stream()
+    registry.end_camera(cam_id)
 
     response_msg = json.dumps({"stream": True, "message": "Success!"})
     return Response(response_msg, status=200, mimetype='application/json')
@@ -81,8 +334,10 @@ def end():
 def check_alive():
     """API to check if FR has started"""
 
+    camera = registry.get(request.args.get("cam_id", DEFAULT_CAM_ID))
+
     try:
-        if fr_instance.streamThread.is_alive():
+        if camera.streamThread.is_alive():
             response = "Yes"
         else: 
             response = "No"
@@ -92,21 +347,216 @@ def check_alive():
     return Response(response, status=200, mimetype='application/json')
 
 
-@app.route("/vidFeed")
-def video_feed():
+@app.route("/ready")
+def ready():
+    """API to check if the models are loaded and warmed up, so that cameras can be started (503 until they are)"""
+
+    readiness = registry.readiness()
+    return Response(json.dumps(readiness), status=200 if readiness["ready"] else 503, mimetype='application/json')
+
+
+@app.route("/cameras")
+def cameras():
+    """API to list cameras, whether their streams are connected, the number of frames each has had inferred, how frames were skipped, how faces were tracked and video feed viewers"""
+
+    response_msg = json.dumps({
+        "cameras": [
+            {
+                "cam_id": cam_id,
+                "started": camera.is_started,
+                "capture": {
+                    "connected": camera.connected,
+                    "reconnects": camera.reconnects,
+                    "frame_age": (
+                        time.monotonic() - camera.last_frame_time if camera.last_frame_time is not None else None
+                    ),
+                    "stale": camera.stale_dropped,
+                },
+                "inferences": registry.scheduler.grants.get(cam_id, 0),
+                "stats": camera.inference_stats,
+                "tracking": {
+                    "embedded": camera.face_tracker.embedded,
+                    "reused": camera.face_tracker.reused,
+                    "tracks": camera.face_tracker.stats(),
+                } if camera.face_tracker is not None else None,
+                "broadcast": {
+                    "viewers": camera.broadcast_hub.viewers,
+                    "encoded": camera.broadcast_hub.encoded,
+                    "dropped": camera.broadcast_hub.dropped,
+                },
+            }
+            for cam_id, camera in list(registry.cameras.items())
+        ]
+    })
+    return Response(response_msg, status=200, mimetype='application/json')
+
+
+@app.route("/metrics")
+def metrics():
+    """API to scrape per-camera stage latencies, frame and face counters and engine load in the Prometheus text format"""
+
+    return Response(registry.metrics(), status=200, mimetype='text/plain; version=0.0.4')
+
+
+@app.route("/attendance")
+def attendance():
+    """API to get when each person was first and last seen in a time window (the past day by default)"""
+
+    try:
+        end_time = parse_time(request.args.get("end"), time.time())
+        start_time = parse_time(request.args.get("start"), end_time - 24 * 60 * 60)
+    except ValueError as err:
+        response_msg = json.dumps({"message": f"Invalid time: {err}"})
+        return Response(response_msg, status=400, mimetype='application/json')
+
+    with get_detections_db() as conn:
+        records = fetch_attendance(conn, start_time, end_time, request.args.get("cam_id"))
+
+    response_msg = json.dumps({
+        "start": format_time(start_time),
+        "end": format_time(end_time),
+        "attendance": [
+            {
+                **record,
+                "first_seen": format_time(record["first_seen"]),
+                "last_seen": format_time(record["last_seen"]),
+            }
+            for record in records
+        ],
+    })
+    return Response(response_msg, status=200, mimetype='application/json')
+
+
+@app.route("/detections/<name>")
+def detections(name: str):
+    """API to get the recorded detections of a person in a time window (the past day by default)"""
+
+    try:
+        end_time = parse_time(request.args.get("end"), time.time())
+        start_time = parse_time(request.args.get("start"), end_time - 24 * 60 * 60)
+        limit = int(request.args.get("limit", 1000))
+    except ValueError as err:
+        response_msg = json.dumps({"message": f"Invalid query: {err}"})
+        return Response(response_msg, status=400, mimetype='application/json')
+
+    with get_detections_db() as conn:
+        records = fetch_detections(conn, name, start_time, end_time, limit)
+
+    response_msg = json.dumps({
+        "name": name,
+        "detections": [{**record, "time": format_time(record["time"])} for record in records],
+    })
+    return Response(response_msg, status=200, mimetype='application/json')
+
+
+@app.route("/enrolment")
+def enrolment():
+    """API to check the progress and outcome of the latest enrolment"""
+
+    if not registry.is_ready:
+        return models_not_ready()
+
+    enroller = registry.gallery.enroller
+    response_msg = json.dumps({"progress": enroller.progress, "summary": enroller.summary})
+    return Response(response_msg, status=200, mimetype='application/json')
+
+
+@app.route("/gallery")
+def gallery():
+    """API to list the people in the gallery"""
+
+    if not registry.is_ready:
+        return models_not_ready()
+
+    names = registry.gallery.names()
+    response_msg = json.dumps({"size": len(names), "names": names})
+    return Response(response_msg, status=200, mimetype='application/json')
+
+
+@app.route("/gallery/<name>", methods=["POST", "PUT"])
+def put_person(name: str):
+    """API to add a person to the gallery (POST) or replace their images (PUT) from uploaded images, without stopping any camera"""
+
+    if not registry.is_ready:
+        return models_not_ready()
+
+    uploads = [upload for upload in request.files.getlist("images") if upload.filename]
+    if not uploads:
+        response_msg = json.dumps({"message": "Please upload at least one image."})
+        return Response(response_msg, status=400, mimetype='application/json')
+
+    # Images are cached by name, so two uploads with the same name would overwrite each other's record
+    img_names = [secure_filename(upload.filename) or f"image_{idx}" for idx, upload in enumerate(uploads)]
+    duplicates = sorted({img_name for img_name in img_names if img_names.count(img_name) > 1})
+    if duplicates:
+        response_msg = json.dumps({"message": f"Images must have different file names: {', '.join(duplicates)}"})
+        return Response(response_msg, status=400, mimetype='application/json')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        images = []
+        for idx, (upload, img_name) in enumerate(zip(uploads, img_names)):
+            img_fp = os.path.join(tmp_dir, f"{idx}_{img_name}")
+            upload.save(img_fp)
+            images.append((img_name, img_fp))
+
+        try:
+            update = registry.gallery.put_person(name, images, replace=request.method == "PUT")
+        except ValueError as err:
+            response_msg = json.dumps({"message": str(err)})
+            return Response(response_msg, status=409, mimetype='application/json')
+        except KeyError:
+            response_msg = json.dumps({"message": f"{name} is not in the gallery!"})
+            return Response(response_msg, status=404, mimetype='application/json')
+
+    if not update["enrolled"]:
+        return Response(json.dumps({"message": "None of the images can be used.", **update}), status=400, mimetype='application/json')
+
+    status = 201 if request.method == "POST" else 200
+    return Response(json.dumps(update), status=status, mimetype='application/json')
+
+
+@app.route("/gallery/<name>", methods=["DELETE"])
+def remove_person(name: str):
+    """API to remove a person from the gallery, without stopping any camera"""
+
+    if not registry.is_ready:
+        return models_not_ready()
+
+    try:
+        registry.gallery.remove_person(name)
+    except KeyError:
+        response_msg = json.dumps({"message": f"{name} is not in the gallery!"})
+        return Response(response_msg, status=404, mimetype='application/json')
+
+    response_msg = json.dumps({"message": f"{name} removed!", "gallery_size": len(registry.gallery.names())})
+    return Response(response_msg, status=200, mimetype='application/json')
+
+
+@app.route("/vidFeed", defaults={"cam_id": DEFAULT_CAM_ID})
+@app.route("/vidFeed/<cam_id>")
+def video_feed(cam_id: str):
     """Returns a HTTP streaming response of the video feed from FFMPEG"""
 
+    camera = registry.get(cam_id)
+    if camera is None:
+        return camera_not_found(cam_id)
+
     return Response(
-        fr_instance.start_broadcast(), mimetype="multipart/x-mixed-replace; boundary=frame"
+        camera.start_broadcast(), mimetype="multipart/x-mixed-replace; boundary=frame"
     )
 
 
-@app.route("/frResults")
-def fr_results():
+@app.route("/frResults", defaults={"cam_id": DEFAULT_CAM_ID})
+@app.route("/frResults/<cam_id>")
+def fr_results(cam_id: str):
     """Returns a HTTP streaming response of the recently detected names, their scores, and bounding boxes"""
 
+    camera = registry.get(cam_id)
+    if camera is None:
+        return camera_not_found(cam_id)
+
     return Response(
-        fr_instance.start_detection_broadcast(), mimetype="application/json"
+        camera.start_detection_broadcast(), mimetype="application/json"
     )
 
 
@@ -116,31 +566,31 @@ def submit():
 
     new_settings = {
         "threshold": float(request.form.get(
-            "threshold", fr_instance.fr_settings["threshold"]
+            "threshold", registry.fr_settings["threshold"]
         )),
         "holding_time": int(float(
-            request.form.get("holding_time", fr_instance.fr_settings["holding_time"]))
+            request.form.get("holding_time", registry.fr_settings["holding_time"]))
         ),
         "use_differentiator": "use_differentiator" in request.form,
         "threshold_lenient_diff": float(request.form.get(
-            "threshold_lenient_diff", fr_instance.fr_settings["threshold_lenient_diff"]
+            "threshold_lenient_diff", registry.fr_settings["threshold_lenient_diff"]
         )),
         "similarity_gap": float(request.form.get(
-            "similarity_gap", fr_instance.fr_settings["similarity_gap"]
+            "similarity_gap", registry.fr_settings["similarity_gap"]
         )),
         "use_persistor": "use_persistor" in request.form,
         "threshold_prev": float(request.form.get(
-            "threshold_prev", fr_instance.fr_settings["threshold_prev"]
+            "threshold_prev", registry.fr_settings["threshold_prev"]
         )),
         "threshold_iou": float(request.form.get(
-            "threshold_iou", fr_instance.fr_settings["threshold_iou"]
+            "threshold_iou", registry.fr_settings["threshold_iou"]
         )),
         "threshold_lenient_pers": float(request.form.get(
-            "threshold_lenient_pers", fr_instance.fr_settings["threshold_lenient_pers"]
+            "threshold_lenient_pers", registry.fr_settings["threshold_lenient_pers"]
         ))
     }
 
-    fr_instance.adjust_values(new_settings)
+    registry.adjust_values(new_settings)
     return redirect(url_for('settings'))
 
 
@@ -148,7 +598,7 @@ def submit():
 def index():
     """Renders home page which includes the live feed (with bounding boxes) and a detection list"""
 
-    return render_template("index.html")
+    return render_template("index.html", capture_profiles=list(CAPTURE_PROFILES))
 
 
 @app.route("/settings")
@@ -157,19 +607,19 @@ def settings():
 
     return render_template(
         "settings.html",
-        threshold=fr_instance.fr_settings["threshold"],
-        holding_time=fr_instance.fr_settings["holding_time"],
-        use_differentiator=fr_instance.fr_settings["use_differentiator"],
-        threshold_lenient_diff=fr_instance.fr_settings["threshold_lenient_diff"],
-        similarity_gap=fr_instance.fr_settings["similarity_gap"],
-        use_persistor=fr_instance.fr_settings["use_persistor"],
-        threshold_prev=fr_instance.fr_settings["threshold_prev"],
-        threshold_iou=fr_instance.fr_settings["threshold_iou"],
-        threshold_lenient_pers=fr_instance.fr_settings["threshold_lenient_pers"],
+        threshold=registry.fr_settings["threshold"],
+        holding_time=registry.fr_settings["holding_time"],
+        use_differentiator=registry.fr_settings["use_differentiator"],
+        threshold_lenient_diff=registry.fr_settings["threshold_lenient_diff"],
+        similarity_gap=registry.fr_settings["similarity_gap"],
+        use_persistor=registry.fr_settings["use_persistor"],
+        threshold_prev=registry.fr_settings["threshold_prev"],
+        threshold_iou=registry.fr_settings["threshold_iou"],
+        threshold_lenient_pers=registry.fr_settings["threshold_lenient_pers"],
     )
 
 
 if __name__ == "__main__":
-    signal.signal(signal.SIGINT, fr_instance.cleanup)
+    signal.signal(signal.SIGINT, registry.cleanup)
     app.run(debug=True, host=args.ipaddress, port=args.port, use_reloader=False)
     
\ No newline at end of file
@@ -0,0 +1,24 @@
+"""
+Runs one of the benchmarks, passing the remaining arguments on to it
+
+Run from the simpliFRy directory: python -m bench <benchmark> [arguments], e.g. python -m bench pipeline --video path/to/video.mp4
+"""
+
+import importlib
+import sys
+
+BENCHMARKS = ["pipeline", "batch_embedding", "frame_path", "model_packs", "results_load", "search_backend", "startup"]
+
+
+def main() -> None:
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"usage: python -m bench {{{','.join(BENCHMARKS)}}} [arguments]")
+        sys.exit(2)
+
+    name = sys.argv.pop(1)
+    sys.argv[0] = f"python -m bench {name}"
+    importlib.import_module(f"bench.{name}").main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares face embedding throughput of one recognition call per face (FaceAnalysis.get) against one call per batch (InferenceEngine)
+
+Aligned face crops are random, as the cost of the recognition model does not depend on the content of the crop.
+Needs the insightface model pack to be downloaded. Run from the simpliFRy directory: python -m bench.batch_embedding
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+from insightface.app import FaceAnalysis
+
+
+def run_per_face(rec_model, crops: list[np.ndarray]) -> None:
+    for crop in crops:
+        rec_model.get_feat(crop)
+
+
+def run_batched(rec_model, crops: list[np.ndarray], max_batch_faces: int) -> None:
+    for start in range(0, len(crops), max_batch_faces):
+        rec_model.get_feat(crops[start:start + max_batch_faces])
+
+
+def measure(name: str, func, crops: list[np.ndarray], faces_per_frame: int, repeats: int, **kwargs) -> dict:
+    func(crops=crops[:faces_per_frame], **kwargs)  # Warm-up
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for _ in range(repeats):
+        func(crops=crops, **kwargs)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    num_faces = len(crops) * repeats
+    return {
+        "mode": name,
+        "faces_per_frame": faces_per_frame,
+        "frames": len(crops) // faces_per_frame,
+        "faces_per_sec": num_faces / wall,
+        "cpu_ms_per_face": cpu * 1000 / num_faces,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark of per-face against batched face embedding")
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 10, 50], help="Faces per frame")
+    parser.add_argument("--frames", type=int, default=4, help="Frames per batch (one per camera)")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of batches timed")
+    parser.add_argument("--max-batch-faces", type=int, default=64, help="Maximum number of face crops per recognition call")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    model = FaceAnalysis(providers=["CPUExecutionProvider"], allowed_modules=["detection", "recognition"])
+    model.prepare(ctx_id=-1)
+    rec_model = model.models["recognition"]
+
+    rng = np.random.default_rng(0)
+    size = rec_model.input_size[0]
+
+    results = []
+    for faces_per_frame in args.faces:
+        crops = [
+            rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+            for _ in range(faces_per_frame * args.frames)
+        ]
+        results.append(measure("per-face", run_per_face, crops, faces_per_frame, args.repeats, rec_model=rec_model))
+        results.append(measure(
+            "batched", run_batched, crops, faces_per_frame, args.repeats,
+            rec_model=rec_model, max_batch_faces=args.max_batch_faces,
+        ))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<10}{'faces/frame':>12}{'frames':>8}{'faces/s':>10}{'cpu ms/face':>14}")
+    for result in results:
+        print(
+            f"{result['mode']:<10}{result['faces_per_frame']:>12}{result['frames']:>8}"
+            f"{result['faces_per_sec']:>10.1f}{result['cpu_ms_per_face']:>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
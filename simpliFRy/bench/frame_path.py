@@ -0,0 +1,145 @@
+"""
+Compares the cost of getting a frame from ffmpeg's stdout to the inference input
+
+- jpeg: previous path (read bytes, JPEG encode in stream thread, JPEG decode + RGB convert in inference)
+- raw: raw frame read in place into the shared FrameBuffer, converted to RGB for inference
+- raw+viewer: raw path with one JPEG encode per frame for a connected /vidFeed client
+
+Run from the simpliFRy directory: python -m bench.frame_path
+"""
+
+import argparse
+import io
+import json
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from fr.FrameBuffer import FrameBuffer
+from fr.VideoPlayer import VideoPlayer
+
+
+class FakeStream:
+    """Stands in for ffmpeg's stdout pipe by cycling through a set of prepared raw frames"""
+
+    def __init__(self, frames: list[np.ndarray], num_frames: int) -> None:
+        self.raw_frames = [frame.tobytes() for frame in frames]
+        self.remaining = num_frames * len(self.raw_frames[0])
+        self.pos = 0
+
+    def _next_chunk(self, size: int) -> bytes:
+        frame_size = len(self.raw_frames[0])
+        size = min(size, self.remaining, frame_size - self.pos % frame_size)
+        raw = self.raw_frames[(self.pos // frame_size) % len(self.raw_frames)]
+        offset = self.pos % frame_size
+        self.pos += size
+        self.remaining -= size
+        return raw[offset:offset + size]
+
+    def read(self, size: int) -> bytes:
+        chunks = []
+        while size > 0 and self.remaining > 0:
+            chunk = self._next_chunk(size)
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def readinto(self, buffer: memoryview) -> int:
+        chunk = self._next_chunk(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def make_frames(width: int, height: int, count: int) -> list[np.ndarray]:
+    """Creates frames with gradients, blocks and noise so that JPEG cost resembles a real scene"""
+
+    rng = np.random.default_rng(0)
+    x_grad = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    y_grad = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+
+    frames = []
+    for i in range(count):
+        frame = np.empty((height, width, 3), dtype=np.float32)
+        frame[..., 0] = x_grad
+        frame[..., 1] = y_grad
+        frame[..., 2] = (x_grad + y_grad + i * 16) % 256
+        for _ in range(20):
+            x, y = rng.integers(0, width - 100), rng.integers(0, height - 100)
+            frame[y:y + 100, x:x + 100] = rng.integers(0, 255, 3)
+        frame += rng.normal(0, 8, frame.shape)
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+
+    return frames
+
+
+def run_jpeg_path(stream: FakeStream, width: int, height: int, num_frames: int) -> None:
+    for _ in range(num_frames):
+        raw_frame = stream.read(width * height * 3)
+        frame = np.frombuffer(raw_frame, np.uint8).reshape((height, width, 3))
+        _, buffer = cv2.imencode(".jpg", frame)
+        frame_bytes = buffer.tobytes()
+
+        img = Image.open(io.BytesIO(frame_bytes)).convert("RGB")
+        np.array(img)
+
+
+def run_raw_path(stream: FakeStream, width: int, height: int, num_frames: int, viewer: bool = False) -> None:
+    frame_buffer = FrameBuffer(width, height)
+
+    for _ in range(num_frames):
+        frame = frame_buffer.begin_write()
+        VideoPlayer._read_frame(stream, frame)
+        frame_buffer.commit_write()
+
+        with frame_buffer.read_latest() as (_, frame):
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            if viewer:
+                cv2.imencode(".jpg", frame)
+
+
+def measure(name: str, func, frames: list[np.ndarray], num_frames: int, **kwargs) -> dict:
+    stream = FakeStream(frames, num_frames)
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    func(stream, num_frames=num_frames, **kwargs)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    return {
+        "path": name,
+        "frames": num_frames,
+        "fps": num_frames / wall,
+        "cpu_ms_per_frame": cpu * 1000 / num_frames,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark of the ffmpeg to inference frame path")
+    parser.add_argument("-n", "--num-frames", type=int, default=200, help="Number of frames per path")
+    parser.add_argument("--width", type=int, default=1280, help="Frame width")
+    parser.add_argument("--height", type=int, default=720, help="Frame height")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)
+    frames = make_frames(args.width, args.height, 8)
+    size = {"width": args.width, "height": args.height}
+
+    results = [
+        measure("jpeg", run_jpeg_path, frames, args.num_frames, **size),
+        measure("raw", run_raw_path, frames, args.num_frames, **size),
+        measure("raw+viewer", run_raw_path, frames, args.num_frames, viewer=True, **size),
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'path':<12}{'fps':>10}{'cpu ms/frame':>16}")
+    for result in results:
+        print(f"{result['path']:<12}{result['fps']:>10.1f}{result['cpu_ms_per_frame']:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Compares model packs by face verification accuracy and latency on a labelled image folder, to pick the pack for a site
+
+The images are read from a data file in the same format as for enrolment (relative to the data folder): every image of a person is a labelled sample.
+The most confidently detected face of each image is embedded, and every pair of embeddings is compared by cosine distance:
+pairs of the same person are genuine, pairs of different people are impostors.
+
+Reported for each model pack:
+- images: images with a usable face, out of all images (smaller detection models miss more faces)
+- latency: percentiles of detection and recognition time per image, run one image at a time
+- tar/far: share of genuine pairs accepted and of impostor pairs accepted at --threshold (the FR threshold, default 0.45)
+- tar_at_far: share of genuine pairs accepted at the threshold accepting each share of impostor pairs in --fars
+- eer: equal error rate, where the share of genuine pairs rejected equals the share of impostor pairs accepted
+- rank1: share of images whose closest other image is of the same person
+
+Packs not yet downloaded are downloaded by insightface, and int8 packs are quantised on first use.
+Run from the simpliFRy directory: python -m bench.model_packs --data-file path/to/data.json
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from insightface.utils import face_align
+
+from bench.pipeline import git_commit
+from fr.Enroller import read_image
+from utils import DEFAULT_RUNTIME_SETTINGS, MODEL_PACKS, load_model, model_identity
+
+
+def load_samples(data_file: str) -> list[tuple[str, str]]:
+    """Lists the name of the person and the path of each image in a data file (relative to the data folder)"""
+
+    with open(os.path.join("data", data_file), "r") as file:
+        data_dict = json.load(file)
+
+    img_folder_path = os.path.join("data", data_dict["img_folder_path"])
+
+    return [
+        (entry["name"], os.path.join(img_folder_path, img_name))
+        for entry in data_dict["details"] for img_name in entry["images"]
+    ]
+
+
+def latency_ms(samples: list[float]) -> dict:
+    samples_ms = np.asarray(samples) * 1000
+
+    return {
+        "p50_ms": float(np.percentile(samples_ms, 50)),
+        "p90_ms": float(np.percentile(samples_ms, 90)),
+        "max_ms": float(samples_ms.max()),
+    }
+
+
+def embed_samples(model, samples: list[tuple[str, str]], det_size: int) -> tuple[list[str], np.ndarray, dict]:
+    """
+    Embeds the most confidently detected face of each image, timing detection and recognition
+
+    Returns
+    - name of the person of each usable image
+    - (N, D) array of their normalised embeddings
+    - latency percentiles of detection and recognition
+    """
+
+    det_model, rec_model = model.det_model, model.models["recognition"]
+    input_size = (det_size, det_size)
+
+    names, embeddings = [], []
+    detect_times, embed_times = [], []
+
+    for idx, (name, img_fp) in enumerate(samples):
+        try:
+            img = read_image(img_fp)
+        except Exception:
+            continue
+
+        # The first image warms up the sessions and is not timed
+        if idx == 0:
+            det_model.detect(img, input_size=input_size, max_num=0, metric='default')
+
+        start = time.perf_counter()
+        bboxes, kpss = det_model.detect(img, input_size=input_size, max_num=0, metric='default')
+        detect_times.append(time.perf_counter() - start)
+
+        if not bboxes.shape[0]:
+            continue
+
+        crop = face_align.norm_crop(img, landmark=kpss[0], image_size=rec_model.input_size[0])
+
+        start = time.perf_counter()
+        embedding = rec_model.get_feat([crop])[0]
+        embed_times.append(time.perf_counter() - start)
+
+        names.append(name)
+        embeddings.append(embedding / np.linalg.norm(embedding))
+
+    latency = {"detect": latency_ms(detect_times), "embed": latency_ms(embed_times)} if embed_times else {}
+
+    return names, np.asarray(embeddings, dtype=np.float32), latency
+
+
+def verification_metrics(names: list[str], embeddings: np.ndarray, threshold: float, fars: list[float]) -> dict | None:
+    """
+    Measures verification accuracy over every pair of embeddings
+
+    Returns
+    - accuracy metrics, None if there are no genuine or no impostor pairs
+    """
+
+    labels = np.asarray(names)
+    similarities = embeddings @ embeddings.T
+    rows, cols = np.triu_indices(len(labels), k=1)
+
+    distances = 1 - similarities[rows, cols]
+    same = labels[rows] == labels[cols]
+    genuine, impostor = np.sort(distances[same]), np.sort(distances[~same])
+
+    if not genuine.size or not impostor.size:
+        return None
+
+    def accept_rate(sorted_distances: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+        return np.searchsorted(sorted_distances, thresholds, side="left") / sorted_distances.size
+
+    # Equal error rate over every distance as a candidate threshold
+    candidates = np.concatenate([genuine, impostor])
+    frr, far = 1 - accept_rate(genuine, candidates), accept_rate(impostor, candidates)
+    eer_idx = np.argmin(np.abs(frr - far))
+
+    tar_at_far = {}
+    for target in fars:
+        # Largest threshold accepting at most the target share of impostor pairs
+        far_threshold = impostor[min(int(target * impostor.size), impostor.size - 1)]
+        tar_at_far[str(target)] = float(accept_rate(genuine, np.asarray([far_threshold]))[0])
+
+    np.fill_diagonal(similarities, -np.inf)
+    nearest = np.argmax(similarities, axis=1)
+
+    return {
+        "genuine_pairs": int(genuine.size),
+        "impostor_pairs": int(impostor.size),
+        "tar": float(accept_rate(genuine, np.asarray([threshold]))[0]),
+        "far": float(accept_rate(impostor, np.asarray([threshold]))[0]),
+        "tar_at_far": tar_at_far,
+        "eer": float((frr[eer_idx] + far[eer_idx]) / 2),
+        "rank1": float(np.mean(labels[nearest] == labels)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verification accuracy and latency of model packs on a labelled image folder")
+    parser.add_argument("--data-file", required=True, help="Data file (relative to the data folder) linking names to pictures")
+    parser.add_argument("--packs", nargs="+", default=list(MODEL_PACKS), choices=list(MODEL_PACKS), help="Model packs compared")
+    parser.add_argument("--threshold", type=float, default=0.45, help="Cosine distance below which two faces are taken to be the same person")
+    parser.add_argument("--fars", type=float, nargs="+", default=[0.01, 0.001], help="Shares of impostor pairs accepted to report the genuine pairs accepted at")
+    parser.add_argument("--det-size", type=int, default=640, help="Detection input size")
+    parser.add_argument("--providers", nargs="+", default=[], help="ONNX Runtime execution providers, none to use CUDA if available")
+    parser.add_argument("--intra-op-threads", type=int, default=0, help="ONNX Runtime threads per operator, 0 for the default")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    if not os.path.isfile(os.path.join("data", args.data_file)):
+        parser.error(f"{os.path.join('data', args.data_file)} does not exist")
+
+    samples = load_samples(args.data_file)
+    results = []
+
+    for pack in args.packs:
+        model = load_model({
+            **DEFAULT_RUNTIME_SETTINGS,
+            "model_pack": pack,
+            "providers": args.providers,
+            "intra_op_threads": args.intra_op_threads,
+        })
+
+        names, embeddings, latency = embed_samples(model, samples, args.det_size)
+
+        results.append({
+            "pack": pack,
+            "model": model_identity(model),
+            "images": len(names),
+            "total_images": len(samples),
+            "people": len(set(names)),
+            "latency": latency,
+            "accuracy": verification_metrics(names, embeddings, args.threshold, args.fars),
+        })
+
+    report = {
+        "commit": git_commit(),
+        "data_file": args.data_file,
+        "config": {key: value for key, value in vars(args).items() if key not in ("data_file", "json")},
+        "cpu_count": os.cpu_count(),
+        "runs": results,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"commit {report['commit']}, data file {args.data_file}, threshold {args.threshold}")
+    far_headers = "".join(f"{f'tar@{far}':>12}" for far in args.fars)
+    print(
+        f"{'pack':<16}{'images':>10}{'det ms':>8}{'emb ms':>8}"
+        f"{'tar':>8}{'far':>8}{far_headers}{'eer':>8}{'rank1':>8}"
+    )
+    for result in results:
+        latency, accuracy = result["latency"], result["accuracy"]
+        images = f"{result['images']}/{result['total_images']}"
+        timings = f"{latency['detect']['p50_ms']:>8.1f}{latency['embed']['p50_ms']:>8.1f}" if latency else f"{'-':>8}{'-':>8}"
+
+        if accuracy is None:
+            print(f"{result['pack']:<16}{images:>10}{timings}  (needs two people, one with two usable images)")
+            continue
+
+        tar_at_far = "".join(f"{accuracy['tar_at_far'][str(far)]:>12.4f}" for far in args.fars)
+        print(
+            f"{result['pack']:<16}{images:>10}{timings}"
+            f"{accuracy['tar']:>8.4f}{accuracy['far']:>8.4f}{tar_at_far}{accuracy['eer']:>8.4f}{accuracy['rank1']:>8.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+End-to-end benchmark of the FR pipeline on a recorded video, against synthetic galleries
+
+The video is decoded by ffmpeg and run through FRVidPlayer exactly as a camera stream would be (no network or camera needed), looping until the run ends.
+Each gallery is filled with random identities, saved to Embeddings.db and loaded into the search backend, in a temporary working directory so that the real database is untouched.
+
+Reported for each gallery size:
+- fps: frames inferred per second, end to end (decoding to publishing results)
+- results_per_sec: result updates received per second by a /frResults subscriber, and detections within them
+- stages: latency percentiles of each stage (decode, convert, detect, embed, search, postprocess, serialize)
+- cpu: CPU time used by this process, by ffmpeg and by the inference workers, and the number of cores kept busy in total
+- memory: current and peak resident set size of this process and of the inference workers
+
+Unless --realtime is given, the video is decoded as fast as possible and the inference loop takes the latest frame, so fps is the maximum throughput.
+The output carries the commit it was run on, so that --json output can be compared across commits.
+Capture profiles (--profile) can be compared by their fps and CPU cost.
+
+Needs ffmpeg and the insightface model pack. Run from the simpliFRy directory: python -m bench.pipeline --video path/to/video.mp4
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from fr.CameraRegistry import CameraRegistry
+from fr.FRVidPlayer import CAPTURE_PROFILES, FRVidPlayer
+from fr.InferenceWorkerPool import InferenceWorkerPool
+from sql_db import create_tables, get_db, sync_records
+from utils import MODEL_PACKS
+
+BENCH_CAM_ID = "bench"
+
+# Order in which a frame passes through the stages
+STAGES = ["decode", "convert", "detect", "embed", "search", "postprocess", "serialize"]
+
+
+class BenchPlayer(FRVidPlayer):
+    """Plays a local video file on a loop, optionally at its native frame rate"""
+
+    realtime = False
+
+    def _ffmpeg_command(self, stream_src: str) -> list[str]:
+        command = super()._ffmpeg_command(stream_src)
+        input_options = ["-stream_loop", "-1"] + (["-re"] if self.realtime else [])
+        return command[:1] + input_options + command[1:]
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def memory_mb(pid: int | str = "self", field: str = "VmRSS") -> float | None:
+    """Reads a memory field (VmRSS for current, VmHWM for peak resident set size) of a process from /proc"""
+
+    try:
+        with open(f"/proc/{pid}/status", "r") as file:
+            for line in file:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return None
+
+
+def cpu_seconds(pid: int | str = "self") -> float | None:
+    """Reads the CPU time (user and system, all threads) used so far by a process from /proc"""
+
+    try:
+        with open(f"/proc/{pid}/stat", "r") as file:
+            # Fields after the command name (which may contain spaces); utime and stime are the 14th and 15th fields
+            fields = file.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def worker_pids(registry: CameraRegistry) -> list[int]:
+    if isinstance(registry.engine, InferenceWorkerPool):
+        return [process.pid for process in registry.engine._processes]
+
+    return []
+
+
+def measure_cpu(registry: CameraRegistry, player: FRVidPlayer) -> dict:
+    ffmpeg_process = player._ffmpeg_process
+
+    return {
+        "process_s": cpu_seconds(),
+        "ffmpeg_s": cpu_seconds(ffmpeg_process.pid) if ffmpeg_process is not None else None,
+        "workers_s": sum(cpu_seconds(pid) or 0 for pid in worker_pids(registry)),
+    }
+
+
+def measure_memory(registry: CameraRegistry) -> dict:
+    pids = worker_pids(registry)
+
+    return {
+        "rss_mb": memory_mb(),
+        "peak_rss_mb": memory_mb(field="VmHWM") or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "worker_rss_mb": [memory_mb(pid) for pid in pids],
+        "worker_peak_rss_mb": [memory_mb(pid, "VmHWM") for pid in pids],
+    }
+
+
+def fill_gallery(registry: CameraRegistry, size: int, rng: np.random.Generator) -> float:
+    """Replaces the database with random identities and loads them into the gallery, returning the load time"""
+
+    embeddings = rng.standard_normal((size, 512)).astype(np.float32)
+
+    with get_db() as conn:
+        create_tables(conn)
+        with conn:
+            for table in ("Embeddings", "ImageEmbeddings", "Metadata"):
+                conn.execute(f"DELETE FROM {table}")
+        sync_records(
+            conn,
+            new_images=[],
+            removed_images=[],
+            people=[(f"Person {i}", embedding) for i, embedding in enumerate(embeddings)],
+            stale_names=[],
+        )
+
+    load_start = time.perf_counter()
+    registry.gallery.load(None, reset=True)
+
+    return time.perf_counter() - load_start
+
+
+def count_results(player: FRVidPlayer, counts: dict[str, int]) -> None:
+    """Subscribes to the results of a player like a /frResults client, counting updates and detections"""
+
+    for payload in player.start_detection_broadcast():
+        counts["updates"] += 1
+        counts["detections"] += len(json.loads(payload)["data"])
+
+
+def run(registry: CameraRegistry, video: str, size: int, args: argparse.Namespace, rng: np.random.Generator) -> dict:
+    gallery_load_time = fill_gallery(registry, size, rng)
+
+    stream_settings = {
+        "capture_profile": args.profile,
+        "det_size": args.det_size,
+        "use_tracker": args.tracker,
+    }
+
+    # Capture size, frame rate and pixel format come from the profile unless given
+    overrides = {
+        "capture_width": args.width,
+        "capture_height": args.height,
+        "capture_fps": args.fps,
+        "pix_fmt": args.pix_fmt,
+        "decode_threads": args.decode_threads,
+    }
+    stream_settings.update({key: value for key, value in overrides.items() if value is not None})
+
+    player = BenchPlayer(BENCH_CAM_ID, registry.engine, registry.gallery, registry.fr_settings, stream_settings)
+    player.realtime = args.realtime
+    registry.scheduler.register(BENCH_CAM_ID)
+
+    counts = {"updates": 0, "detections": 0}
+
+    try:
+        player.start_stream(video)
+        player.start_inference()
+
+        counterThread = threading.Thread(target=count_results, args=(player, counts))
+        counterThread.daemon = True
+        counterThread.start()
+
+        # Model warm-up and ffmpeg start-up are left out of the measurements
+        if player.end_event.wait(args.warmup):
+            raise RuntimeError("ffmpeg stopped during warm-up, check the video path and that ffmpeg is installed")
+
+        player.stage_timer.clear()
+        counts.update(updates=0, detections=0)
+        start_decoded = player.frame_buffer.seq
+        start_inferred = player.inference_stats["processed"]
+        start_cpu = measure_cpu(registry, player)
+        start_time = time.perf_counter()
+
+        player.end_event.wait(args.duration)
+
+        elapsed = time.perf_counter() - start_time
+        end_cpu = measure_cpu(registry, player)
+        decoded = player.frame_buffer.seq - start_decoded
+        inferred = player.inference_stats["processed"] - start_inferred
+        updates, detections = counts["updates"], counts["detections"]
+        latencies = player.stage_timer.latencies()
+        stages = {stage: latencies[stage] for stage in STAGES if stage in latencies}
+        memory = measure_memory(registry)
+        stream_ended = player.end_event.is_set()
+
+    finally:
+        player.end_stream()
+        player.streamThread.join(timeout=5)
+        if hasattr(player, "inferenceThread"):
+            player.inferenceThread.join(timeout=5)
+        registry.scheduler.unregister(BENCH_CAM_ID)
+
+    # ffmpeg is only measured if it ran for the whole run
+    cpu = {
+        key: end_cpu[key] - start_cpu[key] if end_cpu[key] is not None and start_cpu[key] is not None else None
+        for key in end_cpu
+    }
+    if cpu["ffmpeg_s"] is not None and cpu["ffmpeg_s"] < 0:
+        cpu["ffmpeg_s"] = None
+    cpu["cores"] = sum(value or 0 for value in cpu.values()) / elapsed
+
+    result = {
+        "gallery_size": size,
+        "capture": {key: player.stream_settings[key] for key in ("capture_profile", *overrides)},
+        "backend": registry.gallery.vector_index.name,
+        "gallery_load_s": gallery_load_time,
+        "duration_s": elapsed,
+        "stream_ended": stream_ended,
+        "frames_decoded": decoded,
+        "frames_inferred": inferred,
+        "decode_fps": decoded / elapsed,
+        "fps": inferred / elapsed,
+        "results_per_sec": updates / elapsed,
+        "detections_per_sec": detections / elapsed,
+        "stages": stages,
+        "cpu": cpu,
+        "memory": memory,
+    }
+
+    if player.face_tracker is not None:
+        result["tracker"] = {"embedded": player.face_tracker.embedded, "reused": player.face_tracker.reused}
+
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the FR pipeline on a recorded video")
+    parser.add_argument("--video", required=True, help="Path to a local video file")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10000], help="Gallery sizes (synthetic identities)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Duration of each measured run (seconds)")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Duration before each run that is not measured (seconds)")
+    parser.add_argument("--realtime", action="store_true", help="Decode the video at its native frame rate, like a live camera")
+    parser.add_argument("--profile", default="full", choices=list(CAPTURE_PROFILES), help="Capture profile")
+    parser.add_argument("--width", type=int, help="Capture width (defaults to the profile's)")
+    parser.add_argument("--height", type=int, help="Capture height (defaults to the profile's)")
+    parser.add_argument("--fps", type=float, help="Frame rate ffmpeg decimates to, 0 for every frame (defaults to the profile's)")
+    parser.add_argument("--pix-fmt", choices=["bgr24", "rgb24", "gray"], help="Pixel format ffmpeg decodes to (defaults to the profile's)")
+    parser.add_argument("--decode-threads", type=int, help="ffmpeg decoding threads, 0 to let ffmpeg decide (defaults to the profile's)")
+    parser.add_argument("--det-size", type=int, default=640, help="Detection input size")
+    parser.add_argument("--tracker", action="store_true", help="Skip re-embedding faces tracked across frames")
+    parser.add_argument("--search-backend", default="auto", choices=["auto", "exact", "voyager"], help="Gallery search backend")
+    parser.add_argument("--exact-max-size", type=int, default=1000, help="Largest gallery searched exactly with the auto backend")
+    parser.add_argument("--workers", type=int, default=0, help="Inference worker processes, 0 for the in-process engine")
+    parser.add_argument("--model-pack", default="buffalo_l", choices=list(MODEL_PACKS), help="Detection and recognition models")
+    parser.add_argument("--intra-op-threads", type=int, default=0, help="ONNX Runtime threads per operator, 0 for the default")
+    parser.add_argument("--graph-optimization", default="all", choices=["disable", "basic", "extended", "all"], help="ONNX Runtime graph optimisation level")
+    parser.add_argument("--pin-workers", action="store_true", help="Pin each inference worker process to its share of the cores")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic galleries")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    video = os.path.abspath(args.video)
+    if not os.path.isfile(video):
+        parser.error(f"{video} does not exist")
+
+    commit = git_commit()
+    rng = np.random.default_rng(args.seed)
+    results = []
+
+    # Embeddings.db, the index snapshot and settings.json are created in the temporary directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+
+        try:
+            registry = CameraRegistry(
+                max_cameras=1,
+                search_backend=args.search_backend,
+                exact_max_size=args.exact_max_size,
+                workers=args.workers,
+                runtime_settings={
+                    "model_pack": args.model_pack,
+                    "intra_op_threads": args.intra_op_threads,
+                    "graph_optimization": args.graph_optimization,
+                },
+                pin_workers=args.pin_workers,
+            )
+            if not registry.wait_until_ready():
+                parser.error(registry.load_error)
+
+            try:
+                for size in args.sizes:
+                    results.append(run(registry, video, size, args, rng))
+            finally:
+                registry.engine.stop()
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "commit": commit,
+        "video": os.path.basename(video),
+        "config": {key: value for key, value in vars(args).items() if key not in ("video", "json")},
+        "cpu_count": os.cpu_count(),
+        "runs": results,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"commit {commit}, video {report['video']}, capture profile {args.profile}")
+    for result in results:
+        print(
+            f"\ngallery {result['gallery_size']} ({result['backend']}): "
+            f"{result['fps']:.1f} fps inferred, {result['decode_fps']:.1f} fps decoded, "
+            f"{result['results_per_sec']:.1f} results/s, {result['detections_per_sec']:.1f} detections/s, "
+            f"{result['cpu']['cores']:.2f} cores busy, peak rss {result['memory']['peak_rss_mb']:.0f} MB"
+        )
+        print(f"{'stage':<13}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for stage, latency in result["stages"].items():
+            print(
+                f"{stage:<13}{latency['count']:>8}{latency['p50_ms']:>10.2f}"
+                f"{latency['p90_ms']:>10.2f}{latency['p99_ms']:>10.2f}{latency['max_ms']:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Load test of /frResults broadcasting with many subscribers
+
+- polling: previous broadcast (every subscriber re-serialises the results under a lock in a tight loop)
+- publisher: ResultPublisher (results serialised once per version, subscribers woken only on new results)
+
+Run from the simpliFRy directory: python -m bench.results_load
+"""
+
+import argparse
+import json
+import threading
+import time
+
+from fr.ResultPublisher import ResultPublisher
+
+
+def make_results(i: int, num_faces: int) -> list[dict]:
+    return [
+        {"bbox": [0.1, 0.2, 0.3, 0.4], "label": f"Person {(i + j) % 100}", "score": 0.3}
+        for j in range(num_faces)
+    ]
+
+
+def run_polling(num_subscribers: int, duration: float, rate: float, num_faces: int) -> int:
+    lock = threading.Lock()
+    state = {"results": make_results(0, num_faces)}
+    stop_event = threading.Event()
+    received = [0] * num_subscribers
+
+    def subscriber(idx: int) -> None:
+        while not stop_event.is_set():
+            with lock:
+                json.dumps({"data": state["results"]}) + '\n'
+            received[idx] += 1
+
+    threads = [threading.Thread(target=subscriber, args=(i,)) for i in range(num_subscribers)]
+    for thread in threads:
+        thread.start()
+
+    for i in range(int(duration * rate)):
+        time.sleep(1 / rate)
+        with lock:
+            state["results"] = make_results(i, num_faces)
+
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+
+    return sum(received)
+
+
+def run_publisher(num_subscribers: int, duration: float, rate: float, num_faces: int) -> int:
+    publisher = ResultPublisher()
+    received = [0] * num_subscribers
+
+    def subscriber(idx: int) -> None:
+        for _ in publisher.subscribe():
+            received[idx] += 1
+
+    threads = [threading.Thread(target=subscriber, args=(i,)) for i in range(num_subscribers)]
+    for thread in threads:
+        thread.start()
+
+    for i in range(int(duration * rate)):
+        time.sleep(1 / rate)
+        publisher.publish(make_results(i, num_faces))
+
+    publisher.close()
+    for thread in threads:
+        thread.join()
+
+    return sum(received)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of FR results broadcasting")
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1, 10, 50], help="Numbers of subscribers")
+    parser.add_argument("--duration", type=float, default=3.0, help="Duration of each run (seconds)")
+    parser.add_argument("--rate", type=float, default=10.0, help="Results published per second")
+    parser.add_argument("--faces", type=int, default=20, help="Detections per result")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for mode, func in (("polling", run_polling), ("publisher", run_publisher)):
+        for num_subscribers in args.subscribers:
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            received = func(num_subscribers, args.duration, args.rate, args.faces)
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+            results.append({
+                "mode": mode,
+                "subscribers": num_subscribers,
+                "cpu_percent": cpu * 100 / wall,
+                "payloads_per_subscriber": received / num_subscribers,
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<11}{'subscribers':>12}{'cpu %':>8}{'payloads/subscriber':>21}")
+    for result in results:
+        print(
+            f"{result['mode']:<11}{result['subscribers']:>12}{result['cpu_percent']:>8.1f}"
+            f"{result['payloads_per_subscriber']:>21.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark of gallery search backends against gallery size
+
+- exact: brute-force matrix multiplication with argpartition (ExactBackend)
+- voyager: HNSW index (VoyagerBackend)
+
+Recall is the fraction of the exact top-k neighbours found by each backend.
+Embeddings are clustered around random identities, so that queries resemble new pictures of enrolled people.
+
+Run from the simpliFRy directory: python -m bench.search_backend
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from fr.SearchBackend import BACKENDS
+
+
+def make_gallery(size: int, rng: np.random.Generator) -> np.ndarray:
+    return rng.standard_normal((size, 512)).astype(np.float32)
+
+
+def make_queries(gallery: np.ndarray, num_queries: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    ids = rng.integers(0, len(gallery), num_queries)
+    return gallery[ids] + noise * rng.standard_normal((num_queries, 512)).astype(np.float32)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark of gallery search backends")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 50000], help="Gallery sizes")
+    parser.add_argument("--faces", type=int, default=10, help="Query embeddings per call (faces in a frame)")
+    parser.add_argument("--calls", type=int, default=200, help="Query calls timed per run")
+    parser.add_argument("--k", type=int, default=2, help="Neighbours retrieved per query embedding")
+    parser.add_argument("--noise", type=float, default=1.0, help="Spread of query embeddings around their identity")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = []
+
+    for size in args.sizes:
+        gallery = make_gallery(size, rng)
+        queries = [make_queries(gallery, args.faces, args.noise, rng) for _ in range(args.calls)]
+
+        # Exact first, as its neighbours are the ground truth for recall
+        for name in ("exact", "voyager"):
+            backend_cls = BACKENDS[name]
+            build_start = time.perf_counter()
+            backend = backend_cls.build(gallery)
+            build_time = time.perf_counter() - build_start
+
+            ids_list = []
+            query_start = time.perf_counter()
+            for query in queries:
+                ids_list.append(backend.query(list(query), k=args.k)[0])
+            query_time = time.perf_counter() - query_start
+
+            ids = np.concatenate(ids_list)
+            if name == "exact":
+                exact_ids = ids
+
+            recall = np.mean([
+                len(set(found) & set(expected)) / len(expected) for found, expected in zip(ids, exact_ids)
+            ])
+
+            results.append({
+                "backend": name,
+                "size": size,
+                "build_s": build_time,
+                "query_ms": query_time * 1000 / args.calls,
+                "recall": recall,
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'backend':<9}{'size':>8}{'build s':>10}{'ms/call':>10}{'recall':>9}")
+    for result in results:
+        print(
+            f"{result['backend']:<9}{result['size']:>8}{result['build_s']:>10.2f}"
+            f"{result['query_ms']:>10.3f}{result['recall']:>9.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
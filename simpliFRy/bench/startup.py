@@ -0,0 +1,123 @@
+"""
+Measures how long simpliFRy takes to start: importing the web app, then loading and warming up the models in the background
+
+Importing is profiled in a fresh interpreter with python -X importtime, and the modules taking the longest (including the modules they import) are listed,
+so that a heavy import creeping back onto the startup path shows up.
+Loading is timed from creating the camera registry (which returns straight away) until its models are ready, split into the steps reported by /ready.
+
+Needs the insightface model pack. Run from the simpliFRy directory: python -m bench.startup
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.pipeline import git_commit
+from utils import MODEL_PACKS
+
+
+def profile_imports(module: str, top: int) -> tuple[float, list[dict]]:
+    """
+    Imports a module in a fresh interpreter with import-time profiling
+
+    Returns
+    - seconds taken to import the module
+    - the modules taking the longest to import (including the modules they import), longest first
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+    )
+
+    # Lines are "import time: self [us] | cumulative | imported package", the first being a header
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative) / 1e6
+
+    slowest = sorted(timings.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    return timings.get(module, 0.0), [{"module": name, "seconds": seconds} for name, seconds in slowest]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark of startup time")
+    parser.add_argument("--module", default="app", help="Module whose import is profiled")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports listed")
+    parser.add_argument("--model-pack", default="buffalo_l", choices=list(MODEL_PACKS), help="Detection and recognition models")
+    parser.add_argument("--workers", type=int, default=0, help="Inference worker processes, 0 for the in-process engine")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    import_seconds, slowest = profile_imports(args.module, args.top)
+
+    from fr.CameraRegistry import CameraRegistry
+
+    # settings.json is created in the temporary directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+
+        try:
+            start_time = time.perf_counter()
+            registry = CameraRegistry(max_cameras=1, workers=args.workers, runtime_settings={"model_pack": args.model_pack})
+            construct_seconds = time.perf_counter() - start_time
+
+            ready = registry.wait_until_ready()
+            ready_seconds = time.perf_counter() - start_time
+
+            # Workers load their own models after the registry is ready
+            while ready and args.workers and registry.engine.ready_workers < registry.engine.num_workers:
+                if registry.engine.stop_event.is_set():
+                    break
+                time.sleep(0.05)
+            workers_seconds = time.perf_counter() - start_time if args.workers else None
+
+            readiness = registry.readiness()
+            if registry.engine is not None:
+                registry.engine.stop()
+            registry.detection_recorder.stop()
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key != "json"},
+        "import_s": import_seconds,
+        "slowest_imports": slowest,
+        "registry_s": construct_seconds,
+        "ready_s": ready_seconds,
+        "workers_ready_s": workers_seconds,
+        "readiness": readiness,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"commit {report['commit']}, model pack {args.model_pack}")
+    print(f"import {args.module}: {import_seconds:.2f}s")
+    print(f"registry created: {construct_seconds:.2f}s")
+    if not readiness["ready"]:
+        print(f"models failed to load after {ready_seconds:.2f}s: {readiness['error']}")
+        return
+
+    steps = ", ".join(f"{step} {seconds:.2f}s" for step, seconds in readiness["startup"].items())
+    print(f"models ready: {ready_seconds:.2f}s ({steps})")
+    if workers_seconds is not None:
+        print(f"workers ready: {workers_seconds:.2f}s")
+
+    print(f"\n{'slowest imports':<50}{'seconds':>10}")
+    for entry in slowest:
+        print(f"{entry['module']:<50}{entry['seconds']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
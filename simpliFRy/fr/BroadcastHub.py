@@ -0,0 +1,158 @@
+import threading
+import time
+from typing import Callable, Generator
+
+import cv2
+import numpy as np
+
+from fr.FrameBuffer import FrameBuffer
+from utils import frame_to_bgr
+
+
+class BroadcastHub:
+    """
+    Shared MJPEG encoder for the /vidFeed viewers of a camera.
+    Each new frame is encoded once, in a thread that only runs while there are viewers, and the same JPEG is handed to every viewer.
+    Viewers always receive the latest frame; frames that arrive while a viewer is still sending are dropped for that viewer rather than queued.
+    """
+
+    def __init__(
+        self,
+        frame_buffer: FrameBuffer,
+        width: int = 0,
+        quality: int = 90,
+        max_fps: float = 15,
+        pix_fmt: str = "bgr24",
+    ) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - frame_buffer: raw frames of the camera
+        - width: width (pixels) of the broadcast frames, 0 to keep the camera's width
+        - quality: JPEG quality (0 to 100)
+        - max_fps: maximum number of frames sent per second to each viewer, 0 for no limit
+        - pix_fmt: pixel format of the raw frames
+        """
+
+        self.frame_buffer = frame_buffer
+        self.pix_fmt = pix_fmt
+        self.width = width
+        self.quality = quality
+        self.max_fps = max_fps
+
+        self._cond = threading.Condition()
+        self._encoder_running = False
+
+        self.part = b""
+        self.version = 0
+        self.closed = False
+
+        self.viewers = 0
+        self.encoded = 0
+        self.dropped = 0
+
+    def _encode(self, frame: np.ndarray) -> bytes:
+        """
+        Resizes and encodes a frame as one part of the multipart MJPEG response
+
+        Arguments
+        - frame: raw frame
+
+        Returns
+        - multipart chunk holding the JPEG encoded frame
+        """
+
+        height, width = frame.shape[:2]
+        if self.width and self.width != width:
+            frame = cv2.resize(
+                frame, (self.width, round(height * self.width / width)), interpolation=cv2.INTER_AREA
+            )
+
+        # Converted after resizing, so that only the broadcast resolution is converted
+        frame = frame_to_bgr(frame, self.pix_fmt)
+        _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+
+        return (
+            b"--frame\r\n"
+            b"Content-Type: image/jpeg\r\n\r\n" + buffer.tobytes() + b"\r\n"
+        )
+
+    def _loopEncode(self) -> None:
+        """Encodes each new frame once, until there are no viewers left"""
+
+        last_seq = 0
+
+        while True:
+            with self._cond:
+                if self.closed or self.viewers == 0:
+                    self._encoder_running = False
+                    return
+
+            if not self.frame_buffer.wait_for_frame(last_seq, timeout=0.5):
+                continue
+
+            with self.frame_buffer.read_latest() as (seq, frame):
+                last_seq = seq
+                part = self._encode(frame)
+
+            with self._cond:
+                self.part = part
+                self.version += 1
+                self.encoded += 1
+                self._cond.notify_all()
+
+    def close(self) -> None:
+        """Ends the broadcast for all viewers"""
+
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def subscribe(self, is_alive: Callable[[], bool]) -> Generator[bytes, None, None]:
+        """
+        Subscribes a viewer to the broadcast
+
+        Arguments
+        - is_alive: check for whether the video stream is still running
+
+        Returns
+        - Generator yielding multipart chunks of JPEG encoded frames
+        """
+
+        with self._cond:
+            self.viewers += 1
+            if not self._encoder_running:
+                self._encoder_running = True
+                encoderThread = threading.Thread(target=self._loopEncode)
+                encoderThread.daemon = True
+                encoderThread.start()
+
+        min_interval = 1 / self.max_fps if self.max_fps > 0 else 0
+        last_version = 0
+        last_sent = 0.0
+
+        try:
+            while is_alive():
+                with self._cond:
+                    self._cond.wait_for(lambda: self.version != last_version or self.closed, 0.5)
+
+                    if self.closed:
+                        return
+                    if self.version == last_version:
+                        continue
+
+                    if last_version:
+                        self.dropped += self.version - last_version - 1
+                    last_version, part = self.version, self.part
+
+                yield part
+
+                wait_time = last_sent + min_interval - time.monotonic()
+                if wait_time > 0:
+                    time.sleep(wait_time)
+                last_sent = time.monotonic()
+
+        finally:
+            with self._cond:
+                self.viewers -= 1
@@ -0,0 +1,509 @@
+import json
+import os
+import threading
+import time
+from typing import TypedDict
+
+
+from fr.DetectionRecorder import DetectionRecorder
+from fr.Enroller import EnrolmentSummary
+from fr.FRVidPlayer import FRSettings, FRVidPlayer, StreamSettings, resolve_stream_settings
+from fr.Gallery import Gallery
+from fr.InferenceEngine import InferenceEngine
+from fr.InferenceScheduler import InferenceScheduler
+from fr.InferenceWorkerPool import InferenceWorkerPool
+from utils import (
+    DEFAULT_RUNTIME_SETTINGS,
+    format_metric,
+    histogram_samples,
+    load_model,
+    log_info,
+    model_identity,
+    resolve_providers,
+    warm_up,
+)
+from utils.onnx_runtime import RuntimeSettings
+
+
+FR_SETTINGS_FP = 'settings.json'
+
+DEFAULT_CAM_ID = "default"
+
+
+class Readiness(TypedDict):
+    """Progress of loading the models in the background"""
+
+    ready: bool
+    status: str
+    error: str | None
+    startup: dict[str, float]
+    workers: dict[str, int] | None
+
+
+class CameraRegistry:
+    """
+    Class for running FR on multiple camera streams in one process, with one model and one gallery shared across all cameras.
+    The models are loaded and warmed up in a background thread, so that the web server can serve requests that do not need them straight away.
+    """
+
+    def __init__(
+        self,
+        max_cameras: int = 8,
+        batch_frames: int = 8,
+        search_backend: str = "auto",
+        exact_max_size: int = 1000,
+        workers: int = 0,
+        detection_interval: float = 5.0,
+        runtime_settings: RuntimeSettings | None = None,
+        pin_workers: bool = False,
+    ) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - max_cameras: maximum number of cameras streaming at the same time
+        - batch_frames: maximum number of frames (one per camera) whose faces are embedded together
+        - search_backend: gallery search backend ("exact", "voyager" or "auto")
+        - exact_max_size: largest gallery searched exactly when search_backend is "auto"
+        - workers: number of inference worker processes, 0 to run inference in a thread of this process
+        - detection_interval: minimum number of seconds between recorded detections of the same person by the same camera
+        - runtime_settings: model pack and ONNX Runtime settings of the sessions running its models (execution providers, threads, graph optimisation and memory arena)
+        - pin_workers: pin each inference worker process to its own share of the cores
+        """
+
+        self.runtime_settings: RuntimeSettings = {**DEFAULT_RUNTIME_SETTINGS, **(runtime_settings or {})}
+
+        # For FR algorithm, set once the models are loaded
+        self.model = None
+        self.gallery: Gallery | None = None
+        self.engine: InferenceEngine | InferenceWorkerPool | None = None
+        self.scheduler = InferenceScheduler()
+
+        self.status = "loading"
+        self.load_error: str | None = None
+        self.startup_times: dict[str, float] = {}
+        self.loaded_event = threading.Event()
+
+        self.loadThread = threading.Thread(
+            target=self._loadModels,
+            args=(search_backend, exact_max_size, workers, batch_frames, max_cameras, pin_workers),
+        )
+        self.loadThread.daemon = True
+        self.loadThread.start()
+
+        self.detection_recorder = DetectionRecorder(interval=detection_interval)
+        self.detection_recorder.start()
+
+        self.max_cameras = max_cameras
+        self.cameras: dict[str, FRVidPlayer] = {}
+        self.registry_lock = threading.Lock()
+
+        # For settings
+        if not os.path.exists(FR_SETTINGS_FP):
+            fr_settings = {}
+            with open(FR_SETTINGS_FP, 'w') as file:
+                json.dump(fr_settings, file)
+        else:
+            with open(FR_SETTINGS_FP, 'r') as file:
+                fr_settings = json.load(file)
+
+        self.fr_settings: FRSettings = {
+            "threshold": fr_settings.get("threshold", 0.45),
+            "holding_time": fr_settings.get("holding_time", 15),
+            "use_differentiator": fr_settings.get("use_differentiator", True),
+            "threshold_lenient_diff": fr_settings.get("threshold_lenient_diff", 0.55),
+            "similarity_gap": fr_settings.get("similarity_gap", 0.10),
+            "use_persistor": fr_settings.get("use_persistor", True),
+            "threshold_prev": fr_settings.get("threshold_prev", 0.3),
+            "threshold_iou": fr_settings.get("threshold_iou", 0.2),
+            "threshold_lenient_pers": fr_settings.get("threshold_lenient_pers", 0.60),
+        }
+
+        with open(FR_SETTINGS_FP, 'w') as file:
+            json.dump(self.fr_settings, file)
+
+    def _loadModels(
+        self,
+        search_backend: str,
+        exact_max_size: int,
+        workers: int,
+        batch_frames: int,
+        max_cameras: int,
+        pin_workers: bool,
+    ) -> None:
+        """
+        Loads and warms up the models, then creates the gallery and inference engine using them
+
+        Arguments
+        - search_backend: gallery search backend ("exact", "voyager" or "auto")
+        - exact_max_size: largest gallery searched exactly when search_backend is "auto"
+        - workers: number of inference worker processes, 0 to run inference in a thread of this process
+        - batch_frames: maximum number of frames (one per camera) whose faces are embedded together
+        - max_cameras: maximum number of cameras streaming at the same time
+        - pin_workers: pin each inference worker process to its own share of the cores
+        """
+
+        start_time = time.perf_counter()
+
+        try:
+            # Execution providers are resolved once, so that every worker uses the same ones
+            self.runtime_settings["providers"] = resolve_providers(self.runtime_settings["providers"])
+            log_info(f"ONNX Runtime execution providers: {', '.join(self.runtime_settings['providers'])}")
+
+            model = load_model(self.runtime_settings)
+            self.startup_times["load"] = time.perf_counter() - start_time
+            log_info(f"Recognition model: {model_identity(model)}")
+
+            warm_start = time.perf_counter()
+            warm_up(model)
+            self.startup_times["warm_up"] = time.perf_counter() - warm_start
+
+            gallery = Gallery(model, backend=search_backend, exact_max_size=exact_max_size)
+            engine: InferenceEngine | InferenceWorkerPool = (
+                InferenceWorkerPool(
+                    self.scheduler,
+                    workers,
+                    self.runtime_settings,
+                    num_slots=max_cameras,
+                    max_frame_shape=(1080, 1920, 3),
+                    pin_workers=pin_workers,
+                )
+                if workers > 0
+                else InferenceEngine(model, self.scheduler, max_batch_frames=batch_frames)
+            )
+            engine.start()
+        except Exception as err:
+            self.load_error = f"Unable to load models: {err}"
+            self.status = "failed"
+            log_info(self.load_error)
+            self.loaded_event.set()
+            return
+
+        self.model, self.gallery, self.engine = model, gallery, engine
+        self.startup_times["total"] = time.perf_counter() - start_time
+        self.status = "ready"
+        self.loaded_event.set()
+
+        log_info(
+            f"FR Model initialised in {self.startup_times['total']:.1f}s "
+            f"(loading {self.startup_times['load']:.1f}s, warm-up {self.startup_times['warm_up']:.2f}s)"
+        )
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether the models are loaded, so that cameras can be started and the gallery changed"""
+
+        return self.status == "ready"
+
+    def wait_until_ready(self, timeout: float | None = None) -> bool:
+        """
+        Blocks until the models are loaded or failed to load
+
+        Arguments
+        - timeout: maximum number of seconds to wait, None to wait for as long as loading takes
+
+        Returns
+        - whether the models are loaded
+        """
+
+        self.loaded_event.wait(timeout)
+        return self.is_ready
+
+    def readiness(self) -> Readiness:
+        """
+        Reports the progress of loading the models
+
+        Returns
+        - whether the models are ready, the loading status (loading, ready or failed), why loading failed,
+          the seconds taken by each step of loading and, with worker processes, how many of them are ready, have been restarted or were given up on
+        """
+
+        workers = None
+        if isinstance(self.engine, InferenceWorkerPool):
+            workers = {
+                "ready": self.engine.ready_workers,
+                "total": self.engine.num_workers,
+                "restarts": self.engine.restarts,
+                "lost": self.engine.lost_workers,
+            }
+
+        return {
+            "ready": self.is_ready,
+            "status": self.status,
+            "error": self.load_error,
+            "startup": self.startup_times,
+            "workers": workers,
+        }
+
+    def get(self, cam_id: str) -> FRVidPlayer | None:
+        """
+        Fetches the player of a camera
+
+        Arguments
+        - cam_id: camera identifier
+
+        Returns
+        - the camera's player, None if the camera has not been started
+        """
+
+        return self.cameras.get(cam_id)
+
+    def is_started(self, cam_id: str) -> bool:
+        """
+        Check if a camera is streaming
+
+        Arguments
+        - cam_id: camera identifier
+        """
+
+        camera = self.cameras.get(cam_id)
+        return camera is not None and camera.is_started
+
+    def running_cameras(self) -> list[str]:
+        """
+        Returns
+        - identifiers of cameras that are streaming
+        """
+
+        return [cam_id for cam_id, camera in list(self.cameras.items()) if camera.is_started]
+
+    def start_camera(
+        self,
+        cam_id: str,
+        stream_src: str,
+        data_file: str | None,
+        weight: int = 1,
+        stream_settings: StreamSettings | None = None,
+    ) -> EnrolmentSummary | None:
+        """
+        Starts streaming and FR inference on a camera
+
+        Arguments
+        - cam_id: camera identifier
+        - stream_src: url to RTSP video stream or source to VCC
+        - data_file: file path (relative to './data' folder) to json file linking names to pictures
+        - weight: relative share of inferences given to the camera when cameras compete for a batch
+        - stream_settings: parameters deciding how the camera is captured and which of its frames are inferred (may be partial; the rest come from its capture profile)
+
+        Returns
+        - summary of the enrolment if embeddings were formed from a data file, else None
+        """
+
+        if not self.is_ready:
+            raise ValueError(self.load_error or "Models are still loading, try again shortly!")
+
+        with self.registry_lock:
+            if self.is_started(cam_id):
+                raise ValueError("Stream already started!")
+
+            running = self.running_cameras()
+            if len(running) >= self.max_cameras:
+                raise ValueError(f"Maximum number of cameras ({self.max_cameras}) reached!")
+
+            settings = resolve_stream_settings(stream_settings)
+            # Frames reach the inference engine as RGB, whatever the pixel format they are captured in
+            frame_bytes = settings["capture_width"] * settings["capture_height"] * 3
+            if isinstance(self.engine, InferenceWorkerPool) and frame_bytes > self.engine.slot_bytes:
+                raise ValueError("Capture resolution is too large for the inference worker pool!")
+
+            # Embeddings are reloaded from the database when no other camera is using them
+            reload_gallery = not running
+
+            camera = FRVidPlayer(
+                cam_id, self.engine, self.gallery, self.fr_settings, stream_settings, self.detection_recorder
+            )
+            self.cameras[cam_id] = camera
+            self.scheduler.register(cam_id, weight)
+
+        camera.start_stream(stream_src)
+
+        try:
+            summary = self.gallery.load(data_file, reset=reload_gallery)
+        except Exception:
+            # The camera is removed, so that it can be started again
+            with self.registry_lock:
+                if self.cameras.get(cam_id) is camera:
+                    self.cameras.pop(cam_id)
+                    self.scheduler.unregister(cam_id)
+
+            camera.end_event.set()
+            camera.result_publisher.close()
+            raise
+
+        camera.start_inference()
+
+        return summary
+
+    def end_camera(self, cam_id: str) -> None:
+        """
+        Ends streaming and FR inference on a camera
+
+        Arguments
+        - cam_id: camera identifier
+        """
+
+        with self.registry_lock:
+            camera = self.cameras.pop(cam_id, None)
+            self.scheduler.unregister(cam_id)
+
+        if camera is not None:
+            camera.end_stream()
+
+    def metrics(self) -> str:
+        """
+        Reports the state of every camera and of the shared inference engine for Prometheus
+
+        Returns
+        - metrics in the Prometheus text exposition format
+        """
+
+        cameras = list(self.cameras.items())
+
+        stage_samples, frame_samples, dropped_samples, skipped_samples = [], [], [], []
+        face_samples, embedded_samples, result_samples, lag_samples = [], [], [], []
+        error_samples = []
+        connected_samples, reconnect_samples, frame_age_samples = [], [], []
+
+        for cam_id, camera in cameras:
+            labels = {"camera": cam_id}
+            stats = camera.inference_stats
+
+            for stage, histogram in camera.stage_timer.histograms().items():
+                stage_samples += histogram_samples(
+                    {**labels, "stage": stage}, histogram["buckets"], histogram["count"], histogram["total_s"]
+                )
+
+            frame_samples.append(("", {**labels, "outcome": "decoded"}, camera.frame_buffer.seq))
+            frame_samples.append(("", {**labels, "outcome": "inferred"}, stats["processed"]))
+            dropped_samples.append(("", {**labels, "reason": "superseded"}, stats["dropped"]))
+            dropped_samples.append(("", {**labels, "reason": "buffer_full"}, camera.frame_buffer.dropped))
+            dropped_samples.append(("", {**labels, "reason": "stale"}, camera.stale_dropped))
+            skipped_samples.append(("", {**labels, "reason": "motion"}, stats["skipped"]))
+            error_samples.append(("", labels, stats["errors"]))
+            face_samples.append(("", labels, stats["faces"]))
+            embedded_samples.append(("", labels, stats["embedded"]))
+            result_samples.append(("", labels, camera.result_publisher.version))
+            lag_samples.append(("", labels, camera.stream_lag))
+            connected_samples.append(("", labels, int(camera.connected)))
+            reconnect_samples.append(("", labels, camera.reconnects))
+            if camera.last_frame_time is not None:
+                frame_age_samples.append(("", labels, time.monotonic() - camera.last_frame_time))
+
+        return "".join([
+            format_metric(
+                "simplifry_stage_duration_seconds", "histogram",
+                "Time taken by each stage of the FR pipeline", stage_samples,
+            ),
+            format_metric(
+                "simplifry_frames_total", "counter",
+                "Frames read from ffmpeg and frames inferred", frame_samples,
+            ),
+            format_metric(
+                "simplifry_frames_dropped_total", "counter",
+                "Frames never inferred, as a newer frame arrived first, every frame slot was in use or a newer frame was already waiting in the pipe",
+                dropped_samples,
+            ),
+            format_metric(
+                "simplifry_frames_skipped_total", "counter",
+                "Frames read by inference but not inferred", skipped_samples,
+            ),
+            format_metric(
+                "simplifry_inference_errors_total", "counter",
+                "Frames whose inference failed (the camera carries on with the next frame)", error_samples,
+            ),
+            format_metric(
+                "simplifry_faces_total", "counter",
+                "Faces detected in inferred frames", face_samples,
+            ),
+            format_metric(
+                "simplifry_faces_embedded_total", "counter",
+                "Faces embedded and searched for in the gallery (the rest reuse their track's identity)", embedded_samples,
+            ),
+            format_metric(
+                "simplifry_results_published_total", "counter",
+                "Changed FR results published to /frResults subscribers", result_samples,
+            ),
+            format_metric(
+                "simplifry_stream_lag_seconds", "gauge",
+                "Time between the latest inferred frame being read from ffmpeg and its results being published", lag_samples,
+            ),
+            format_metric(
+                "simplifry_stream_connected", "gauge",
+                "Whether ffmpeg is delivering frames (0 while reconnecting)", connected_samples,
+            ),
+            format_metric(
+                "simplifry_stream_reconnects_total", "counter",
+                "Times ffmpeg was restarted after the stream dropped or stalled", reconnect_samples,
+            ),
+            format_metric(
+                "simplifry_frame_age_seconds", "gauge",
+                "Time since the latest frame was read from ffmpeg", frame_age_samples,
+            ),
+            format_metric(
+                "simplifry_inference_queue_depth", "gauge",
+                "Frames waiting for the inference engine",
+                [("", {}, self.engine.queue_depth() if self.engine is not None else 0)],
+            ),
+            format_metric(
+                "simplifry_inference_worker_restarts_total", "counter",
+                "Inference worker processes restarted after exiting unexpectedly",
+                [("", {}, self.engine.restarts if isinstance(self.engine, InferenceWorkerPool) else 0)],
+            ),
+            format_metric(
+                "simplifry_inference_workers_lost", "gauge",
+                "Inference worker processes given up on, as they failed to start or exited too many times",
+                [("", {}, self.engine.lost_workers if isinstance(self.engine, InferenceWorkerPool) else 0)],
+            ),
+            format_metric(
+                "simplifry_cameras_running", "gauge",
+                "Cameras streaming", [("", {}, sum(camera.is_started for _, camera in cameras))],
+            ),
+            format_metric(
+                "simplifry_gallery_size", "gauge",
+                "People in the gallery", [("", {}, len(self.gallery) if self.gallery is not None else 0)],
+            ),
+            format_metric(
+                "simplifry_detections_recorded_total", "counter",
+                "Detections written to the detections database", [("", {}, self.detection_recorder.recorded)],
+            ),
+            format_metric(
+                "simplifry_detections_dropped_total", "counter",
+                "Detections not recorded, as the queue of detections to write was full or the database could not be written",
+                [("", {}, self.detection_recorder.dropped)],
+            ),
+            format_metric(
+                "simplifry_ready", "gauge",
+                "Whether the models are loaded and warmed up", [("", {}, int(self.is_ready))],
+            ),
+        ])
+
+    def adjust_values(self, new_settings: FRSettings) -> FRSettings:
+        """
+        Adjusts adjustable FR parameters based on form submission from settings page and update to FR settings json file
+
+        Arguments
+        - new_settings: new setting parameters submitted by user (typed dictionary)
+
+        Returns
+        - new setting parameters
+        """
+
+        # Updated in place as every camera holds a reference to the same settings
+        self.fr_settings.update(new_settings)
+
+        with open(FR_SETTINGS_FP, 'w') as file:
+            json.dump(self.fr_settings, file)
+
+        return self.fr_settings
+
+    def cleanup(self, sig, f) -> None:
+        """Sets events to trigger termination of all ffmpeg subprocesses"""
+
+        log_info("CLEANING UP...")
+        for camera in list(self.cameras.values()):
+            camera.end_event.set()
+        if self.engine is not None:
+            self.engine.stop()
+        self.detection_recorder.stop()
+        time.sleep(0.5)
+        exit(0)
@@ -0,0 +1,141 @@
+import queue
+import sqlite3
+import threading
+import time
+
+from sql_db import create_detections_table, get_detections_db, save_detections
+from sql_db.DetectionsManager import DetectionRecord
+from utils import log_info
+
+
+class DetectionRecorder:
+    """
+    Records recognitions from every camera in the detections database, for attendance history.
+    Cameras only put detections on a queue; a background thread writes whatever has accumulated in one transaction at a fixed interval, so inference never waits on the database.
+    The queue is bounded, so detections are dropped (and counted) rather than piling up in memory when the database cannot keep up, and recording stops if the database cannot be opened.
+    A person seen continuously by a camera is recorded at most once per interval, which keeps first and last seen times accurate to within the interval.
+    """
+
+    def __init__(
+        self, interval: float = 5.0, flush_interval: float = 1.0, max_batch: int = 1000, max_queued: int = 100000
+    ) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - interval: minimum number of seconds between recorded detections of the same person by the same camera, 0 to record every recognition
+        - flush_interval: number of seconds between writes to the database
+        - max_batch: maximum number of detections written per transaction
+        - max_queued: maximum number of detections waiting to be written, beyond which new detections are dropped
+        """
+
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self._queue: queue.Queue[DetectionRecord] = queue.Queue(maxsize=max_queued)
+        self._last_recorded: dict[tuple[str, str], float] = {}
+
+        self.recorded = 0
+        self.dropped = 0
+        self.error: str | None = None
+        self.stop_event = threading.Event()
+
+    def start(self) -> None:
+        """Starts writing detections in a separate thread"""
+
+        self.stop_event = threading.Event()
+        self.writerThread = threading.Thread(target=self._loopWrite)
+        self.writerThread.daemon = True
+        self.writerThread.start()
+
+    def stop(self) -> None:
+        """Writes the detections still queued and stops the writer"""
+
+        self.stop_event.set()
+        self.writerThread.join(timeout=5)
+
+    def record(self, cam_id: str, name: str, score: float, bbox: list[float]) -> None:
+        """
+        Queues a recognition to be recorded, unless the person was recorded by the camera within the interval
+
+        Arguments
+        - cam_id: identifier of the camera the person was recognised on
+        - name: name of the person
+        - score: distance (cosine) of the face to the person's face in the database
+        - bbox: bounding box of the face in xyxy format (fraction of the frame)
+        """
+
+        # The writer could not open the database, so nothing queued would ever be written
+        if self.error is not None:
+            return
+
+        curr_time = time.time()
+
+        key = (cam_id, name)
+        if curr_time - self._last_recorded.get(key, float("-inf")) < self.interval:
+            return
+
+        self._last_recorded[key] = curr_time
+
+        try:
+            self._queue.put_nowait({"time": curr_time, "camera": cam_id, "name": name, "score": score, "bbox": bbox})
+        except queue.Full:
+            self.dropped += 1
+
+    def _take_batch(self) -> list[DetectionRecord]:
+        """
+        Takes up to max_batch of the queued detections
+
+        Returns
+        - detections to be written in the next transaction
+        """
+
+        batch = []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _loopWrite(self) -> None:
+        """Repeatedly writes the queued detections to the database in batches"""
+
+        try:
+            with get_detections_db() as conn:
+                create_detections_table(conn)
+                self._write(conn)
+        except (sqlite3.Error, OSError) as err:
+            self.error = str(err)
+            log_info(f"Unable to open the detections database, detections will not be recorded: {err}")
+
+            # Detections queued before recording stopped are discarded
+            batch = self._take_batch()
+            while batch:
+                self.dropped += len(batch)
+                batch = self._take_batch()
+
+    def _write(self, conn: sqlite3.Connection) -> None:
+        """
+        Writes the queued detections to the database in batches at every flush interval, until the recorder is stopped
+
+        Arguments
+        - conn: connection to the detections database
+        """
+
+        stopping = False
+        while not stopping:
+            stopping = self.stop_event.wait(self.flush_interval)
+
+            batch = self._take_batch()
+            while batch:
+                try:
+                    save_detections(conn, batch)
+                    self.recorded += len(batch)
+                except sqlite3.Error as err:
+                    self.dropped += len(batch)
+                    log_info(f"Unable to record {len(batch)} detections: {err}")
+
+                batch = self._take_batch() if len(batch) == self.max_batch else []
@@ -0,0 +1,327 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, TypedDict
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+from sql_db.DBManager import ImageRecord
+from utils import log_info, model_identity
+
+if TYPE_CHECKING:
+    from insightface.app import FaceAnalysis
+
+
+class ImageFailure(TypedDict):
+    """Enrolment image that could not be used"""
+
+    name: str
+    image: str
+    reason: str
+
+
+class EnrolmentSummary(TypedDict):
+    """Outcome of an enrolment run"""
+
+    people: int
+    enrolled: int
+    removed: int
+    images: int
+    embedded: int
+    cached: int
+    failures: list[ImageFailure]
+    duration: float
+
+
+class EnrolmentChanges(TypedDict):
+    """Changes to the database resulting from an enrolment run"""
+
+    new_images: list[ImageRecord]
+    removed_images: list[tuple[str, str]]
+    people: list[tuple[str, np.ndarray]]
+    stale_names: list[str]
+
+
+class EnrolmentProgress(TypedDict):
+    """Number of enrolment images processed so far"""
+
+    done: int
+    total: int
+
+
+def hash_file(img_fp: str, model_id: str = "") -> str | None:
+    """
+    Computes the content hash of a file
+
+    Arguments
+    - img_fp: path to file
+    - model_id: identity of the recognition model, hashed with the contents so that embeddings cached for another model are not reused
+
+    Returns
+    - hex digest of the model identity and the file's contents, None if the file cannot be read
+    """
+
+    hasher = hashlib.blake2b(model_id.encode(), digest_size=16)
+
+    try:
+        with open(img_fp, "rb") as file:
+            hasher.update(file.read())
+    except OSError:
+        return None
+
+    return hasher.hexdigest()
+
+
+def read_image(img_fp: str) -> np.ndarray:
+    """
+    Reads an image file as an RGB array
+
+    Arguments
+    - img_fp: path to image file
+
+    Returns
+    - RGB image
+    """
+
+    # OpenCV decodes without holding the GIL; EXIF orientation is ignored to match PIL
+    img = cv2.imread(img_fp, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img is not None:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+    from PIL import Image
+
+    return np.array(Image.open(img_fp).convert("RGB"))
+
+
+class Enroller:
+    """
+    Class for turning enrolment images into embeddings in bulk.
+    Images are decoded, detected and aligned in a pool of threads, and the aligned faces are embedded in batches.
+    """
+
+    def __init__(self, model: "FaceAnalysis", num_workers: int | None = None, batch_size: int = 32) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - model: prepared insightface model (only its detection and recognition models are used)
+        - num_workers: number of threads decoding and detecting faces in images (defaults to number of CPUs, up to 8)
+        - batch_size: number of aligned faces per recognition call
+        """
+
+        self.det_model = model.det_model
+        self.rec_model = model.models["recognition"]
+        self.model_id = model_identity(model)
+
+        self.num_workers = num_workers or min(8, os.cpu_count() or 1)
+        self.batch_size = max(1, batch_size)
+
+        self.progress: EnrolmentProgress = {"done": 0, "total": 0}
+        self.summary: EnrolmentSummary | None = None
+
+    def _align_face(self, img_fp: str) -> tuple[np.ndarray | None, str | None]:
+        """
+        Reads an image and aligns its most confidently detected face for recognition
+
+        Arguments
+        - img_fp: path to image file
+
+        Returns
+        - aligned face crop, None if the image cannot be used
+        - reason the image cannot be used, None if it can
+        """
+
+        from insightface.utils import face_align
+
+        try:
+            img = read_image(img_fp)
+        except Exception as err:
+            return None, f"Error processing image: {err}"
+
+        try:
+            bboxes, kpss = self.det_model.detect(img, max_num=0, metric='default')
+        except Exception as err:
+            return None, f"Error detecting faces: {err}"
+
+        if not bboxes.shape[0]:
+            return None, "No detectable faces"
+
+        crop = face_align.norm_crop(img, landmark=kpss[0], image_size=self.rec_model.input_size[0])
+        return crop, None
+
+    def embed_images(
+        self,
+        img_fps: list[str],
+        on_progress: Callable[[int], None] | None = None,
+    ) -> list[tuple[np.ndarray | None, str | None]]:
+        """
+        Embeds the most confidently detected face of each image
+
+        Arguments
+        - img_fps: paths to image files
+        - on_progress: called with the number of images processed each time an image is processed
+
+        Returns
+        - for each image (in the same order), its embedding (None if unusable) and the reason it is unusable (None if usable)
+        """
+
+        outcomes: list[tuple[np.ndarray | None, str | None]] = [(None, None)] * len(img_fps)
+        crops, crop_idxs = [], []
+
+        def flush() -> None:
+            if not crops:
+                return
+            embeddings = self.rec_model.get_feat(crops)
+            for idx, embedding in zip(crop_idxs, embeddings):
+                outcomes[idx] = (embedding, None)
+            crops.clear()
+            crop_idxs.clear()
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            for idx, (crop, reason) in enumerate(executor.map(self._align_face, img_fps)):
+                if crop is None:
+                    outcomes[idx] = (None, reason)
+                else:
+                    crops.append(crop)
+                    crop_idxs.append(idx)
+
+                if len(crops) >= self.batch_size:
+                    flush()
+
+                if on_progress is not None:
+                    on_progress(idx + 1)
+
+        flush()
+
+        return outcomes
+
+    def enrol(
+        self,
+        img_folder_path: str,
+        details: list[dict],
+        cached_images: list[ImageRecord],
+        enrolled_names: list[str],
+    ) -> tuple[EnrolmentChanges, EnrolmentSummary]:
+        """
+        Forms the average embedding of each person from their pictures, only embedding images that are new or whose content changed
+
+        Arguments
+        - img_folder_path: path to image folder
+        - details: entries of the data file, each with the name of a person and their images
+        - cached_images: source images enrolled previously, with their content hash and embedding
+        - enrolled_names: names of people with an average embedding in the database
+
+        Returns
+        - changes to be applied to the database, including the average embedding of each person whose images changed
+        - summary of the enrolment, including the reason each unusable image was rejected
+        """
+
+        start_time = time.perf_counter()
+
+        # People are identified by name, so entries sharing a name are merged
+        images_by_name: dict[str, list[str]] = {}
+        for entry in details:
+            images = images_by_name.setdefault(entry["name"], [])
+            images += [img_name for img_name in entry["images"] if img_name not in images]
+
+        keys = [(name, img_name) for name, images in images_by_name.items() for img_name in images]
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            hashes = list(executor.map(
+                hash_file,
+                [os.path.join(img_folder_path, img_name) for _, img_name in keys],
+                [self.model_id] * len(keys),
+            ))
+
+        cache = {(record["name"], record["image"]): record for record in cached_images}
+        current: dict[tuple[str, str], ImageRecord] = {}
+        to_embed: list[tuple[tuple[str, str], str]] = []
+        failures: list[ImageFailure] = []
+
+        for key, img_hash in zip(keys, hashes):
+            if img_hash is None:
+                failures.append({"name": key[0], "image": key[1], "reason": "Image file not found or unreadable"})
+                continue
+
+            record = cache.get(key)
+            if record is not None and record["hash"] == img_hash:
+                current[key] = record
+            else:
+                to_embed.append((key, img_hash))
+
+        self.progress = {"done": 0, "total": len(to_embed)}
+
+        with tqdm(total=len(to_embed)) as progress_bar:
+            def on_progress(done: int) -> None:
+                self.progress["done"] = done
+                progress_bar.update(1)
+
+            outcomes = self.embed_images(
+                [os.path.join(img_folder_path, img_name) for (_, img_name), _ in to_embed], on_progress
+            )
+
+        new_images: list[ImageRecord] = []
+        for ((name, img_name), img_hash), (embedding, reason) in zip(to_embed, outcomes):
+            record = {"name": name, "image": img_name, "hash": img_hash, "embedding": embedding, "error": reason}
+            new_images.append(record)
+            current[(name, img_name)] = record
+
+        for (name, img_name), record in current.items():
+            if record["embedding"] is None:
+                failures.append({"name": name, "image": img_name, "reason": record["error"]})
+
+        for failure in failures:
+            log_info(f"{failure['image']} ({failure['name']}): {failure['reason']}")
+
+        removed_images = [key for key, record in cache.items() if current.get(key) is not record]
+        removed_names = (set(enrolled_names) | {name for name, _ in cache}) - set(images_by_name)
+
+        stale_names = (
+            {name for (name, _), _ in to_embed}
+            | {name for name, _ in removed_images}
+            | (set(images_by_name) - set(enrolled_names))
+            | removed_names
+        )
+
+        people = []
+        num_enrolled = 0
+        for name, images in images_by_name.items():
+            embedding_list = [
+                current[(name, img_name)]["embedding"] for img_name in images
+                if (name, img_name) in current and current[(name, img_name)]["embedding"] is not None
+            ]
+            if not embedding_list:
+                continue
+
+            num_enrolled += 1
+            if name in stale_names:
+                people.append((name, sum(embedding_list) / len(embedding_list)))
+
+        changes: EnrolmentChanges = {
+            "new_images": new_images,
+            "removed_images": removed_images,
+            "people": people,
+            "stale_names": sorted(stale_names),
+        }
+
+        self.summary = {
+            "people": len(images_by_name),
+            "enrolled": num_enrolled,
+            "removed": len(removed_names),
+            "images": len(keys),
+            "embedded": sum(record["embedding"] is not None for record in new_images),
+            "cached": len(current) - len(new_images),
+            "failures": failures,
+            "duration": time.perf_counter() - start_time,
+        }
+
+        log_info(
+            f"Enrolled {self.summary['enrolled']}/{self.summary['people']} people "
+            f"({self.summary['embedded']} images embedded, {self.summary['cached']} cached, "
+            f"{self.summary['removed']} people removed) in {self.summary['duration']:.1f}s"
+        )
+
+        return changes, self.summary
@@ -1,23 +1,22 @@
-import io
-import json
-import os
 import threading
-from datetime import datetime, timedelta
-from typing import Generator, TypedDict
+import time
+from typing import TYPE_CHECKING, Generator, TypedDict
 
 import numpy as np
-from torch import cuda
-from insightface.app import FaceAnalysis
-from voyager import Index, Space
-from PIL import Image
-from tqdm import tqdm
 
-from fr import VideoPlayer
-from sql_db import get_db, recreate_table, fetch_records, save_record
-from utils import calc_iou, log_info
+from fr.DetectionRecorder import DetectionRecorder
+from fr.FaceTracker import FaceTracker, Track
+from fr.Gallery import Gallery
+from fr.InferenceEngine import InferenceEngine
+from fr.InferenceWorkerPool import InferenceWorkerPool
+from fr.MotionDetector import MotionDetector
+from fr.RecentDetections import RecentDetections
+from fr.ResultPublisher import ResultPublisher
+from fr.VideoPlayer import VideoPlayer
+from utils import PIXEL_FORMAT_CHANNELS, frame_to_rgb, log_detection, log_info
 
-
-FR_SETTINGS_FP = 'settings.json'
+if TYPE_CHECKING:
+    from insightface.app.common import Face
 
 
 class FRResult(TypedDict):
@@ -28,15 +27,6 @@ class FRResult(TypedDict):
     score: float
 
 
-class RecentDetection(TypedDict):
-    """Recent detection results from FR for an individual"""
-
-    name: str
-    bbox: list[float]
-    norm_embed: np.ndarray
-    last_seen: datetime
-
-
 class FRSettings(TypedDict):
     """Adjustable parameteres for FR algorithm"""
 
@@ -51,406 +41,462 @@ class FRSettings(TypedDict):
     threshold_lenient_pers: float
 
 
-class FRVidPlayer(VideoPlayer):
-    """
-    Class for handling facial recognition conducted on ffmpeg stream
+class StreamSettings(TypedDict):
+    """Per-camera parameters deciding how the video is captured, which frames and regions FR inference is run on and how the video feed is broadcast"""
+
+    capture_profile: str
+    capture_width: int
+    capture_height: int
+    capture_fps: float
+    pix_fmt: str
+    decode_threads: int
+    det_size: int
+    rois: list[list[float]]
+    max_fps: float
+    use_motion_gate: bool
+    motion_threshold: float
+    motion_refresh: float
+    broadcast_width: int
+    broadcast_quality: int
+    broadcast_fps: float
+    use_tracker: bool
+    track_reembed_interval: int
+    track_reembed_iou: float
+    track_conf_drop: float
+    reconnect_delay: float
+    max_reconnect_delay: float
+    stall_timeout: float
+
+
+DEFAULT_STREAM_SETTINGS: StreamSettings = {
+    "capture_profile": "full",
+    "capture_width": 1280,
+    "capture_height": 720,
+    "capture_fps": 0,
+    "pix_fmt": "bgr24",
+    "decode_threads": 0,
+    "det_size": 640,
+    "rois": [],
+    "max_fps": 0,
+    "use_motion_gate": False,
+    "motion_threshold": 0.01,
+    "motion_refresh": 5.0,
+    "broadcast_width": 0,
+    "broadcast_quality": 90,
+    "broadcast_fps": 15,
+    "use_tracker": False,
+    "track_reembed_interval": 10,
+    "track_reembed_iou": 0.5,
+    "track_conf_drop": 0.1,
+    "reconnect_delay": 1.0,
+    "max_reconnect_delay": 30.0,
+    "stall_timeout": 10.0,
+}
+
+# Capture settings applied by each capture profile, on top of the defaults (settings given explicitly take precedence)
+CAPTURE_PROFILES: dict[str, dict] = {
+    # Every frame at 1280x720, decoded to BGR
+    "full": {},
+    # Decimated to 10 fps and decoded straight to RGB, so that frames need no conversion before detection
+    "balanced": {"capture_fps": 10, "pix_fmt": "rgb24"},
+    # Decimated to 5 fps and scaled to the detection size on one decoding thread, for many cameras per CPU
+    "light": {
+        "capture_fps": 5, "capture_width": 640, "capture_height": 360, "pix_fmt": "rgb24", "decode_threads": 1
+    },
+    # As light, but decoded to grayscale, which cuts the frames piped from ffmpeg to a third at some cost in accuracy
+    "gray": {
+        "capture_fps": 5, "capture_width": 640, "capture_height": 360, "pix_fmt": "gray", "decode_threads": 1
+    },
+}
+
+
+def resolve_stream_settings(stream_settings: dict | None) -> StreamSettings:
     """
+    Fills in the stream settings not given from the capture profile, then from the defaults
 
-    def __init__(self) -> None:
-        """Initialises the class"""
-
-        super().__init__()
-
-
-        provider: str = (
-            "CUDAExecutionProvider" if cuda.is_available() else "CPUExecutionProvider"
-        )
-
-        # For FR algorithm
-        self.model = FaceAnalysis(providers=[provider])
-        self.model.prepare(ctx_id=0)
-
-        self.vector_index = Index(Space.Cosine, num_dimensions=512)
-        self.name_list = []
-
-        self.recent_detections: list[RecentDetection] = []
-
-        # For settings
-        if not os.path.exists(FR_SETTINGS_FP):
-            fr_settings = {}
-            with open(FR_SETTINGS_FP, 'w') as file:
-                json.dump(fr_settings, file)
-        else:
-            with open(FR_SETTINGS_FP, 'r') as file:
-                fr_settings = json.load(file)
-
-        self.fr_settings: FRSettings = {
-            "threshold": fr_settings.get("threshold", 0.45),
-            "holding_time": fr_settings.get("holding_time", 15),
-            "use_differentiator": fr_settings.get("use_differentiator", True),
-            "threshold_lenient_diff": fr_settings.get("threshold_lenient_diff", 0.55),
-            "similarity_gap": fr_settings.get("similarity_gap", 0.10),
-            "use_persistor": fr_settings.get("use_persistor", True),
-            "threshold_prev": fr_settings.get("threshold_prev", 0.3),
-            "threshold_iou": fr_settings.get("threshold_iou", 0.2),        
-            "threshold_lenient_pers": fr_settings.get("threshold_lenient_pers", 0.60),
-        }
-
-        with open(FR_SETTINGS_FP, 'w') as file:
-            json.dump(self.fr_settings, file)
-
-        # For threading
-        self.inference_lock = threading.Lock()
-        self.fr_results = []
+    Arguments
+    - stream_settings: stream settings given for a camera (may be partial)
 
-        log_info("FR Model initialised!")
+    Returns
+    - complete stream settings
+    """
 
-        pass
+    stream_settings = stream_settings or {}
+    profile = stream_settings.get("capture_profile", DEFAULT_STREAM_SETTINGS["capture_profile"])
 
-    def load_embeddings(self, data_file: str | None) -> None:
-        """
-        Loads embeddings
+    if profile not in CAPTURE_PROFILES:
+        raise ValueError(f"Unknown capture profile: {profile}")
 
-        Arguments
-        - data_file: file path (relative to './data' folder) to json file linking names to pictures
-        """
+    settings = {**DEFAULT_STREAM_SETTINGS, **CAPTURE_PROFILES[profile], **stream_settings}
 
-        if not data_file:
-            self._fetch_embeddings()
-        else:
-            self._form_embeddings(data_file.strip())
+    if settings["pix_fmt"] not in PIXEL_FORMAT_CHANNELS:
+        raise ValueError(f"Unsupported pixel format: {settings['pix_fmt']}")
 
-    def adjust_values(self, new_settings: FRSettings) -> FRSettings:
-        """
-        Adjusts adjustable FR parameters based on form submission from settings page and update to FR settings json file
+    return settings
 
-        Arguments
-        - new_settings: new setting parameters submitted by user (typed dictionary)
 
-        Returns
-        - new setting parameters
-        """
-
-        self.fr_settings = new_settings
+class InferenceStats(TypedDict):
+    """Number of frames (and faces in them) handled by the inference loop of a camera"""
 
-        with open(FR_SETTINGS_FP, 'w') as file:
-            json.dump(new_settings, file)
+    processed: int
+    skipped: int
+    deduplicated: int
+    timeouts: int
+    dropped: int
+    errors: int
+    faces: int
+    embedded: int
 
-        return self.fr_settings
-
-    def _extract_ave_embedding(self, img_folder_path: str, images: list[str]) -> np.ndarray:
-        """
-        Extract the average embedding representation of a person's face based on the picture(s) of the person
 
-        Arguments
-        - img_folder_path: path to image folder
-        - images: name of the image files bearing the person's picture
+class FRVidPlayer(VideoPlayer):
+    """
+    Class for handling facial recognition conducted on ffmpeg stream
+    """
 
-        Returns
-        - Average embedding representation of the person's face
+    def __init__(
+        self,
+        cam_id: str,
+        engine: InferenceEngine | InferenceWorkerPool,
+        gallery: Gallery,
+        fr_settings: FRSettings,
+        stream_settings: StreamSettings | None = None,
+        detection_recorder: DetectionRecorder | None = None,
+    ) -> None:
         """
+        Initialises the class
 
-        embedding_list = []
-        for img_name in images:
-            img_fp = os.path.join(img_folder_path, img_name)
-
-            try: 
-                img = Image.open(img_fp).convert("RGB")
-                img_arr = np.array(img)
-            except Exception:
-                log_info(f"Error processing {img_name}")
-                continue
-
-            faces = self.model.get(img_arr)
-
-            if not len(faces): 
-                log_info(f"{img_name} contains no detectable faces!")
-                continue
-
-            embedding_list.append(faces[0].embedding)
-
-        if len(embedding_list) == 0:
-            return np.array([])
-
-        return sum(embedding_list) / len(embedding_list)
-
-    def _reset_vector_index(self) -> None:
-        """Reset vector index and name list"""
-
-        self.name_list = []
-        self.vector_index = Index(Space.Cosine, num_dimensions=512)
-
-    def _fetch_embeddings(self) -> None:
-        """Load embeddings from SQLite database"""
-
-        log_info("Loading embeddings...")
-
-        if self.name_list:
-            log_info("Embeddings already loaded!")
-            return None
-
-        with get_db() as conn:
-            records = fetch_records(conn)
-
-        for record in records:
-            self.name_list.append(record["name"])
-            self.vector_index.add_item(record["ave_embedding"])
-
-        log_info(f"Loaded {len(self.name_list)} embeddings from db")       
-
-    def _form_embeddings(self, data_file: str) -> None:
-        """
-        Create embeddings for SQLite database from data provided
-        
         Arguments
-        - data_file: file path (relative to './data' folder) to json file linking names to pictures
+        - cam_id: identifier of the camera this player streams from
+        - engine: runs face detection and recognition, in batches or in worker processes (shared by all cameras)
+        - gallery: embeddings of known faces (shared by all cameras)
+        - fr_settings: adjustable FR parameters (shared by all cameras, updated in place)
+        - stream_settings: parameters deciding how this camera is captured, which of its frames and regions are inferred and how its video feed is broadcast
+        - detection_recorder: records recognitions in the detections database (shared by all cameras), None to not record them
         """
 
-        if not data_file.endswith(".json"):
-            raise ValueError("Please provide a json file with the .json extension.")
-
-        data_file_path = os.path.join('data', data_file)
-
-        if not os.path.exists(data_file_path):
-            raise FileNotFoundError(f"{data_file_path} does not exists!")
-
-        with open(data_file_path, "r") as file:
-            data_dict = json.load(file)
-
-        img_folder_path = os.path.join('data', data_dict["img_folder_path"])
-
-        with get_db() as conn:
-            recreate_table(conn)
-            log_info("Extracting embeddings from images...")
-            self._reset_vector_index()
-            for entry in tqdm(data_dict["details"]):
-                name = entry["name"]
-                ave_embedding = self._extract_ave_embedding(
-                    img_folder_path, entry["images"]
-                )
-
-                if ave_embedding.shape == (0,): 
-                    continue
+        self.stream_settings = resolve_stream_settings(stream_settings)
+
+        super().__init__(
+            width=self.stream_settings["capture_width"],
+            height=self.stream_settings["capture_height"],
+            fps=self.stream_settings["capture_fps"],
+            pix_fmt=self.stream_settings["pix_fmt"],
+            decode_threads=self.stream_settings["decode_threads"],
+            broadcast_width=self.stream_settings["broadcast_width"],
+            broadcast_quality=self.stream_settings["broadcast_quality"],
+            broadcast_fps=self.stream_settings["broadcast_fps"],
+            reconnect_delay=self.stream_settings["reconnect_delay"],
+            max_reconnect_delay=self.stream_settings["max_reconnect_delay"],
+            stall_timeout=self.stream_settings["stall_timeout"],
+        )
 
-                save_record(conn, name, ave_embedding)
+        self.cam_id = cam_id
 
-                self.name_list.append(name)
-                self.vector_index.add_item(ave_embedding)
+        # For FR algorithm
+        self.engine = engine
+        self.gallery = gallery
+        self.fr_settings = fr_settings
+        self.detection_recorder = detection_recorder
+
+        self.recent_detections = RecentDetections()
+
+        # For skipping recognition of faces tracked from earlier frames
+        self.face_tracker = FaceTracker(
+            reembed_interval=self.stream_settings["track_reembed_interval"],
+            reembed_iou=self.stream_settings["track_reembed_iou"],
+            conf_drop=self.stream_settings["track_conf_drop"],
+        ) if self.stream_settings["use_tracker"] else None
+        self._frame_tracks: list[Track] = []
+
+        # For frame selection
+        self.inference_stats: InferenceStats = {
+            "processed": 0, "skipped": 0, "deduplicated": 0, "timeouts": 0, "dropped": 0, "errors": 0, "faces": 0, "embedded": 0
+        }
 
-    @staticmethod
-    def _fractionalise_bbox(
-        img_width: int, img_height: int, bbox: list[float]
-    ) -> list[float]:
-        """
-        Convert bounding box values to fractions of the image
+        # Seconds between the latest inferred frame being read from ffmpeg and its results being published
+        self.stream_lag = 0.0
 
-        Arguments
-        - img_width: width of image (pixels)
-        - img_height: height of image (pixels)
-        - bbox: bounding box in xyxy format (pixels)
+        # For broadcasting results
+        self.result_publisher = ResultPublisher()
 
-        Returns
-        - bounding box in xyxy format (fraction)
-        """
+        log_info(f"FR Player for camera {cam_id} initialised!")
 
-        return [
-            float(bbox[0] / img_width),
-            float(bbox[1] / img_height),
-            float(bbox[2] / img_width),
-            float(bbox[3] / img_height),
-        ]
+        pass
 
     @staticmethod
-    def _normalise_embed(embed: np.ndarray) -> np.ndarray:
+    def _normalise_embeds(embeddings_list: list[np.ndarray]) -> np.ndarray:
         """
-        Normalise embeddings 
+        Normalise embeddings
 
         Arguments
-        - embed: raw embedding represenatation of a person's face
+        - embeddings_list: raw embedding representations of faces
 
         Returns
-        - normalised embedding representation of a person's face
+        - (M, 512) array of normalised embedding representations of faces
         """
 
         # Make sure its type float32
-        embed = np.asarray(embed, dtype=np.float32)
-        return np.linalg.norm(embed)
+        embeds = np.asarray(embeddings_list, dtype=np.float32).reshape(-1, 512)
+        return embeds / np.maximum(np.linalg.norm(embeds, axis=1, keepdims=True), 1e-12)
 
-    def _catch_recent(self, embed: np.ndarray, score: np.float32, bbox: list[float]) -> tuple[str, np.ndarray]:
+    def _catch_recent(self, norm_embeds: np.ndarray, scores: np.ndarray, bboxes: np.ndarray) -> list[str]:
         """
         Implementation of persistor mechanic
         If unrecognised by vanilla FR and differentiator, persistor mechanic checks if the bounding box is close to a face previously recognised. To do this 3 criteria must be fulfilled
         1. The face sufficiently resembles the previously recognised face (threshold_prev)
         2. The face somewhat resembles a face in the database (threshold_lenient_pers)
         3. The face occupies a similar area in the image as the previously recognised  (threshold_iou)
-        
+        All yet-to-be recognised faces of a frame are checked against all recent detections at once
+
         Arguments
-        - embed: embeddings of the yet-to-be recognised face
-        - score: furthest distance (cosine similarity) to a face in the database
-        - bbox: bounding box of the yet-to-be recognised face
+        - norm_embeds: (M, 512) array of normalised embeddings of the yet-to-be recognised faces
+        - scores: closest distance (cosine) of each yet-to-be recognised face to a face in the database
+        - bboxes: (M, 4) array of bounding boxes of the yet-to-be recognised faces
 
         Returns
-        - If recognised, name of the person bearing the recognised face, else "Unknown"
-        - Normalised embedding of the yet-to-be recognised face
+        - for each face, if recognised, name of the person bearing the recognised face, else "Unknown"
         """
 
-        embed = FRVidPlayer._normalise_embed(embed)
-        max_sim: float = 0
-        closest_match = None
-
-        for recent_detection in self.recent_detections:
-            iou = calc_iou(recent_detection["bbox"], bbox)
-            if iou < self.fr_settings["threshold_iou"]: 
-                continue  
-
-            similarity = np.dot(embed, recent_detection["norm_embed"])
-            if float(similarity) > max_sim:
-                max_sim = similarity
-                closest_match = recent_detection["name"]
+        closest_matches, similarities = self.recent_detections.match(
+            bboxes, norm_embeds, self.fr_settings["threshold_iou"]
+        )
 
-        if max_sim/512 > (1-self.fr_settings["threshold_prev"]) and (score < self.fr_settings['threshold_lenient_pers']):
-            return (closest_match, embed)
+        # Cosine distance to the recent detection (1 - similarity of the normalised embeddings) below threshold_prev
+        recognised = (
+            (similarities > 1 - self.fr_settings["threshold_prev"])
+            & (np.asarray(scores) < self.fr_settings["threshold_lenient_pers"])
+        )
 
-        return ("Unknown", embed)
+        return [
+            closest_match if is_recognised else "Unknown"
+            for closest_match, is_recognised in zip(closest_matches, recognised)
+        ]
 
-    def _update_recent_detections(
-        self, updated: list[RecentDetection]
-    ) -> list[str]:
+    def _select_faces(self, faces: list["Face"]) -> list[bool]:
         """
-        Part of persistor mechanic
-        Updates the self.recent_detections with latest detection
+        Updates the face tracker with the faces detected in the latest frame (called by the inference engine before recognition)
 
-        Arguments:
-        - updated: latest detections (from latest frame)
+        Arguments
+        - faces: detected faces (without embeddings)
 
         Returns
-        - names of those recently recognised (within holding time) but recognised in the latest frame
+        - whether each face needs to be embedded
         """
 
-        preserved_labels = []
-        updated_names = [d["name"] for d in updated]
-
-        curr_time = datetime.now()
-        holding_time = timedelta(seconds=self.fr_settings["holding_time"])
-
-        for detection in self.recent_detections:
-            if detection["name"] in updated_names:
-                continue
-
-            time_diff = curr_time - detection["last_seen"]
-            if time_diff > holding_time:
-                continue
-
-            updated.append(detection)
-            preserved_labels.append(detection["name"])
-
-        self.recent_detections = updated
-        return preserved_labels
+        self._frame_tracks, needs_embedding = self.face_tracker.update(
+            np.array([face.bbox for face in faces]), np.array([face.det_score for face in faces])
+        )
+        return needs_embedding
 
-    def _log_if(self, name:str) -> None:
+    def _log_if(self, name: str, score: float, bbox: list[float]) -> None:
         """
         Log detection if name is not in recent detections (to minimise unnecessary logs)
 
         Arguments
         - name: name of recognised person
+        - score: distance (cosine) of the face to the person's face in the database
+        - bbox: bounding box of the face in xyxy format (fraction of the frame)
         """
 
-        recent_names = [detection["name"] for detection in self.recent_detections]
-        
-        if name not in recent_names:
+        if name not in self.recent_detections:
             log_info(f"{name} detected")
+            log_detection(self.cam_id, name, score, bbox)
 
-    def infer(self, frame_bytes: bytes) -> list[FRResult]:
+    def infer(self, frame: np.ndarray) -> list[FRResult]:
         """
         Conducts FR inference on provided frame.
-        Uses insightface for detecting faces and encoding them in embedding representation and uses Spotify's Voyager for a vector index search; includes self-implemented differentiator and persistor mechanics with adjustable parameters to improve accuracy of algorithm
+        Uses insightface for detecting faces and encoding them in embedding representation and searches the gallery of known faces for the closest matches; includes self-implemented differentiator and persistor mechanics with adjustable parameters to improve accuracy of algorithm
 
         Arguments:
-        - frame_bytes: image (in bytes) which FR is conducted on
+        - frame: raw frame (height x width x channels, in the capture pixel format) which FR is conducted on
 
         Returns
         - list of recognised faces, their scores and bounding boxes (typed dictionary)    
         """
 
-        img = Image.open(io.BytesIO(frame_bytes)).convert("RGB")
+        height, width = frame.shape[:2]
 
-        width, height = img.size
-        img = np.array(img)
+        # Embeddings in the database are formed from RGB images, so queries must match (RGB frames are used as they are)
+        with self.stage_timer.measure("convert"):
+            img = frame_to_rgb(frame, self.pix_fmt)
 
-        faces = self.model.get(img)
-        embeddings_list = [face.embedding for face in faces]
+        timings = {}
+        faces = self.engine.infer(
+            self.cam_id,
+            img,
+            select=self._select_faces if self.face_tracker is not None else None,
+            det_size=self.stream_settings["det_size"],
+            rois=self.stream_settings["rois"],
+            timings=timings,
+        )
+        for stage, seconds in timings.items():
+            self.stage_timer.record(stage, seconds)
 
-        if len(embeddings_list) == 0:
-            extra_labels = self._update_recent_detections([])
+        # Post-processing is everything after inference apart from searching the gallery
+        postprocess_start = time.perf_counter()
+        search_time = 0.0
+        holding_time = self.fr_settings["holding_time"]
+
+        if len(faces) == 0:
+            extra_labels = self.recent_detections.update([], np.empty((0, 4)), np.empty((0, 512)), holding_time)
+            self.stage_timer.record("postprocess", time.perf_counter() - postprocess_start)
             return [{"label": label} for label in extra_labels]
 
-        neighbours, distances = self.vector_index.query(
-            embeddings_list, k=min(2, len(self.name_list))
-        )
+        self.inference_stats["faces"] += len(faces)
+
+        # Bounding boxes as fractions of the image
+        bboxes = np.array([face["bbox"] for face in faces], dtype=np.float64) / [width, height, width, height]
+
+        labels = ["Unknown"] * len(faces)
+        scores = np.ones(len(faces))
+        norm_embeds = np.zeros((len(faces), 512), dtype=np.float32)
 
-        labels = []
-        updated_recent_detections : list[RecentDetection] = []  # Same format as recent_detections
-
-        bboxes = [FRVidPlayer._fractionalise_bbox(
-                    width, height, face["bbox"].tolist()
-                ) for face in faces]
-
-        for i, dist in enumerate(distances):
-            if dist[0] < self.fr_settings["threshold"] or (
-                self.fr_settings["use_differentiator"]
-                and dist[0] < self.fr_settings["threshold_lenient_diff"]
-                and len(dist) > 1
-                and (dist[1] - dist[0]) > self.fr_settings["similarity_gap"]
-            ):
-                name = self.name_list[neighbours[i][0]]
-                latest_embedding = FRVidPlayer._normalise_embed(embeddings_list[i])
-                self._log_if(name)
-
-            elif self.fr_settings["use_persistor"]:
-                name, latest_embedding = self._catch_recent(embeddings_list[i], dist[0], bboxes[i])
-            
-            else: 
-                name = "Unknown"
-
-            labels.append(name)
-
-            if name == "Unknown":
+        # Faces the tracker skipped keep the identity their track was last recognised as
+        embedded_idxs = []
+        for i, face in enumerate(faces):
+            if face.embedding is not None:
+                embedded_idxs.append(i)
                 continue
-                
-            updated_recent_detections.append({
-                "name": name,
-                "bbox": bboxes[i],
-                "norm_embed": latest_embedding,
-                "last_seen": datetime.now(),
-            })
-            
 
-        extra_labels = self._update_recent_detections(updated_recent_detections)
+            track = self._frame_tracks[i]
+            labels[i], scores[i], norm_embeds[i] = track.label, track.score, track.norm_embed
 
-        return [
+        if embedded_idxs:
+            self.inference_stats["embedded"] += len(embedded_idxs)
+            embeddings_list = [faces[i].embedding for i in embedded_idxs]
+            search_start = time.perf_counter()
+            neighbour_names, distances = self.gallery.query(embeddings_list, k=2)
+            search_time = time.perf_counter() - search_start
+            self.stage_timer.record("search", search_time)
+            norm_embeds[embedded_idxs] = FRVidPlayer._normalise_embeds(embeddings_list)
+
+            persistor_idxs = []
+
+            for i, names, dist in zip(embedded_idxs, neighbour_names, distances):
+                if len(dist) == 0:
+                    continue
+
+                scores[i] = dist[0]
+
+                if dist[0] < self.fr_settings["threshold"] or (
+                    self.fr_settings["use_differentiator"]
+                    and dist[0] < self.fr_settings["threshold_lenient_diff"]
+                    and len(dist) > 1
+                    and (dist[1] - dist[0]) > self.fr_settings["similarity_gap"]
+                ):
+                    labels[i] = names[0]
+                    self._log_if(labels[i], float(dist[0]), bboxes[i].tolist())
+
+                elif self.fr_settings["use_persistor"]:
+                    persistor_idxs.append(i)
+
+            # Persistor compares against detections up to the previous frame, so all remaining faces are checked at once
+            if persistor_idxs:
+                persisted = self._catch_recent(
+                    norm_embeds[persistor_idxs], scores[persistor_idxs], bboxes[persistor_idxs]
+                )
+                for i, name in zip(persistor_idxs, persisted):
+                    labels[i] = name
+
+            if self.face_tracker is not None:
+                for i in embedded_idxs:
+                    FaceTracker.record(self._frame_tracks[i], labels[i], float(scores[i]), norm_embeds[i])
+
+        recognised_idxs = [i for i, label in enumerate(labels) if label != "Unknown"]
+        extra_labels = self.recent_detections.update(
+            [labels[i] for i in recognised_idxs], bboxes[recognised_idxs], norm_embeds[recognised_idxs], holding_time
+        )
+
+        bbox_list = bboxes.tolist()
+
+        if self.detection_recorder is not None:
+            for i in recognised_idxs:
+                self.detection_recorder.record(self.cam_id, labels[i], float(scores[i]), bbox_list[i])
+
+        results = [
             {
-                "bbox": bboxes[i],
+                "bbox": bbox_list[i],
                 "label": labels[i],
-                "score": float(distances[i][0]),
+                "score": float(scores[i]),
             }
             for i in range(len(faces))
         ] + [{"label": label} for label in extra_labels]
 
+        self.stage_timer.record("postprocess", time.perf_counter() - postprocess_start - search_time)
+
+        return results
+
     def _loopInference(self) -> None:
-        """Repeatedly conducts inference on the latest frame from the ffmpeg video stream"""
-
-        while self.streamThread.is_alive() and not self.end_event.is_set():
-            try:
-                with self.vid_lock:
-                    frame_bytes = self.frame_bytes
-                results = self.infer(frame_bytes)
-                with self.inference_lock:
-                    self.fr_results = results
-            except AttributeError:
-                continue
-        else:
-            self._reset_vector_index()
-            self.recent_detections = []
+        """
+        Repeatedly conducts inference on the latest frame from the ffmpeg video stream
+        Each frame is inferred at most once; frames can further be skipped by the motion gate and the maximum inference FPS
+        A frame whose inference fails is logged, counted and skipped, so that one bad frame does not end inference on the camera
+        """
+
+        motion_detector = MotionDetector(
+            threshold=self.stream_settings["motion_threshold"],
+            refresh=self.stream_settings["motion_refresh"],
+            pix_fmt=self.pix_fmt,
+        ) if self.stream_settings["use_motion_gate"] else None
+
+        max_fps = self.stream_settings["max_fps"]
+        min_interval = 1 / max_fps if max_fps > 0 else 0
+        last_seq = 0
+        last_infer_time = 0.0
+
+        try:
+            while self.streamThread.is_alive() and not self.end_event.is_set():
+                wait_time = last_infer_time + min_interval - time.monotonic()
+                if wait_time > 0 and self.end_event.wait(wait_time):
+                    continue
+
+                # Latest frame already inferred, wait for ffmpeg to produce the next one
+                if self.frame_buffer.seq == last_seq:
+                    if not self.frame_buffer.wait_for_frame(last_seq, timeout=0.5):
+                        self.inference_stats["timeouts"] += 1
+                        continue
+                    self.inference_stats["deduplicated"] += 1
+
+                error = None
+
+                with self.frame_buffer.read_latest() as (seq, frame):
+                    if frame is None:
+                        continue
+
+                    # Frames published since the last one read were overwritten before inference got to them
+                    self.inference_stats["dropped"] += seq - last_seq - 1
+                    last_seq = seq
+                    frame_time = self.frame_buffer.published_at(seq)
+
+                    if motion_detector is not None and not motion_detector.has_changed(frame):
+                        self.inference_stats["skipped"] += 1
+                        continue
+
+                    last_infer_time = time.monotonic()
+                    try:
+                        results = self.infer(frame)
+                    except Exception as err:
+                        error = err
+
+                # Waits before the next frame, as an engine that has stopped fails every frame straight away
+                if error is not None:
+                    self.inference_stats["errors"] += 1
+                    log_info(f"Inference error on camera {self.cam_id}: {error!r}")
+                    self.end_event.wait(0.5)
+                    continue
+
+                self.inference_stats["processed"] += 1
+                with self.stage_timer.measure("serialize"):
+                    self.result_publisher.publish(results)
+
+                if frame_time is not None:
+                    self.stream_lag = time.monotonic() - frame_time
+            else:
+                self.recent_detections.clear()
+                if self.face_tracker is not None:
+                    self.face_tracker.clear()
+        finally:
+            self.result_publisher.close()
 
     def start_inference(self) -> None:
         """Starts FR inference on ffmpeg video stream in a separate thread"""
@@ -460,14 +506,13 @@ class FRVidPlayer(VideoPlayer):
         self.inferenceThread.start()
         return None
 
-    def start_detection_broadcast(self) -> Generator[list[FRResult], any, any]:
+    def start_detection_broadcast(self) -> Generator[str, any, any]:
         """
         Starts broadcast of detection results from FR inferencing on ffmpeg video stream
+        Subscribers are only sent results when they change
         
         Returns
-        - Generator yielding FR detection results (list of typed dictionary)
+        - Generator yielding FR detection results (JSON line of list of typed dictionary)
         """
 
-        while self.inferenceThread.is_alive():
-            with self.inference_lock:
-                yield json.dumps({"data": self.fr_results}) + '\n'
+        yield from self.result_publisher.subscribe()
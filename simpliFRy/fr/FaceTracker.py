@@ -0,0 +1,213 @@
+from typing import TypedDict
+
+import numpy as np
+
+from utils import calc_iou_matrix
+
+
+class TrackStats(TypedDict):
+    """Number of frames a track has been seen in and how many of them its face was embedded in"""
+
+    track_id: int
+    label: str | None
+    frames: int
+    embeds: int
+
+
+class Track:
+    """Face followed across frames, with the identity it was last recognised as"""
+
+    def __init__(self, track_id: int, bbox: np.ndarray, det_score: float) -> None:
+        self.track_id = track_id
+        self.bbox = bbox
+        self.velocity = np.zeros(4, dtype=np.float64)
+        self.det_score = det_score
+        self.misses = 0
+        self.frames = 1
+        self.embeds = 0
+
+        # Set when the face is embedded
+        self.label: str | None = None
+        self.score = 1.0
+        self.norm_embed: np.ndarray | None = None
+        self.embed_bbox = bbox
+        self.embed_det_score = det_score
+        self.frames_since_embed = 0
+
+    def predict(self) -> np.ndarray:
+        """
+        Predicts the bounding box of the track in the next frame (constant velocity)
+
+        Returns
+        - predicted bounding box in xyxy format
+        """
+
+        return self.bbox + self.velocity * (self.misses + 1)
+
+
+class FaceTracker:
+    """
+    Lightweight IoU tracker following faces across the frames of a camera, so that a face which keeps its identity is not embedded every frame.
+    Each track's bounding box is predicted with a smoothed constant-velocity model and matched greedily to the detection with the highest IoU.
+    A track recognised as a known person is only re-embedded every few frames, when its bounding box moves substantially, or when its detection confidence drops.
+    """
+
+    def __init__(
+        self,
+        reembed_interval: int = 10,
+        reembed_iou: float = 0.5,
+        conf_drop: float = 0.1,
+        match_iou: float = 0.3,
+        max_misses: int = 5,
+        smoothing: float = 0.5,
+    ) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - reembed_interval: maximum number of frames between embeddings of a recognised track
+        - reembed_iou: a recognised track is re-embedded when the IoU of its bounding box with its bounding box when last embedded falls below this
+        - conf_drop: a recognised track is re-embedded when its detection score falls by more than this since it was last embedded
+        - match_iou: minimum IoU of a detection with the predicted bounding box of a track for it to continue the track
+        - max_misses: number of consecutive frames a track can go undetected before it is dropped
+        - smoothing: weight of the latest movement in the velocity of a track (0 to 1)
+        """
+
+        self.reembed_interval = max(1, reembed_interval)
+        self.reembed_iou = reembed_iou
+        self.conf_drop = conf_drop
+        self.match_iou = match_iou
+        self.max_misses = max_misses
+        self.smoothing = smoothing
+
+        self.tracks: list[Track] = []
+        self.next_track_id = 0
+
+        self.embedded = 0
+        self.reused = 0
+
+    def clear(self) -> None:
+        """Drops all tracks"""
+
+        self.tracks = []
+
+    def _match(self, bboxes: np.ndarray) -> list[int | None]:
+        """
+        Matches detections to tracks greedily by IoU with the predicted bounding boxes of the tracks
+
+        Arguments
+        - bboxes: (M, 4) array of detected bounding boxes in xyxy format
+
+        Returns
+        - index of the track continued by each detection, None if the detection starts a new track
+        """
+
+        matches: list[int | None] = [None] * len(bboxes)
+        if not self.tracks or not len(bboxes):
+            return matches
+
+        ious = calc_iou_matrix(bboxes, np.array([track.predict() for track in self.tracks]))
+
+        for flat_idx in np.argsort(-ious, axis=None):
+            det_idx, track_idx = np.unravel_index(flat_idx, ious.shape)
+            if ious[det_idx, track_idx] < self.match_iou:
+                break
+            if matches[det_idx] is not None or track_idx in matches:
+                continue
+            matches[det_idx] = int(track_idx)
+
+        return matches
+
+    def update(self, bboxes: np.ndarray, det_scores: np.ndarray) -> tuple[list[Track], list[bool]]:
+        """
+        Updates the tracks with the detections of the latest frame and decides which detections need to be embedded
+
+        Arguments
+        - bboxes: (M, 4) array of detected bounding boxes in xyxy format
+        - det_scores: (M,) array of detection scores
+
+        Returns
+        - track of each detection
+        - whether each detection needs to be embedded
+        """
+
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        matches = self._match(bboxes)
+
+        detected_tracks: list[Track] = []
+        needs_embedding: list[bool] = []
+
+        for bbox, det_score, track_idx in zip(bboxes, det_scores, matches):
+            if track_idx is None:
+                track = Track(self.next_track_id, bbox, float(det_score))
+                self.next_track_id += 1
+                detected_tracks.append(track)
+                needs_embedding.append(True)
+                continue
+
+            track = self.tracks[track_idx]
+            movement = (bbox - track.bbox) / (track.misses + 1)
+            track.velocity = self.smoothing * movement + (1 - self.smoothing) * track.velocity
+            track.bbox = bbox
+            track.det_score = float(det_score)
+            track.misses = 0
+            track.frames += 1
+            track.frames_since_embed += 1
+
+            detected_tracks.append(track)
+            needs_embedding.append(
+                track.label is None
+                or track.frames_since_embed >= self.reembed_interval
+                or calc_iou_matrix(bbox, track.embed_bbox)[0, 0] < self.reembed_iou
+                or track.det_score < track.embed_det_score - self.conf_drop
+            )
+
+        detected_ids = {track.track_id for track in detected_tracks}
+        for track in self.tracks:
+            if track.track_id not in detected_ids:
+                track.misses += 1
+
+        self.tracks = detected_tracks + [
+            track for track in self.tracks
+            if track.track_id not in detected_ids and track.misses <= self.max_misses
+        ]
+
+        num_embedded = sum(needs_embedding)
+        self.embedded += num_embedded
+        self.reused += len(needs_embedding) - num_embedded
+
+        return detected_tracks, needs_embedding
+
+    @staticmethod
+    def record(track: Track, label: str, score: float, norm_embed: np.ndarray) -> None:
+        """
+        Records the outcome of recognising an embedded track
+
+        Arguments
+        - track: track whose face was embedded in the latest frame
+        - label: name it was recognised as, "Unknown" if unrecognised
+        - score: closest distance (cosine) to a face in the database
+        - norm_embed: normalised embedding of the face
+        """
+
+        # Unrecognised tracks are embedded again in the next frame
+        track.label = label if label != "Unknown" else None
+        track.score = score
+        track.norm_embed = norm_embed
+        track.embed_bbox = track.bbox
+        track.embed_det_score = track.det_score
+        track.frames_since_embed = 0
+        track.embeds += 1
+
+    def stats(self) -> list[TrackStats]:
+        """
+        Reports the tracks currently followed
+
+        Returns
+        - label, number of frames and number of embeddings of each track
+        """
+
+        return [
+            {"track_id": track.track_id, "label": track.label, "frames": track.frames, "embeds": track.embeds}
+            for track in self.tracks
+        ]
@@ -0,0 +1,156 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Generator
+
+import numpy as np
+
+
+class FrameBuffer:
+    """
+    Preallocated ring of raw video frames shared between the ffmpeg stream thread and its readers.
+    The writer fills a free slot in place and publishes it; readers borrow the latest published slot without copying it.
+    """
+
+    def __init__(self, width: int, height: int, channels: int = 3, num_slots: int = 3) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - width: width of a frame (pixels)
+        - height: height of a frame (pixels)
+        - channels: number of colour channels per pixel
+        - num_slots: number of preallocated frames (3 allows the writer to keep going while 2 readers hold frames)
+        """
+
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.frame_size = width * height * channels
+
+        self._slots = [
+            np.empty((height, width, channels), dtype=np.uint8) for _ in range(num_slots)
+        ]
+        self._readers = [0] * num_slots
+
+        # Sequence number and time (monotonic) each slot was last published with
+        self._slot_seqs = [0] * num_slots
+        self._slot_times = [0.0] * num_slots
+
+        # Used when every slot is borrowed, so the pipe is still drained but the frame is dropped
+        self._scratch = np.empty((height, width, channels), dtype=np.uint8)
+
+        self._cond = threading.Condition()
+        self._writing: int | None = None
+        self._latest: int | None = None
+
+        self.seq = 0
+        self.dropped = 0
+
+    def begin_write(self) -> np.ndarray:
+        """
+        Reserves a slot for the writer to fill in place
+
+        Returns
+        - Frame array to be written into (not visible to readers until commit_write is called)
+        """
+
+        with self._cond:
+            num_slots = len(self._slots)
+            start = 0 if self._latest is None else self._latest + 1
+
+            for offset in range(num_slots):
+                idx = (start + offset) % num_slots
+                if idx != self._latest and self._readers[idx] == 0:
+                    self._writing = idx
+                    return self._slots[idx]
+
+            self._writing = None
+            return self._scratch
+
+    def commit_write(self) -> int:
+        """
+        Publishes the slot reserved by begin_write as the latest frame
+
+        Returns
+        - Sequence number of the latest frame
+        """
+
+        with self._cond:
+            if self._writing is None:
+                self.dropped += 1
+                return self.seq
+
+            self._latest = self._writing
+            self._writing = None
+            self.seq += 1
+            self._slot_seqs[self._latest] = self.seq
+            self._slot_times[self._latest] = time.monotonic()
+            self._cond.notify_all()
+
+            return self.seq
+
+    def abort_write(self) -> None:
+        """Releases the slot reserved by begin_write without publishing it"""
+
+        with self._cond:
+            self._writing = None
+
+    def published_at(self, seq: int) -> float | None:
+        """
+        Finds when a frame was published (reliable while the frame is borrowed, as its slot cannot be overwritten)
+
+        Arguments
+        - seq: sequence number of the frame
+
+        Returns
+        - time (monotonic) the frame was published, None if its slot has since been overwritten
+        """
+
+        with self._cond:
+            for slot_seq, slot_time in zip(self._slot_seqs, self._slot_times):
+                if slot_seq == seq:
+                    return slot_time
+
+        return None
+
+    def wait_for_frame(self, after_seq: int, timeout: float | None = None) -> bool:
+        """
+        Blocks until a frame newer than the given sequence number is published
+
+        Arguments
+        - after_seq: sequence number of the last frame the reader has seen
+        - timeout: maximum time to wait (seconds), None to wait indefinitely
+
+        Returns
+        - True if a newer frame is available, False if timed out
+        """
+
+        with self._cond:
+            return self._cond.wait_for(lambda: self.seq > after_seq, timeout)
+
+    @contextmanager
+    def read_latest(self) -> Generator[tuple[int, np.ndarray | None], None, None]:
+        """
+        Borrows the latest frame; the writer will not overwrite it until the context exits
+
+        Returns
+        - A generator yielding the sequence number and a read-only view of the latest frame (None if no frame yet)
+        """
+
+        with self._cond:
+            idx, seq = self._latest, self.seq
+            if idx is not None:
+                self._readers[idx] += 1
+
+        if idx is None:
+            yield seq, None
+            return
+
+        try:
+            frame = self._slots[idx].view()
+            frame.flags.writeable = False
+            yield seq, frame
+        finally:
+            with self._cond:
+                self._readers[idx] -= 1
@@ -0,0 +1,486 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import TYPE_CHECKING, TypedDict
+
+import numpy as np
+
+from fr.Enroller import Enroller, EnrolmentSummary, ImageFailure, hash_file
+from fr.ReadWriteLock import ReadWriteLock
+from fr.SearchBackend import SearchBackend, select_backend
+from sql_db import (
+    get_db,
+    create_tables,
+    fetch_all_embeddings,
+    fetch_checksum,
+    fetch_image_records,
+    fetch_metadata,
+    fetch_names,
+    save_metadata,
+    sync_records,
+)
+from sql_db.DBManager import DB_FP, ImageRecord
+from utils import log_info
+
+if TYPE_CHECKING:
+    from insightface.app import FaceAnalysis
+
+# Snapshot of the search backend built from the database (file extension depends on the backend),
+# with the name list and checksum of the database it was built from
+INDEX_FP = os.path.splitext(DB_FP)[0]
+INDEX_META_FP = INDEX_FP + ".index.json"
+
+
+class PersonUpdate(TypedDict):
+    """Outcome of adding or updating a person at runtime"""
+
+    name: str
+    enrolled: bool
+    images: int
+    embedded: int
+    cached: int
+    failures: list[ImageFailure]
+    gallery_size: int
+
+
+class Gallery:
+    """
+    Class for holding the embeddings of known faces in a search backend, shared by all cameras
+    """
+
+    def __init__(self, model: "FaceAnalysis", backend: str = "auto", exact_max_size: int = 1000) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - model: insightface model used to extract embeddings from enrolment images
+        - backend: search backend ("exact" for a brute-force matrix, "voyager" for an HNSW index, or "auto" to pick by gallery size)
+        - exact_max_size: largest gallery searched exactly when backend is "auto"
+        """
+
+        self.enroller = Enroller(model)
+
+        self.backend = backend
+        self.exact_max_size = exact_max_size
+
+        # Name of the person each id of the vector index belongs to (None for removed ids)
+        self.name_list: list[str | None] = []
+        self.vector_index: SearchBackend = self._build_index([], np.empty((0, 512), dtype=np.float32))[1]
+        self.name_ids: dict[str, list[int]] = {}
+        self.size = 0
+        self.loaded = False
+
+        # Cameras query under the read side; the vector index and name list are only changed under the write side
+        self.lock = ReadWriteLock()
+
+        # Serialises loading and runtime changes, so that the vector index always matches the database
+        self.update_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def load(self, data_file: str | None, reset: bool = False) -> EnrolmentSummary | None:
+        """
+        Loads embeddings
+
+        Arguments
+        - data_file: file path (relative to './data' folder) to json file linking names to pictures
+        - reset: reload the embeddings even if they are already loaded (reset and loaded under one lock, so that
+          no other load or change runs in between)
+
+        Returns
+        - summary of the enrolment if embeddings were formed from a data file, else None
+        """
+
+        with self.update_lock:
+            if reset:
+                self._reset()
+
+            if not data_file:
+                self._fetch_embeddings()
+                return None
+
+            return self._form_embeddings(data_file.strip())
+
+    def reset(self) -> None:
+        """Reset vector index and name list"""
+
+        with self.update_lock:
+            self._reset()
+
+    def _reset(self) -> None:
+        """Reset vector index and name list (with the update lock held)"""
+
+        self._swap_index(*self._build_index([], np.empty((0, 512), dtype=np.float32)))
+        self.loaded = False
+
+    def names(self) -> list[str]:
+        """
+        Lists the people in the gallery
+
+        Returns
+        - names of the people, sorted (from the database if the gallery is not loaded)
+        """
+
+        if not self.loaded:
+            with get_db() as conn:
+                create_tables(conn)
+                return sorted(fetch_names(conn))
+
+        with self.lock.read():
+            return sorted(self.name_ids)
+
+    def query(self, embeddings_list: list[np.ndarray], k: int = 2) -> tuple[list[list[str]], np.ndarray]:
+        """
+        Finds the closest known faces to each query embedding
+
+        Arguments
+        - embeddings_list: query embeddings
+        - k: number of neighbours to retrieve per query embedding (capped by number of known faces)
+
+        Returns
+        - names of the closest known faces (closest first) for each query embedding
+        - cosine distances to those faces for each query embedding
+        """
+
+        with self.lock.read():
+            if not self.size:
+                return [[] for _ in embeddings_list], np.ones((len(embeddings_list), 0), dtype=np.float32)
+
+            neighbours, distances = self.vector_index.query(
+                embeddings_list, k=min(k, self.size)
+            )
+            names = [[self.name_list[idx] for idx in row] for row in neighbours]
+
+        return names, distances
+
+    def put_person(self, name: str, images: list[tuple[str, str]], replace: bool = False) -> PersonUpdate:
+        """
+        Adds a person to the gallery, or replaces their images, while cameras keep querying it.
+        The database is updated in one transaction and the live vector index incrementally, without rebuilding it.
+
+        Arguments
+        - name: name of the person
+        - images: image file name and path to the image file of each picture of the person
+        - replace: replace the images of a person already in the gallery, instead of adding a new person
+
+        Returns
+        - outcome of the update (the gallery is left unchanged if none of the images can be used)
+        """
+
+        with self.update_lock:
+            with get_db() as conn:
+                create_tables(conn)
+                cached_images = fetch_image_records(conn, name)
+                enrolled_names = fetch_names(conn)
+                enrolled = name in enrolled_names or bool(cached_images)
+
+            if enrolled and not replace:
+                raise ValueError(f"{name} is already in the gallery!")
+            if replace and not enrolled:
+                raise KeyError(name)
+
+            cache = {record["image"]: record for record in cached_images}
+            current: dict[str, ImageRecord] = {}
+            to_embed: list[tuple[str, str, str]] = []
+            failures: list[ImageFailure] = []
+
+            for img_name, img_fp in images:
+                img_hash = hash_file(img_fp, self.enroller.model_id)
+                record = cache.get(img_name)
+
+                if img_hash is None:
+                    failures.append({"name": name, "image": img_name, "reason": "Image file not found or unreadable"})
+                elif record is not None and record["hash"] == img_hash:
+                    current[img_name] = record
+                else:
+                    to_embed.append((img_name, img_fp, img_hash))
+
+            outcomes = self.enroller.embed_images([img_fp for _, img_fp, _ in to_embed])
+
+            new_images: list[ImageRecord] = []
+            for (img_name, _, img_hash), (embedding, reason) in zip(to_embed, outcomes):
+                record = {"name": name, "image": img_name, "hash": img_hash, "embedding": embedding, "error": reason}
+                new_images.append(record)
+                current[img_name] = record
+
+            failures += [
+                {"name": name, "image": img_name, "reason": record["error"]}
+                for img_name, record in current.items() if record["embedding"] is None
+            ]
+            embedding_list = [record["embedding"] for record in current.values() if record["embedding"] is not None]
+
+            update: PersonUpdate = {
+                "name": name,
+                "enrolled": bool(embedding_list),
+                "images": len(images),
+                "embedded": sum(record["embedding"] is not None for record in new_images),
+                "cached": len(current) - len(new_images),
+                "failures": failures,
+                "gallery_size": len(enrolled_names),
+            }
+
+            if not embedding_list:
+                return update
+
+            embedding = sum(embedding_list) / len(embedding_list)
+
+            with get_db() as conn:
+                sync_records(
+                    conn,
+                    new_images=new_images,
+                    removed_images=[(name, img_name) for img_name in cache if img_name not in current],
+                    people=[(name, embedding)],
+                    stale_names=[name],
+                )
+                if fetch_metadata(conn, "model") is None:
+                    save_metadata(conn, "model", self.enroller.model_id)
+                self._apply_change(conn, name, embedding)
+                update["gallery_size"] = len(fetch_names(conn))
+            log_info(f"{'Updated' if replace else 'Added'} {name} ({len(embedding_list)}/{len(images)} images usable)")
+
+            return update
+
+    def remove_person(self, name: str) -> None:
+        """
+        Removes a person from the gallery while cameras keep querying it
+
+        Arguments
+        - name: name of the person
+        """
+
+        with self.update_lock:
+            with get_db() as conn:
+                create_tables(conn)
+                cached_images = fetch_image_records(conn, name)
+                if name not in fetch_names(conn) and not cached_images:
+                    raise KeyError(name)
+
+                sync_records(
+                    conn,
+                    new_images=[],
+                    removed_images=[(name, record["image"]) for record in cached_images],
+                    people=[],
+                    stale_names=[name],
+                )
+                self._apply_change(conn, name, None)
+
+            log_info(f"Removed {name}")
+
+    def _apply_change(self, conn: sqlite3.Connection, name: str, embedding: np.ndarray | None) -> None:
+        """
+        Applies the change of a person in the database to the live vector index, and saves it as the snapshot of the database.
+        The vector index is rebuilt instead once most of its ids are removed ones.
+
+        Arguments
+        - conn: connection to SQLite database, already holding the change
+        - name: name of the person
+        - embedding: new average embedding of the person, None if they were removed
+        """
+
+        # The database is loaded as a whole when the gallery is next loaded
+        if not self.loaded:
+            return
+
+        checksum = fetch_checksum(conn)
+        num_removed = len(self.vector_index) - self.size + len(self.name_ids.get(name, []))
+
+        if num_removed > max(self.size, 100):
+            name_list, vector_index = self._build_index(*fetch_all_embeddings(conn))
+            self._save_snapshot(name_list, vector_index, checksum)
+            self._swap_index(name_list, vector_index)
+            return
+
+        with self.lock.write():
+            old_ids = self.name_ids.pop(name, [])
+            if old_ids:
+                self.vector_index.remove(old_ids)
+                for idx in old_ids:
+                    self.name_list[idx] = None
+                self.size -= len(old_ids)
+
+            if embedding is not None:
+                new_ids = self.vector_index.add(np.asarray(embedding, dtype=np.float32).reshape(1, -1))
+                self.name_list += [name] * len(new_ids)
+                self.name_ids[name] = new_ids
+                self.size += len(new_ids)
+
+        # Saved outside the write lock, as cameras only read the vector index and changes are serialised
+        self._save_snapshot(self.name_list, self.vector_index, checksum)
+
+    def _swap_index(self, name_list: list[str | None], vector_index: SearchBackend) -> None:
+        """
+        Replaces the vector index and name list
+
+        Arguments
+        - name_list: names of the people, in the order of their ids in the search backend (None for removed ids)
+        - vector_index: search backend
+        """
+
+        name_ids: dict[str, list[int]] = {}
+        for idx, name in enumerate(name_list):
+            if name is not None:
+                name_ids.setdefault(name, []).append(idx)
+
+        with self.lock.write():
+            self.name_list = name_list
+            self.vector_index = vector_index
+            self.name_ids = name_ids
+            self.size = sum(len(ids) for ids in name_ids.values())
+
+    def _build_index(self, name_list: list[str], embeddings: np.ndarray) -> tuple[list[str], SearchBackend]:
+        """
+        Builds the search backend from embeddings in bulk
+
+        Arguments
+        - name_list: names of the people
+        - embeddings: (N, 512) array of their average embeddings, in the same order
+
+        Returns
+        - names of the people, in the order of their ids in the search backend
+        - search backend
+        """
+
+        backend_cls = select_backend(self.backend, len(name_list), self.exact_max_size)
+
+        return name_list, backend_cls.build(embeddings)
+
+    def _load_snapshot(self, checksum: str) -> tuple[list[str | None], SearchBackend] | None:
+        """
+        Loads the saved search backend if it was built from the current contents of the database with the configured backend
+
+        Arguments
+        - checksum: checksum of the current contents of the database
+
+        Returns
+        - names of the people and search backend, None if there is no usable snapshot
+        """
+
+        if not os.path.exists(INDEX_META_FP):
+            return None
+
+        try:
+            with open(INDEX_META_FP, "r") as file:
+                meta = json.load(file)
+
+            num_people = sum(name is not None for name in meta["names"])
+            backend_cls = select_backend(self.backend, num_people, self.exact_max_size)
+            if meta["checksum"] != checksum or meta["backend"] != backend_cls.name:
+                return None
+
+            vector_index = backend_cls.load(INDEX_FP + backend_cls.extension)
+        except Exception as err:
+            log_info(f"Unable to load index snapshot: {err}")
+            return None
+
+        if len(vector_index) != len(meta["names"]):
+            return None
+
+        return meta["names"], vector_index
+
+    @staticmethod
+    def _save_snapshot(name_list: list[str | None], vector_index: SearchBackend, checksum: str) -> None:
+        """
+        Saves the search backend next to the database, so that it does not need to be rebuilt at the next start
+
+        Arguments
+        - name_list: names of the people, in the order of their ids in the search backend (None for removed ids)
+        - vector_index: search backend
+        - checksum: checksum of the contents of the database the search backend was built from
+        """
+
+        index_fp = INDEX_FP + vector_index.extension
+
+        # Written to temporary files first so that an interrupted save never leaves a snapshot that looks valid
+        try:
+            vector_index.save(index_fp + ".tmp")
+            with open(INDEX_META_FP + ".tmp", "w") as file:
+                json.dump({"checksum": checksum, "backend": vector_index.name, "names": name_list}, file)
+
+            os.replace(index_fp + ".tmp", index_fp)
+            os.replace(INDEX_META_FP + ".tmp", INDEX_META_FP)
+        except Exception as err:
+            log_info(f"Unable to save index snapshot: {err}")
+
+    def _fetch_embeddings(self) -> None:
+        """Load embeddings from the saved vector index, or from SQLite database if the saved index is stale"""
+
+        log_info("Loading embeddings...")
+
+        if self.loaded:
+            log_info("Embeddings already loaded!")
+            return None
+
+        with get_db() as conn:
+            create_tables(conn)
+            checksum = fetch_checksum(conn)
+            snapshot = self._load_snapshot(checksum)
+
+            # Embeddings of different models cannot be compared, so faces would not be recognised
+            model_id = fetch_metadata(conn, "model")
+            if model_id is not None and model_id != self.enroller.model_id:
+                log_info(
+                    f"Embeddings were formed with {model_id} but {self.enroller.model_id} is loaded, "
+                    "load them from the data file again to re-embed them"
+                )
+
+            if snapshot is None:
+                log_info("Index snapshot missing or stale, rebuilding from db...")
+                snapshot = self._build_index(*fetch_all_embeddings(conn))
+                self._save_snapshot(*snapshot, checksum)
+
+        self._swap_index(*snapshot)
+        self.loaded = True
+
+        log_info(f"Loaded {self.size} embeddings ({self.vector_index.name} search)")
+
+    def _form_embeddings(self, data_file: str) -> EnrolmentSummary:
+        """
+        Create embeddings for SQLite database from data provided
+        Only images that are new or whose content changed are embedded, and only the people affected have their average embedding recomputed
+
+        Arguments
+        - data_file: file path (relative to './data' folder) to json file linking names to pictures
+
+        Returns
+        - summary of the enrolment
+        """
+
+        if not data_file.endswith(".json"):
+            raise ValueError("Please provide a json file with the .json extension.")
+
+        data_file_path = os.path.join('data', data_file)
+
+        if not os.path.exists(data_file_path):
+            raise FileNotFoundError(f"{data_file_path} does not exists!")
+
+        with open(data_file_path, "r") as file:
+            data_dict = json.load(file)
+
+        img_folder_path = os.path.join('data', data_dict["img_folder_path"])
+
+        with get_db() as conn:
+            create_tables(conn)
+            cached_images = fetch_image_records(conn)
+            enrolled_names = fetch_names(conn)
+
+        log_info("Extracting embeddings from images...")
+        changes, summary = self.enroller.enrol(
+            img_folder_path, data_dict["details"], cached_images, enrolled_names
+        )
+
+        with get_db() as conn:
+            sync_records(conn, **changes)
+            save_metadata(conn, "model", self.enroller.model_id)
+            checksum = fetch_checksum(conn)
+            name_list, embeddings = fetch_all_embeddings(conn)
+
+        # Built separately so that cameras already running keep querying the previous index
+        name_list, vector_index = self._build_index(name_list, embeddings)
+        self._save_snapshot(name_list, vector_index, checksum)
+
+        self._swap_index(name_list, vector_index)
+        self.loaded = True
+
+        return summary
@@ -0,0 +1,264 @@
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
+
+from fr.InferenceScheduler import InferenceScheduler
+from utils import detect_faces, log_info
+
+# insightface is imported when the models are loaded, so that importing this module stays cheap
+if TYPE_CHECKING:
+    from insightface.app import FaceAnalysis
+    from insightface.app.common import Face
+
+
+class InferenceJob:
+    """Frame submitted by a camera, waiting for its faces to be detected and embedded"""
+
+    def __init__(
+        self,
+        cam_id: str,
+        img: np.ndarray,
+        select: Callable[[list["Face"]], list[bool]] | None = None,
+        det_size: int | None = None,
+        rois: list[list[float]] | None = None,
+    ) -> None:
+        self.cam_id = cam_id
+        self.img = img
+        self.select = select
+        self.det_size = det_size
+        self.rois = rois
+        self.faces: list["Face"] = []
+        self.timings: dict[str, float] = {}
+        self.error: Exception | None = None
+        self.done = threading.Event()
+
+
+class InferenceEngine:
+    """
+    Runs insightface for all cameras in one thread, with the detection and recognition stages split.
+    Faces are detected frame by frame, then the aligned face crops of every frame in the batch are embedded in a single recognition call.
+    """
+
+    def __init__(
+        self,
+        model: "FaceAnalysis",
+        scheduler: InferenceScheduler,
+        max_batch_frames: int = 8,
+        max_batch_faces: int = 64,
+    ) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - model: prepared insightface model (only its detection and recognition models are used)
+        - scheduler: decides which cameras are served first when more frames are waiting than a batch holds
+        - max_batch_frames: maximum number of frames (one per camera) per batch
+        - max_batch_faces: maximum number of face crops per recognition call
+        """
+
+        self.det_model = model.det_model
+        self.rec_model = model.models["recognition"]
+        self.scheduler = scheduler
+
+        self.max_batch_frames = max(1, max_batch_frames)
+        self.max_batch_faces = max(1, max_batch_faces)
+
+        self._cond = threading.Condition()
+        self._pending: dict[str, InferenceJob] = {}
+
+        self.stop_event = threading.Event()
+
+    def start(self) -> None:
+        """Starts the inference engine in a separate thread"""
+
+        self.stop_event = threading.Event()
+        self.engineThread = threading.Thread(target=self._loopBatches)
+        self.engineThread.daemon = True
+        self.engineThread.start()
+
+    def stop(self) -> None:
+        """Stops the inference engine"""
+
+        self.stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def infer(
+        self,
+        cam_id: str,
+        img: np.ndarray,
+        select: Callable[[list["Face"]], list[bool]] | None = None,
+        det_size: int | None = None,
+        rois: list[list[float]] | None = None,
+        timings: dict[str, float] | None = None,
+    ) -> list["Face"]:
+        """
+        Detects and embeds faces in a frame, blocking until the batch the frame is placed in has been run
+
+        Arguments
+        - cam_id: identifier of the camera the frame is from
+        - img: RGB image
+        - select: called (in the engine thread) with the detected faces, returns which of them to embed; all faces are embedded if None
+        - det_size: size (pixels) of the square the frame is resized into for detection, None for the model's default
+        - rois: regions of interest (xyxy, fraction of the frame) faces are detected in, None for the whole frame
+        - timings: filled in with the seconds taken by the "detect" and "embed" stages of the frame, if given
+
+        Returns
+        - detected faces (bbox, kps, det_score and embedding; embedding is None for faces not selected)
+        """
+
+        job = InferenceJob(cam_id, img, select, det_size, rois)
+
+        with self._cond:
+            if self.stop_event.is_set():
+                raise RuntimeError("Inference engine stopped")
+            self._pending[cam_id] = job
+            self._cond.notify()
+
+        job.done.wait()
+
+        if job.error is not None:
+            raise job.error
+
+        if timings is not None:
+            timings.update(job.timings)
+
+        return job.faces
+
+    def queue_depth(self) -> int:
+        """
+        Returns
+        - number of frames waiting to be placed in a batch
+        """
+
+        with self._cond:
+            return len(self._pending)
+
+    def _take_batch(self) -> list[InferenceJob]:
+        """
+        Waits for frames and takes up to max_batch_frames of them, in the order given by the scheduler
+
+        Returns
+        - frames to be run in the next batch
+        """
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or self.stop_event.is_set())
+
+            cam_ids = self.scheduler.order(list(self._pending), limit=self.max_batch_frames)
+            return [self._pending.pop(cam_id) for cam_id in cam_ids]
+
+    def _detect(self, job: InferenceJob) -> tuple[list["Face"], list[np.ndarray]]:
+        """
+        Detects faces in a frame and aligns those selected for recognition
+
+        Arguments
+        - job: frame to detect faces in; its faces are filled in (without embeddings)
+
+        Returns
+        - faces to be embedded
+        - aligned face crops, in the same order as the faces to be embedded
+        """
+
+        from insightface.app.common import Face
+        from insightface.utils import face_align
+
+        bboxes, kpss = detect_faces(self.det_model, job.img, job.det_size, job.rois)
+
+        for i in range(bboxes.shape[0]):
+            job.faces.append(Face(bbox=bboxes[i, 0:4], kps=kpss[i], det_score=bboxes[i, 4]))
+
+        selected = job.select(job.faces) if job.select is not None else [True] * len(job.faces)
+
+        faces, crops = [], []
+        for face, is_selected in zip(job.faces, selected):
+            if not is_selected:
+                continue
+
+            faces.append(face)
+            crops.append(face_align.norm_crop(
+                job.img, landmark=face.kps, image_size=self.rec_model.input_size[0]
+            ))
+
+        return faces, crops
+
+    def _embed(self, faces: list["Face"], crops: list[np.ndarray], owners: list[InferenceJob]) -> None:
+        """
+        Embeds face crops in batches and routes the embeddings back to their faces.
+        If a recognition call fails, only the frames with a crop in that call are failed.
+
+        Arguments
+        - faces: faces to be given embeddings
+        - crops: aligned face crops, in the same order as faces
+        - owners: frame each face was detected in, in the same order as faces
+        """
+
+        for start in range(0, len(crops), self.max_batch_faces):
+            end = start + self.max_batch_faces
+
+            try:
+                embeddings = self.rec_model.get_feat(crops[start:end])
+            except Exception as err:
+                log_info(f"Inference error (embedding): {err}")
+                for job in owners[start:end]:
+                    job.error = err
+                continue
+
+            for face, embedding in zip(faces[start:end], embeddings):
+                face.embedding = embedding
+
+    def _run_batch(self, jobs: list[InferenceJob]) -> None:
+        """
+        Detects faces in every frame, then embeds all of them together.
+        A frame that fails is failed on its own; the other frames in the batch carry on.
+
+        Arguments
+        - jobs: frames in the batch
+        """
+
+        faces, crops, owners = [], [], []
+
+        try:
+            for job in jobs:
+                detect_start = time.perf_counter()
+                try:
+                    job_faces, job_crops = self._detect(job)
+                except Exception as err:
+                    log_info(f"Inference error ({job.cam_id}): {err}")
+                    job.error = err
+                    continue
+
+                job.timings["detect"] = time.perf_counter() - detect_start
+                faces += job_faces
+                crops += job_crops
+                owners += [job] * len(job_faces)
+
+            # Every frame in the batch waits for the whole recognition call
+            embed_start = time.perf_counter()
+            self._embed(faces, crops, owners)
+            embed_time = time.perf_counter() - embed_start
+            for job in jobs:
+                job.timings["embed"] = embed_time
+
+        finally:
+            for job in jobs:
+                job.done.set()
+
+    def _loopBatches(self) -> None:
+        """Repeatedly runs batches of frames submitted by cameras"""
+
+        while not self.stop_event.is_set():
+            jobs = self._take_batch()
+            if jobs:
+                self._run_batch(jobs)
+
+        # Releases cameras still waiting on the engine
+        with self._cond:
+            jobs = list(self._pending.values())
+            self._pending.clear()
+
+        for job in jobs:
+            job.error = RuntimeError("Inference engine stopped")
+            job.done.set()
@@ -0,0 +1,89 @@
+import threading
+
+
+class InferenceScheduler:
+    """
+    Decides which cameras get their frames into the next inference batch when more cameras are waiting than a batch holds.
+    Cameras are served in smooth weighted round-robin order, so a camera with weight 2 gets twice the inferences of a camera with weight 1 when both are busy.
+    """
+
+    def __init__(self) -> None:
+        """Initialises the class"""
+
+        self._lock = threading.Lock()
+        self._weights: dict[str, int] = {}
+        self._credits: dict[str, int] = {}
+
+        self.grants: dict[str, int] = {}
+
+    def register(self, cam_id: str, weight: int = 1) -> None:
+        """
+        Adds a camera to the rotation
+
+        Arguments
+        - cam_id: camera identifier
+        - weight: relative share of inferences given to the camera
+        """
+
+        with self._lock:
+            self._weights[cam_id] = max(1, weight)
+            self._credits[cam_id] = 0
+            self.grants[cam_id] = 0
+
+    def unregister(self, cam_id: str) -> None:
+        """
+        Removes a camera from the rotation
+
+        Arguments
+        - cam_id: camera identifier
+        """
+
+        with self._lock:
+            self._weights.pop(cam_id, None)
+            self._credits.pop(cam_id, None)
+            self.grants.pop(cam_id, None)
+
+    def _pick(self, candidates: list[str]) -> str:
+        """
+        Picks the next camera to be served (smooth weighted round-robin); must be called with the lock held
+
+        Arguments
+        - candidates: cameras that have a frame waiting for inference
+
+        Returns
+        - the chosen camera
+        """
+
+        total = 0
+        for cam_id in candidates:
+            weight = self._weights.get(cam_id, 1)
+            self._credits[cam_id] = self._credits.get(cam_id, 0) + weight
+            total += weight
+
+        chosen = max(candidates, key=lambda cam_id: self._credits[cam_id])
+        self._credits[chosen] -= total
+
+        return chosen
+
+    def order(self, candidates: list[str], limit: int | None = None) -> list[str]:
+        """
+        Orders cameras by who should be served first, advancing the round-robin state
+
+        Arguments
+        - candidates: cameras that have a frame waiting for inference
+        - limit: maximum number of cameras to be served
+
+        Returns
+        - the cameras to be served, in the order they should be served
+        """
+
+        with self._lock:
+            remaining = list(candidates)
+            ordered = []
+            while remaining and (limit is None or len(ordered) < limit):
+                chosen = self._pick(remaining)
+                remaining.remove(chosen)
+                ordered.append(chosen)
+                self.grants[chosen] = self.grants.get(chosen, 0) + 1
+
+        return ordered
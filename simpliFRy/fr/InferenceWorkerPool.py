@@ -0,0 +1,498 @@
+import multiprocessing
+import multiprocessing.queues
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
+
+from fr.InferenceEngine import InferenceJob
+from fr.InferenceScheduler import InferenceScheduler
+from utils import detect_faces, forward_logs, get_worker_log_queue, load_model, log_info, warm_up
+from utils.onnx_runtime import RuntimeSettings
+
+if TYPE_CHECKING:
+    from insightface.app.common import Face
+
+
+def _worker_main(
+    conn: Connection,
+    log_queue: multiprocessing.queues.Queue,
+    shm_name: str,
+    slot_bytes: int,
+    runtime_settings: RuntimeSettings,
+    num_threads: int,
+    cpu_cores: list[int] | None,
+) -> None:
+    """
+    Entry point of a worker process: detects and embeds faces in frames placed in shared memory by the web process
+
+    Arguments
+    - conn: pipe to the web process
+    - log_queue: queue the worker's log records are forwarded on, to be written by the web process
+    - shm_name: name of the shared memory block holding the frame slots
+    - slot_bytes: size of each frame slot
+    - runtime_settings: ONNX Runtime settings
+    - num_threads: number of threads per ONNX Runtime session
+    - cpu_cores: cores the worker (and the threads of its sessions) is pinned to, None to not pin it
+    """
+
+    forward_logs(log_queue)
+
+    from insightface.utils import face_align
+
+    shm = SharedMemory(name=shm_name)
+
+    try:
+        # Pinned before the sessions start their threads, which inherit the affinity
+        if cpu_cores:
+            os.sched_setaffinity(0, cpu_cores)
+
+        model = load_model(runtime_settings, num_threads)
+        warm_up(model)
+    except Exception as err:
+        conn.send(("error", f"Unable to load model: {err}"))
+        shm.close()
+        return
+
+    det_model = model.det_model
+    rec_model = model.models["recognition"]
+    conn.send(("ready", None))
+
+    def run(
+        slot: int, shape: tuple[int, ...], selective: bool, det_size: int | None, rois: list[list[float]] | None
+    ) -> None:
+        img = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+
+        detect_start = time.perf_counter()
+        bboxes, kpss = detect_faces(det_model, img, det_size, rois)
+        timings = {"detect": time.perf_counter() - detect_start}
+
+        if selective:
+            conn.send(("detected", (bboxes, kpss)))
+            selected = conn.recv()
+        else:
+            selected = [True] * bboxes.shape[0]
+
+        embed_start = time.perf_counter()
+        crops = [
+            face_align.norm_crop(img, landmark=kpss[i], image_size=rec_model.input_size[0])
+            for i in range(bboxes.shape[0]) if selected[i]
+        ]
+        embeddings = rec_model.get_feat(crops) if crops else np.empty((0, 512), dtype=np.float32)
+        timings["embed"] = time.perf_counter() - embed_start
+
+        conn.send(("embedded", (bboxes, kpss, embeddings, timings)))
+
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+
+        try:
+            run(*msg)
+        except Exception as err:
+            conn.send(("error", repr(err)))
+
+    shm.close()
+
+
+class InferenceWorkerPool:
+    """
+    Runs insightface for all cameras in a pool of worker processes, so that detection and recognition (including their Python pre- and post-processing) are not serialised by the GIL of the web process.
+    Cameras copy their frames into a ring of frame slots in shared memory; each frame is sent to an idle worker, which holds its own models and reads the frame straight from shared memory.
+    A worker that exits (e.g. killed for running out of memory) fails the frame it was running and is restarted, up to a number of times per worker.
+    Drop-in replacement for InferenceEngine.
+    """
+
+    # Entry point of the worker processes
+    worker_main = staticmethod(_worker_main)
+
+    def __init__(
+        self,
+        scheduler: InferenceScheduler,
+        num_workers: int,
+        runtime_settings: RuntimeSettings,
+        num_slots: int = 8,
+        max_frame_shape: tuple[int, int, int] = (1080, 1920, 3),
+        pin_workers: bool = False,
+        max_restarts: int = 3,
+    ) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - scheduler: decides which cameras are served first when more frames are waiting than there are idle workers
+        - num_workers: number of worker processes
+        - runtime_settings: ONNX Runtime settings of the workers' sessions (threads per session default to the worker's share of the cores)
+        - num_slots: number of frame slots in shared memory (frames waiting or being inferred at once)
+        - max_frame_shape: shape of the largest frame that fits in a slot
+        - pin_workers: pin each worker to its own share of the cores, so that workers never compete for a core
+        - max_restarts: number of times each worker is restarted after exiting unexpectedly, after which it is given up on
+        """
+
+        self.scheduler = scheduler
+        self.num_workers = max(1, num_workers)
+        self.runtime_settings = runtime_settings
+        self.num_slots = max(1, num_slots)
+        self.slot_bytes = int(np.prod(max_frame_shape))
+        self.pin_workers = pin_workers and hasattr(os, "sched_setaffinity")
+        self.max_restarts = max(0, max_restarts)
+
+        self.core_budgets = self._core_budgets()
+        self.num_threads = runtime_settings["intra_op_threads"] or len(self.core_budgets[0])
+
+        self._cond = threading.Condition()
+        self._pending: dict[str, tuple[InferenceJob, int]] = {}
+        self._idle: list[int] = []
+
+        # Workers that loaded and warmed up their models, restarts of workers that exited, and workers given up on
+        self.ready_workers = 0
+        self.restarts = 0
+        self.lost_workers = 0
+
+        self.stop_event = threading.Event()
+
+    def _core_budgets(self) -> list[list[int]]:
+        """
+        Divides the cores this process may run on evenly between the workers
+
+        Returns
+        - cores of each worker (shared round robin when there are more workers than cores)
+        """
+
+        if hasattr(os, "sched_getaffinity"):
+            cores = sorted(os.sched_getaffinity(0))
+        else:
+            cores = list(range(os.cpu_count() or 1))
+
+        per_worker = max(1, len(cores) // self.num_workers)
+
+        return [
+            [cores[(worker_idx * per_worker + offset) % len(cores)] for offset in range(per_worker)]
+            for worker_idx in range(self.num_workers)
+        ]
+
+    def start(self) -> None:
+        """Starts the worker processes and the threads handing frames to them"""
+
+        self.stop_event = threading.Event()
+        self._idle = []
+        self.ready_workers = 0
+        self.restarts = 0
+        self.lost_workers = 0
+
+        self.shm = SharedMemory(create=True, size=self.slot_bytes * self.num_slots)
+        self._free_slots: queue.Queue[int] = queue.Queue()
+        for slot in range(self.num_slots):
+            self._free_slots.put(slot)
+
+        # Spawned rather than forked, as the web process already runs threads (and possibly CUDA)
+        self._context = multiprocessing.get_context("spawn")
+
+        self._processes: list[multiprocessing.Process | None] = [None] * self.num_workers
+        self._assignments: list[queue.Queue] = [queue.Queue() for _ in range(self.num_workers)]
+
+        for worker_idx in range(self.num_workers):
+            workerThread = threading.Thread(target=self._loopWorker, args=(worker_idx,))
+            workerThread.daemon = True
+            workerThread.start()
+
+        self.dispatchThread = threading.Thread(target=self._loopDispatch)
+        self.dispatchThread.daemon = True
+        self.dispatchThread.start()
+
+    def stop(self) -> None:
+        """Stops the worker processes and releases the shared memory"""
+
+        self.stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+        for assignments in self._assignments:
+            assignments.put(None)
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout=5)
+
+        try:
+            self.shm.close()
+        except BufferError:
+            # A camera is still copying a frame in; the memory is freed once it lets go
+            pass
+        self.shm.unlink()
+
+    def infer(
+        self,
+        cam_id: str,
+        img: np.ndarray,
+        select: Callable[[list["Face"]], list[bool]] | None = None,
+        det_size: int | None = None,
+        rois: list[list[float]] | None = None,
+        timings: dict[str, float] | None = None,
+    ) -> list["Face"]:
+        """
+        Detects and embeds faces in a frame, blocking until a worker has run it
+
+        Arguments
+        - cam_id: identifier of the camera the frame is from
+        - img: RGB image
+        - select: called with the detected faces, returns which of them to embed; all faces are embedded if None
+        - det_size: size (pixels) of the square the frame is resized into for detection, None for the model's default
+        - rois: regions of interest (xyxy, fraction of the frame) faces are detected in, None for the whole frame
+        - timings: filled in with the seconds taken by the "detect" and "embed" stages of the frame, if given
+
+        Returns
+        - detected faces (bbox, kps, det_score and embedding; embedding is None for faces not selected)
+        """
+
+        if img.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of shape {img.shape} does not fit in a frame slot")
+
+        slot = None
+        while slot is None:
+            if self.stop_event.is_set():
+                raise RuntimeError("Inference engine stopped")
+            try:
+                slot = self._free_slots.get(timeout=0.5)
+            except queue.Empty:
+                pass
+
+        try:
+            np.ndarray(img.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)[...] = img
+
+            job = InferenceJob(cam_id, img, select, det_size, rois)
+
+            with self._cond:
+                if self.stop_event.is_set():
+                    raise RuntimeError("Inference engine stopped")
+                self._pending[cam_id] = (job, slot)
+                self._cond.notify_all()
+
+            job.done.wait()
+        finally:
+            self._free_slots.put(slot)
+
+        if job.error is not None:
+            raise job.error
+
+        if timings is not None:
+            timings.update(job.timings)
+
+        return job.faces
+
+    def queue_depth(self) -> int:
+        """
+        Returns
+        - number of frames waiting for an idle worker
+        """
+
+        with self._cond:
+            return len(self._pending)
+
+    def _loopDispatch(self) -> None:
+        """Hands waiting frames to idle workers, in the order given by the scheduler"""
+
+        while not self.stop_event.is_set():
+            with self._cond:
+                self._cond.wait_for(lambda: (self._pending and self._idle) or self.stop_event.is_set())
+                if self.stop_event.is_set():
+                    break
+
+                cam_ids = self.scheduler.order(list(self._pending), limit=len(self._idle))
+                for cam_id in cam_ids:
+                    self._assignments[self._idle.pop()].put(self._pending.pop(cam_id))
+
+        # Releases cameras still waiting on the pool
+        with self._cond:
+            pending = list(self._pending.values())
+            self._pending.clear()
+
+        for job, _ in pending:
+            job.error = RuntimeError("Inference engine stopped")
+            job.done.set()
+
+    def _run_job(self, conn: Connection, job: InferenceJob, slot: int) -> None:
+        """
+        Runs a frame on a worker
+
+        Arguments
+        - conn: pipe to the worker
+        - job: frame to be run; its faces are filled in
+        - slot: frame slot holding the frame
+        """
+
+        from insightface.app.common import Face
+
+        conn.send((slot, job.img.shape, job.select is not None, job.det_size, job.rois))
+        status, payload = conn.recv()
+
+        if status == "detected":
+            bboxes, kpss = payload
+            faces = [
+                Face(bbox=bboxes[i, 0:4], kps=kpss[i], det_score=bboxes[i, 4]) for i in range(bboxes.shape[0])
+            ]
+
+            # The worker waits for a selection before it can carry on, even if selecting fails
+            select_error = None
+            try:
+                selected = [bool(is_selected) for is_selected in job.select(faces)]
+            except Exception as err:
+                selected, select_error = [False] * len(faces), err
+
+            conn.send(selected)
+            status, payload = conn.recv()
+
+            if select_error is not None:
+                raise select_error
+
+        if status == "error":
+            raise RuntimeError(payload)
+
+        bboxes, kpss, embeddings, job.timings = payload
+        selected_idxs = [i for i in range(bboxes.shape[0]) if job.select is None or selected[i]]
+
+        job.faces = [
+            Face(bbox=bboxes[i, 0:4], kps=kpss[i], det_score=bboxes[i, 4]) for i in range(bboxes.shape[0])
+        ]
+        for i, embedding in zip(selected_idxs, embeddings):
+            job.faces[i].embedding = embedding
+
+    def _spawn_worker(self, worker_idx: int) -> Connection:
+        """
+        Starts (or restarts) a worker process
+
+        Arguments
+        - worker_idx: index of the worker
+
+        Returns
+        - pipe to the worker
+        """
+
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=self.worker_main,
+            args=(
+                child_conn,
+                get_worker_log_queue(),
+                self.shm.name,
+                self.slot_bytes,
+                self.runtime_settings,
+                self.num_threads,
+                self.core_budgets[worker_idx] if self.pin_workers else None,
+            ),
+            daemon=True,
+        )
+        process.start()
+
+        # Only the worker holds its end, so that the pipe reports EOF once the worker exits
+        child_conn.close()
+        self._processes[worker_idx] = process
+
+        return parent_conn
+
+    def _worker_lost(self) -> None:
+        """Stops the pool once every worker has been given up on, so that cameras do not wait forever"""
+
+        with self._cond:
+            self.lost_workers += 1
+            if self.lost_workers < self.num_workers:
+                return
+
+            log_info("All inference workers lost, stopping inference")
+            self.stop_event.set()
+            self._cond.notify_all()
+
+    def _loopWorker(self, worker_idx: int) -> None:
+        """
+        Starts a worker and runs the frames assigned to it, restarting the worker whenever it exits unexpectedly (up to max_restarts times)
+
+        Arguments
+        - worker_idx: index of the worker
+        """
+
+        restarts = 0
+
+        while not self.stop_event.is_set():
+            conn = self._spawn_worker(worker_idx)
+            outcome = self._serve(worker_idx, conn)
+
+            conn.close()
+            self._processes[worker_idx].join(timeout=5)
+
+            if outcome == "stopped" or self.stop_event.is_set():
+                return
+
+            # A worker whose models failed to load would fail again
+            if outcome == "failed" or restarts >= self.max_restarts:
+                log_info(f"Inference worker {worker_idx} given up on")
+                self._worker_lost()
+                return
+
+            restarts += 1
+            with self._cond:
+                self.restarts += 1
+            log_info(f"Restarting inference worker {worker_idx} (restart {restarts} of {self.max_restarts})")
+
+    def _serve(self, worker_idx: int, conn: Connection) -> str:
+        """
+        Runs the frames assigned to a worker, one at a time, until the pool is stopped or the worker exits
+
+        Arguments
+        - worker_idx: index of the worker
+        - conn: pipe to the worker
+
+        Returns
+        - "stopped" if the pool was stopped, "failed" if the worker could not load its models, "exited" if the worker exited
+        """
+
+        assignments = self._assignments[worker_idx]
+
+        try:
+            status, payload = conn.recv()
+        except (EOFError, OSError):
+            status, payload = "exited", "Worker exited"
+
+        if status != "ready":
+            log_info(f"Inference worker {worker_idx} failed to start: {payload}")
+            return "exited" if status == "exited" else "failed"
+
+        log_info(f"Inference worker {worker_idx} ready")
+        with self._cond:
+            self.ready_workers += 1
+
+        while True:
+            with self._cond:
+                self._idle.append(worker_idx)
+                self._cond.notify_all()
+
+            assignment = assignments.get()
+            if assignment is None:
+                break
+
+            job, slot = assignment
+            try:
+                self._run_job(conn, job, slot)
+            except (EOFError, OSError) as err:
+                log_info(f"Inference worker {worker_idx} exited: {err}")
+                job.error = RuntimeError("Inference worker exited")
+
+                with self._cond:
+                    self.ready_workers -= 1
+                return "exited"
+            except Exception as err:
+                log_info(f"Inference error: {err}")
+                job.error = err
+            finally:
+                job.done.set()
+
+        try:
+            conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+
+        return "stopped"
@@ -0,0 +1,86 @@
+import time
+
+import cv2
+import numpy as np
+
+from utils import frame_to_gray
+
+
+class MotionDetector:
+    """
+    Cheap change detector used to skip FR inference on static scenes.
+    Compares a small, blurred grayscale copy of each frame against the last frame that was let through.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.01,
+        refresh: float = 5.0,
+        width: int = 160,
+        pixel_threshold: int = 25,
+        pix_fmt: str = "bgr24",
+    ) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - threshold: minimum fraction of pixels that must change for a frame to be considered changed
+        - refresh: maximum time (seconds) between frames let through, even if the scene is static
+        - width: width (pixels) frames are downscaled to before comparing
+        - pixel_threshold: minimum difference in grayscale value (0 to 255) for a pixel to be considered changed
+        - pix_fmt: pixel format of the frames
+        """
+
+        self.threshold = threshold
+        self.refresh = refresh
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.pix_fmt = pix_fmt
+
+        self._reference: np.ndarray | None = None
+        self._reference_time = 0.0
+
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Shrinks a frame to a small blurred grayscale image
+
+        Arguments
+        - frame: decoded frame
+
+        Returns
+        - downscaled grayscale frame
+        """
+
+        height, width = frame.shape[:2]
+        small = cv2.resize(
+            frame, (self.width, max(1, height * self.width // width)), interpolation=cv2.INTER_AREA
+        )
+        gray = frame_to_gray(small, self.pix_fmt)
+        return cv2.GaussianBlur(gray, (3, 3), 0)
+
+    def has_changed(self, frame: np.ndarray) -> bool:
+        """
+        Check if a frame differs enough from the last frame let through; if so it becomes the new reference
+
+        Arguments
+        - frame: BGR frame
+
+        Returns
+        - True if the frame should be inferred, False if the scene is static
+        """
+
+        small = self._downscale(frame)
+        curr_time = time.monotonic()
+
+        changed = (
+            self._reference is None
+            or self._reference.shape != small.shape
+            or curr_time - self._reference_time > self.refresh
+            or np.count_nonzero(cv2.absdiff(small, self._reference) > self.pixel_threshold) > self.threshold * small.size
+        )
+
+        if changed:
+            self._reference = small
+            self._reference_time = curr_time
+
+        return changed
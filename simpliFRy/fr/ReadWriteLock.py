@@ -0,0 +1,53 @@
+import threading
+from contextlib import contextmanager
+from typing import Generator
+
+
+class ReadWriteLock:
+    """
+    Lock held by any number of readers at once, or by a single writer.
+    Writers are preferred: once a writer is waiting, new readers wait for it, so that a steady stream of readers cannot starve it.
+    """
+
+    def __init__(self) -> None:
+        """Initialises the class"""
+
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self) -> Generator[None, any, any]:
+        """Holds the lock as a reader for the duration of the context"""
+
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Generator[None, any, any]:
+        """Holds the lock as the only writer for the duration of the context"""
+
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+
+from utils import calc_iou_matrix
+
+
+class RecentDetections:
+    """
+    Array-backed store of the last detection of each recently recognised person, used by the persistor mechanic.
+    Bounding boxes, normalised embeddings and last seen times are held in arrays (one row per person), so that every face of a frame is matched against every recent detection in a few NumPy operations.
+    """
+
+    def __init__(self) -> None:
+        """Initialises the class"""
+
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.slots
+
+    def clear(self) -> None:
+        """Forget all recent detections"""
+
+        self.names: list[str] = []
+        self.slots: dict[str, int] = {}
+        self.bboxes = np.empty((0, 4), dtype=np.float32)
+        self.norm_embeds = np.empty((0, 512), dtype=np.float32)
+        self.last_seen = np.empty(0, dtype=np.float64)
+
+    def match(
+        self, bboxes: np.ndarray, norm_embeds: np.ndarray, threshold_iou: float
+    ) -> tuple[list[str | None], np.ndarray]:
+        """
+        Finds the most similar recent detection overlapping each face
+
+        Arguments
+        - bboxes: (M, 4) array of bounding boxes of the faces in xyxy format
+        - norm_embeds: (M, 512) array of normalised embeddings of the faces
+        - threshold_iou: minimum intersection-over-union of a face with a recent detection for them to be compared
+
+        Returns
+        - name of the most similar overlapping recent detection of each face, None if no recent detection overlaps it
+        - cosine similarity of each face to that recent detection
+        """
+
+        num_faces = len(bboxes)
+        if not self.names or not num_faces:
+            return [None] * num_faces, np.zeros(num_faces, dtype=np.float32)
+
+        ious = calc_iou_matrix(bboxes, self.bboxes)
+        similarities = np.where(ious >= threshold_iou, norm_embeds @ self.norm_embeds.T, -np.inf)
+
+        best_slots = similarities.argmax(axis=1)
+        best_similarities = similarities[np.arange(num_faces), best_slots]
+
+        names = [
+            self.names[slot] if np.isfinite(similarity) else None
+            for slot, similarity in zip(best_slots, best_similarities)
+        ]
+
+        return names, best_similarities
+
+    def update(
+        self, names: list[str], bboxes: np.ndarray, norm_embeds: np.ndarray, holding_time: float
+    ) -> list[str]:
+        """
+        Replaces the recent detections with those of the latest frame, keeping earlier detections of people not in the latest frame for the holding time
+
+        Arguments
+        - names: names of the people recognised in the latest frame
+        - bboxes: (M, 4) array of their bounding boxes in xyxy format
+        - norm_embeds: (M, 512) array of their normalised embeddings
+        - holding_time: number of seconds a person is kept after they were last recognised
+
+        Returns
+        - names of those recently recognised (within holding time) but not recognised in the latest frame
+        """
+
+        curr_time = time.monotonic()
+
+        # A person recognised more than once in a frame keeps their last detection
+        latest = list({name: idx for idx, name in enumerate(names)}.values())
+
+        fresh_slots = np.flatnonzero(curr_time - self.last_seen <= holding_time)
+        latest_names = set(names)
+        preserved = [slot for slot in fresh_slots if self.names[slot] not in latest_names]
+
+        preserved_names = [self.names[slot] for slot in preserved]
+
+        self.names = [names[idx] for idx in latest] + preserved_names
+        self.slots = {name: slot for slot, name in enumerate(self.names)}
+        self.bboxes = np.concatenate([
+            np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)[latest], self.bboxes[preserved]
+        ])
+        self.norm_embeds = np.concatenate([
+            np.asarray(norm_embeds, dtype=np.float32).reshape(-1, 512)[latest], self.norm_embeds[preserved]
+        ])
+        self.last_seen = np.concatenate([np.full(len(latest), curr_time), self.last_seen[preserved]])
+
+        return preserved_names
@@ -0,0 +1,77 @@
+import json
+import threading
+from typing import Generator
+
+
+class ResultPublisher:
+    """
+    Versioned holder of the latest FR results of a camera.
+    Results are serialised once per version and the same payload is handed to every subscriber, which only wakes up when a new version is published.
+    """
+
+    def __init__(self) -> None:
+        """Initialises the class"""
+
+        self._cond = threading.Condition()
+
+        self.results = []
+        self.payload = json.dumps({"data": []}) + '\n'
+        self.version = 0
+        self.closed = False
+
+    def publish(self, results: list[dict]) -> bool:
+        """
+        Publishes the latest FR results, waking subscribers if they differ from the previous results
+
+        Arguments
+        - results: latest FR results
+
+        Returns
+        - True if a new version was published, False if the results are unchanged
+        """
+
+        payload = json.dumps({"data": results}) + '\n'
+
+        with self._cond:
+            self.results = results
+            if payload == self.payload:
+                return False
+
+            self.payload = payload
+            self.version += 1
+            self._cond.notify_all()
+
+        return True
+
+    def close(self) -> None:
+        """Ends all subscriptions"""
+
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def subscribe(self, timeout: float = 1.0) -> Generator[str, None, None]:
+        """
+        Subscribes to FR results
+
+        Arguments
+        - timeout: interval (seconds) at which a waiting subscriber checks if the publisher has been closed
+
+        Returns
+        - Generator yielding the serialised results (one JSON line) each time a new version is published, starting with the current version
+        """
+
+        last_version = -1
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.version != last_version or self.closed, timeout)
+
+                if self.closed:
+                    return
+                if self.version == last_version:
+                    continue
+
+                last_version, payload = self.version, self.payload
+
+            yield payload
@@ -0,0 +1,264 @@
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+# voyager is imported once a voyager index is built or loaded, so that importing this module stays cheap
+if TYPE_CHECKING:
+    from voyager import Index
+
+
+class SearchBackend(ABC):
+    """
+    Abstract base class for nearest neighbour search over the embeddings of known faces, by cosine distance.
+    Ids returned by a query are the positions of the embeddings the backend was built from, followed by those added since; removed ids are never returned.
+    """
+
+    name = ""
+    extension = ""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of ids assigned, including removed ones"""
+
+    @classmethod
+    @abstractmethod
+    def build(cls, embeddings: np.ndarray) -> "SearchBackend":
+        """
+        Builds the backend from embeddings in bulk
+
+        Arguments
+        - embeddings: (N, 512) array of embeddings
+
+        Returns
+        - backend holding the embeddings
+        """
+
+    @classmethod
+    @abstractmethod
+    def load(cls, fp: str) -> "SearchBackend":
+        """
+        Loads a backend saved with `save`
+
+        Arguments
+        - fp: file path
+
+        Returns
+        - backend holding the saved embeddings
+        """
+
+    @abstractmethod
+    def save(self, fp: str) -> None:
+        """
+        Saves the backend to a file
+
+        Arguments
+        - fp: file path
+        """
+
+    @abstractmethod
+    def add(self, embeddings: np.ndarray) -> list[int]:
+        """
+        Adds embeddings to the backend
+
+        Arguments
+        - embeddings: (N, 512) array of embeddings
+
+        Returns
+        - ids assigned to the embeddings, in the same order
+        """
+
+    @abstractmethod
+    def remove(self, ids: list[int]) -> None:
+        """
+        Removes embeddings from the backend, so that they are no longer returned by queries (their ids are not reused)
+
+        Arguments
+        - ids: ids of the embeddings
+        """
+
+    @abstractmethod
+    def query(self, embeddings_list: list[np.ndarray], k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the closest embeddings to each query embedding
+
+        Arguments
+        - embeddings_list: query embeddings
+        - k: number of neighbours to retrieve per query embedding (at most the number of embeddings not removed)
+
+        Returns
+        - (Q, k) array of ids of the closest embeddings (closest first)
+        - (Q, k) array of cosine distances to those embeddings
+        """
+
+
+class VoyagerBackend(SearchBackend):
+    """
+    Approximate search with a voyager HNSW index, for large galleries
+    """
+
+    name = "voyager"
+    extension = ".voyager"
+
+    def __init__(self, vector_index: "Index") -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - vector_index: voyager index with cosine space
+        """
+
+        self.vector_index = vector_index
+
+    def __len__(self) -> int:
+        return len(self.vector_index)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray) -> "VoyagerBackend":
+        from voyager import Index, Space
+
+        vector_index = Index(Space.Cosine, num_dimensions=512)
+        if len(embeddings):
+            vector_index.add_items(embeddings)
+
+        return cls(vector_index)
+
+    @classmethod
+    def load(cls, fp: str) -> "VoyagerBackend":
+        from voyager import Index
+
+        return cls(Index.load(fp))
+
+    def save(self, fp: str) -> None:
+        self.vector_index.save(fp)
+
+    def add(self, embeddings: np.ndarray) -> list[int]:
+        return list(self.vector_index.add_items(embeddings))
+
+    def remove(self, ids: list[int]) -> None:
+        # Marked entries stay in the graph (so it stays connected) but are skipped by queries
+        for idx in ids:
+            self.vector_index.mark_deleted(idx)
+
+    def query(self, embeddings_list: list[np.ndarray], k: int) -> tuple[np.ndarray, np.ndarray]:
+        return self.vector_index.query(embeddings_list, k=k)
+
+
+class ExactBackend(SearchBackend):
+    """
+    Exact search with a single matrix multiplication against the normalised gallery matrix, for small galleries
+    """
+
+    name = "exact"
+    extension = ".npy"
+
+    def __init__(self, matrix: np.ndarray) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - matrix: (N, 512) float32 array of L2 normalised embeddings (rows of zeros are removed embeddings)
+        """
+
+        self.matrix = matrix
+
+        # Rows of removed embeddings, found on the first query so that loading does not read the matrix
+        self.removed: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @staticmethod
+    def _normalise(embeddings: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray) -> "ExactBackend":
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, 512)
+        return cls(np.ascontiguousarray(cls._normalise(embeddings)))
+
+    @classmethod
+    def load(cls, fp: str) -> "ExactBackend":
+        # Memory-mapped, so that loading does not read the whole matrix up front
+        return cls(np.load(fp, mmap_mode="r"))
+
+    def save(self, fp: str) -> None:
+        with open(fp, "wb") as file:
+            np.save(file, self.matrix)
+
+    def _removed_rows(self) -> np.ndarray:
+        if self.removed is None:
+            self.removed = ~np.any(self.matrix, axis=1)
+
+        return self.removed
+
+    def add(self, embeddings: np.ndarray) -> list[int]:
+        embeddings = self._normalise(np.asarray(embeddings, dtype=np.float32).reshape(-1, 512))
+        removed = self._removed_rows()
+
+        start = self.matrix.shape[0]
+        self.matrix = np.concatenate([self.matrix, embeddings])
+        self.removed = np.concatenate([removed, np.zeros(len(embeddings), dtype=bool)])
+
+        return list(range(start, self.matrix.shape[0]))
+
+    def remove(self, ids: list[int]) -> None:
+        removed = self._removed_rows()
+
+        # Loaded snapshots are memory-mapped read-only
+        if not self.matrix.flags.writeable:
+            self.matrix = np.array(self.matrix)
+
+        self.matrix[ids] = 0
+        removed[ids] = True
+
+    def query(self, embeddings_list: list[np.ndarray], k: int) -> tuple[np.ndarray, np.ndarray]:
+        queries = self._normalise(np.asarray(embeddings_list, dtype=np.float32).reshape(-1, 512))
+        similarities = queries @ self.matrix.T
+
+        removed = self._removed_rows()
+        if removed.any():
+            similarities[:, removed] = -np.inf
+
+        k = min(k, similarities.shape[1])
+        if k < similarities.shape[1]:
+            ids = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            ids = np.broadcast_to(np.arange(k), similarities.shape).copy()
+
+        top_similarities = np.take_along_axis(similarities, ids, axis=1)
+        order = np.argsort(-top_similarities, axis=1)
+
+        ids = np.take_along_axis(ids, order, axis=1)
+        distances = 1 - np.take_along_axis(top_similarities, order, axis=1)
+
+        return ids, distances
+
+
+BACKENDS: dict[str, type[SearchBackend]] = {
+    VoyagerBackend.name: VoyagerBackend,
+    ExactBackend.name: ExactBackend,
+}
+
+
+def select_backend(backend: str, gallery_size: int, exact_max_size: int) -> type[SearchBackend]:
+    """
+    Selects the search backend to use for a gallery
+
+    Arguments
+    - backend: "exact", "voyager" or "auto"
+    - gallery_size: number of embeddings in the gallery
+    - exact_max_size: largest gallery searched exactly when backend is "auto"
+
+    Returns
+    - class of the search backend
+    """
+
+    if backend == "auto":
+        return ExactBackend if gallery_size <= exact_max_size else VoyagerBackend
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown search backend: {backend}")
+
+    return BACKENDS[backend]
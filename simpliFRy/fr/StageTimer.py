@@ -0,0 +1,154 @@
+import bisect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Generator, TypedDict
+
+import numpy as np
+
+
+class StageLatency(TypedDict):
+    """Latency percentiles (milliseconds) of a pipeline stage over the recent window, and its running totals"""
+
+    count: int
+    total_s: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+class StageHistogram(TypedDict):
+    """Cumulative count of durations of a pipeline stage up to each bucket bound (seconds), and running totals"""
+
+    buckets: list[tuple[float, int]]
+    count: int
+    total_s: float
+
+
+# Upper bounds (seconds) of the histogram buckets, from sub-millisecond searches to multi-second stalls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class StageTimer:
+    """
+    Records how long each stage of the FR pipeline of a camera takes (decode, detect, embed, search, post-process, serialise).
+    Each stage keeps a window of its latest durations, from which latency percentiles are reported, a histogram over all its durations, and running totals.
+    """
+
+    def __init__(self, window: int = 1000, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - window: number of latest durations of each stage kept for percentiles
+        - buckets: upper bounds (seconds, ascending) of the histogram buckets
+        """
+
+        self.window = window
+        self.buckets = buckets
+
+        self._lock = threading.Lock()
+        self._durations: dict[str, deque[float]] = {}
+        self._bucket_counts: dict[str, list[int]] = {}
+        self._counts: dict[str, int] = {}
+        self._totals: dict[str, float] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        """
+        Records one duration of a stage
+
+        Arguments
+        - stage: name of the stage
+        - seconds: how long the stage took
+        """
+
+        with self._lock:
+            if stage not in self._durations:
+                self._durations[stage] = deque(maxlen=self.window)
+                self._bucket_counts[stage] = [0] * (len(self.buckets) + 1)
+                self._counts[stage] = 0
+                self._totals[stage] = 0.0
+
+            self._durations[stage].append(seconds)
+            self._bucket_counts[stage][bisect.bisect_left(self.buckets, seconds)] += 1
+            self._counts[stage] += 1
+            self._totals[stage] += seconds
+
+    @contextmanager
+    def measure(self, stage: str) -> Generator[None, None, None]:
+        """
+        Records how long the body of a with statement takes as one duration of a stage
+
+        Arguments
+        - stage: name of the stage
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def clear(self) -> None:
+        """Forgets all durations and totals"""
+
+        with self._lock:
+            self._durations.clear()
+            self._bucket_counts.clear()
+            self._counts.clear()
+            self._totals.clear()
+
+    def latencies(self) -> dict[str, StageLatency]:
+        """
+        Reports the latency of every stage recorded so far
+
+        Returns
+        - latency percentiles over the recent window and running totals, by stage
+        """
+
+        with self._lock:
+            snapshot = {
+                stage: (np.array(durations), self._counts[stage], self._totals[stage])
+                for stage, durations in self._durations.items()
+            }
+
+        latencies: dict[str, StageLatency] = {}
+        for stage, (durations, count, total) in snapshot.items():
+            p50, p90, p99 = np.percentile(durations, [50, 90, 99]) * 1000
+            latencies[stage] = {
+                "count": count,
+                "total_s": total,
+                "p50_ms": float(p50),
+                "p90_ms": float(p90),
+                "p99_ms": float(p99),
+                "max_ms": float(durations.max() * 1000),
+            }
+
+        return latencies
+
+    def histograms(self) -> dict[str, StageHistogram]:
+        """
+        Reports the distribution of durations of every stage recorded so far
+
+        Returns
+        - cumulative bucket counts (the last bucket bound is infinity) and running totals, by stage
+        """
+
+        with self._lock:
+            snapshot = {
+                stage: (list(bucket_counts), self._counts[stage], self._totals[stage])
+                for stage, bucket_counts in self._bucket_counts.items()
+            }
+
+        histograms: dict[str, StageHistogram] = {}
+        for stage, (bucket_counts, count, total) in snapshot.items():
+            cumulative = np.cumsum(bucket_counts).tolist()
+            histograms[stage] = {
+                "buckets": list(zip([*self.buckets, float("inf")], cumulative)),
+                "count": count,
+                "total_s": total,
+            }
+
+        return histograms
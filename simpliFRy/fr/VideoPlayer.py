@@ -1,31 +1,109 @@
+import array
+import os
+import re
+import select
 import subprocess
 import threading
 import time
-from typing import Generator
+from typing import BinaryIO, Generator
 
-import cv2
 import numpy as np
 
-from utils import log_info
+try:
+    import fcntl
+    import termios
+except ImportError:  # Not available on Windows, where pipes keep their default size
+    fcntl = None
+    termios = None
+
+from fr.BroadcastHub import BroadcastHub
+from fr.FrameBuffer import FrameBuffer
+from fr.StageTimer import StageTimer
+from utils import PIXEL_FORMAT_CHANNELS, log_info
+
+
+# fcntl commands resizing a pipe and reading its size (Linux)
+F_SETPIPE_SZ = 1031
+F_GETPIPE_SZ = 1032
+
+# Seconds the next frame may take to start arriving after a frame is read for it to count as already decoded,
+# when frames are too large for the pipe to hold a whole one (far shorter than the interval between frames of a live stream)
+NEXT_FRAME_WAIT = 0.005
+
+# URL scheme of a network stream (rtsp://, rtmp://, http(s)://, udp://, srt://, ...)
+URL_SCHEME = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*://")
 
 
 class VideoPlayer:
     """
-    Class for streaming video from ffmpeg
+    Class for streaming video from ffmpeg.
+    A live stream that drops or stalls is reconnected with exponential backoff, without ending the session.
     """
 
-    def __init__(self) -> None:
-        """Initialises the class"""
+    def __init__(
+        self,
+        width: int = 1280,
+        height: int = 720,
+        fps: float = 0,
+        pix_fmt: str = "bgr24",
+        decode_threads: int = 0,
+        broadcast_width: int = 0,
+        broadcast_quality: int = 90,
+        broadcast_fps: float = 15,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+        stall_timeout: float = 10.0,
+    ) -> None:
+        """
+        Initialises the class
 
-        # For modifiables
-        self.vid_lock = threading.Lock()
+        Arguments
+        - width: width (pixels) the input video is scaled to
+        - height: height (pixels) the input video is scaled to
+        - fps: frame rate ffmpeg decimates the input video to, 0 to keep every frame
+        - pix_fmt: raw pixel format ffmpeg decodes frames into ("bgr24", "rgb24" or "gray")
+        - decode_threads: number of threads ffmpeg decodes with, 0 to let ffmpeg decide
+        - broadcast_width: width (pixels) of the /vidFeed frames, 0 to keep the width of the input video
+        - broadcast_quality: JPEG quality (0 to 100) of the /vidFeed frames
+        - broadcast_fps: maximum number of frames sent per second to each /vidFeed viewer, 0 for no limit
+        - reconnect_delay: seconds before ffmpeg is restarted after a live stream drops (doubled after each failed attempt)
+        - max_reconnect_delay: maximum seconds between attempts to reconnect
+        - stall_timeout: seconds without a frame after which a live stream is treated as dropped, 0 to wait indefinitely
+        """
 
         # Thread event
         self.end_event = threading.Event()
 
-        # Set resolution of input video
-        self.width = 1280
-        self.height = 720
+        # Set resolution, frame rate and pixel format of input video (scaling and decimation are done by ffmpeg)
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.pix_fmt = pix_fmt
+        self.channels = PIXEL_FORMAT_CHANNELS[pix_fmt]
+        self.decode_threads = decode_threads
+
+        # Raw frames shared with inference; JPEG is only encoded while there are /vidFeed viewers
+        self.broadcast_width = broadcast_width
+        self.broadcast_quality = broadcast_quality
+        self.broadcast_fps = broadcast_fps
+        self.frame_buffer = FrameBuffer(self.width, self.height, self.channels)
+        self.broadcast_hub = self._create_broadcast_hub()
+
+        # Time taken by each stage of the pipeline
+        self.stage_timer = StageTimer()
+
+        # For reconnecting live streams
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.stall_timeout = stall_timeout
+        self.connected = False
+        self.reconnects = 0
+        self._ffmpeg_process: subprocess.Popen | None = None
+        self._ffmpeg_started_at = 0.0
+
+        # Time (monotonic) the latest frame was read, and frames skipped as a newer frame was already waiting
+        self.last_frame_time: float | None = None
+        self.stale_dropped = 0
 
         # Printing
         self.in_error = False
@@ -49,67 +127,337 @@ class VideoPlayer:
     def _handle_stream_end(self) -> None:
         log_info("ENDING FFMPEG SUBPROCESS")
         self.is_started = False
+        self.broadcast_hub.close()
 
-    def _handleRTSP(self, stream_src:str) -> None:
+    def _ffmpeg_command(self, stream_src: str) -> list[str]:
         """
-        Opens ffmpeg subprocess and processes the frame to bytes
-        
+        Builds the ffmpeg command decoding a video stream into raw frames on stdout
+
         Arguments
-        - stream_src: url to RTSP video stream or source to VCC
+        - stream_src: url to RTSP video stream, source to VCC or path to a local video file
+
+        Returns
+        - ffmpeg command line
         """
 
-        command = [
+        stream_src = stream_src.strip()
+
+        # Force TCP (for testing); RTSP options are rejected by ffmpeg for other inputs, such as local video files
+        input_options = ["-rtsp_transport", "tcp"] if stream_src.startswith("rtsp") else []
+
+        # Decode live streams as soon as packets arrive instead of buffering them
+        if self._is_live(stream_src):
+            input_options += ["-fflags", "nobuffer", "-flags", "low_delay"]
+
+        if self.decode_threads:
+            input_options += ["-threads", str(self.decode_threads)]
+
+        # Frames are dropped before scaling, so that dropped frames are never scaled or piped
+        filters = [f"fps={self.fps:g}"] if self.fps else []
+        filters.append(f"scale={self.width}:{self.height}")
+
+        return [
             "ffmpeg",
-            "-rtsp_transport", "tcp", # Force TCP (for testing)
-            "-i", stream_src.strip(),
+            *input_options,
+            "-i", stream_src,
             "-vsync", "0",
             "-copyts",
             "-an",
             "-sn",
+            "-vf", ",".join(filters),
             "-f", "rawvideo",  # Video format is raw video
-            "-s", "1280x720",
-            "-pix_fmt", "bgr24",  # bgr24 pixel format matches OpenCV default pixels format.
+            "-pix_fmt", self.pix_fmt,  # bgr24 matches OpenCV default pixels format, rgb24 the insightface models'.
             "-probesize", "32",
             "-analyzeduration", "0",
-            "-fflags", "nobuffer",
-            "-flags", "low_delay",
             "-tune", "zerolatency",
             "-b:v", "500k",
             "-buffer_size", "1000k",
             "-",
         ]
 
+    @staticmethod
+    def _is_live(stream_src: str) -> bool:
+        """
+        Checks if a stream source is live (reconnected when it drops), rather than a local video file (ended when it ends)
+
+        Arguments
+        - stream_src: url to RTSP video stream, source to VCC or path to a local video file
+
+        Returns
+        - True if the source is a URL
+        """
+
+        return URL_SCHEME.match(stream_src.strip()) is not None
+
+    @staticmethod
+    def check_source(stream_src: str) -> None:
+        """
+        Checks that a stream source can be streamed, raising ValueError if it cannot.
+        A local video file (anything that is not a URL) must exist, as it is not reconnected when ffmpeg fails to open it.
+
+        Arguments
+        - stream_src: url to RTSP video stream, source to VCC or path to a local video file
+        """
+
+        stream_src = stream_src.strip()
+        if not stream_src:
+            raise ValueError("No stream source given")
+
+        if not VideoPlayer._is_live(stream_src) and not os.path.isfile(stream_src):
+            raise ValueError(f"Video file not found: {stream_src}")
+
+    def _handleRTSP(self, stream_src: str) -> None:
+        """
+        Supervises the ffmpeg subprocess, restarting it with exponential backoff whenever a live stream drops or stalls, until the stream is ended.
+        Inference keeps waiting for frames while the stream reconnects.
+
+        Arguments
+        - stream_src: url to RTSP video stream, source to VCC or path to a local video file
+        """
+
+        command = self._ffmpeg_command(stream_src)
+        is_live = self._is_live(stream_src)
+        delay = self.reconnect_delay
+
+        watchdogThread = threading.Thread(target=self._loopWatchdog)
+        watchdogThread.daemon = True
+        watchdogThread.start()
+
+        while not self.end_event.is_set():
+            frames_read = self._run_ffmpeg(command, is_live)
+
+            if self.end_event.is_set():
+                break
+
+            if not is_live:
+                log_info("Video file ended")
+                break
+
+            # Backoff starts over once a connection has delivered frames
+            if frames_read:
+                delay = self.reconnect_delay
+
+            self.reconnects += 1
+            log_info(f"Stream lost, reconnecting in {delay:.1f}s (reconnect {self.reconnects})")
+
+            if self.end_event.wait(delay):
+                break
+
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+        self.end_event.set()
+        self._handle_stream_end()
+
+    def _run_ffmpeg(self, command: list[str], is_live: bool = True) -> int:
+        """
+        Runs an ffmpeg subprocess and publishes its frames until it stops delivering them or the stream is ended.
+        Frames the reader fell behind on are skipped, so that the published frame is never older than the newest one ffmpeg has decoded.
+
+        Arguments
+        - command: ffmpeg command line
+        - is_live: whether the source is a live stream; a local file (which ffmpeg decodes faster than real time) skips at most
+          one frame per frame published, so that frames keep being published
+
+        Returns
+        - number of frames published
+        """
+
         try:
-            ffmpeg_process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            # Unbuffered, so frames are read straight from the pipe into the frame buffer
+            ffmpeg_process = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0
+            )
         except Exception as e:
-            log_info("An error occured:", e)
-            self._handle_stream_end()
+            log_info(f"An error occured: {e}")
+            return 0
 
-        while not self.end_event.is_set():
-            # Read width*height*3 bytes from stdout (1 frame)
-            raw_frame = ffmpeg_process.stdout.read(self.width * self.height * 3)
+        self._ffmpeg_started_at = time.monotonic()
+        self._ffmpeg_process = ffmpeg_process
 
-            # If error, ends ffmpeg subprocess
-            if len(raw_frame) != (self.width * self.height * 3):
-                self.end_event.set()
-                continue
+        stdout = ffmpeg_process.stdout
+        pipe_size = self._resize_pipe(stdout.fileno(), self.frame_buffer.frame_size)
+        max_skips = None if is_live else 1
 
-            # Convert the bytes read into a NumPy array, and reshape it to video frame dimensions
-            frame = np.frombuffer(raw_frame, np.uint8).reshape(
-                (self.height, self.width, 3)
+        if pipe_size and pipe_size < self.frame_buffer.frame_size:
+            log_info(
+                f"Pipe holds {pipe_size} of the {self.frame_buffer.frame_size} bytes of a frame, "
+                f"so frames starting to arrive within {NEXT_FRAME_WAIT * 1000:.0f}ms of the last are taken as already decoded"
             )
-            _, buffer = cv2.imencode(".jpg", frame)
 
-            with self.vid_lock:
-                self.frame_bytes = buffer.tobytes()
+        frames_read = 0
+
+        try:
+            while not self.end_event.is_set():
+                # Read width*height*3 bytes from stdout (1 frame) straight into a preallocated frame
+                frame = self.frame_buffer.begin_write()
+
+                read_start = time.perf_counter()
+                if not VideoPlayer._read_frame(stdout, frame):
+                    self.frame_buffer.abort_write()
+                    break
+
+                # Frames already waiting behind this one mean the reader fell behind, so skip to the newest
+                stale = False
+                skips = 0
+                while (max_skips is None or skips < max_skips) and self._newer_frame_waiting(stdout.fileno(), pipe_size):
+                    if not VideoPlayer._read_frame(stdout, frame):
+                        stale = True
+                        break
+                    self.stale_dropped += 1
+                    skips += 1
+
+                if stale:
+                    self.frame_buffer.abort_write()
+                    break
+
+                # Includes waiting for a live stream to deliver the frame
+                self.stage_timer.record("decode", time.perf_counter() - read_start)
+                self.frame_buffer.commit_write()
 
-        else:
-            self._handle_stream_end()
+                self.last_frame_time = time.monotonic()
+                self.connected = True
+                frames_read += 1
+        finally:
+            self.connected = False
+            self._ffmpeg_process = None
 
-            #ffmpeg_process.stdout.close()  # Closing stdout terminates FFmpeg sub-process.
             ffmpeg_process.terminate()
             ffmpeg_process.wait()  # Wait for FFmpeg sub-process to finish
-            exit(0)
+
+        return frames_read
+
+    def _loopWatchdog(self) -> None:
+        """Repeatedly checks that ffmpeg is delivering frames, killing it when it stalls so that the stream is reconnected"""
+
+        while not self.end_event.wait(1.0):
+            ffmpeg_process = self._ffmpeg_process
+            if ffmpeg_process is None or not self.stall_timeout:
+                continue
+
+            last_activity = max(self.last_frame_time or 0.0, self._ffmpeg_started_at)
+            if time.monotonic() - last_activity > self.stall_timeout:
+                log_info(f"No frame for {self.stall_timeout:.0f}s, restarting ffmpeg")
+                ffmpeg_process.kill()
+
+        # Unblocks a read waiting on a stalled stream
+        ffmpeg_process = self._ffmpeg_process
+        if ffmpeg_process is not None:
+            ffmpeg_process.kill()
+
+    def _newer_frame_waiting(self, fd: int, pipe_size: int) -> bool:
+        """
+        Checks if ffmpeg had already decoded the frame after the one just read, meaning the reader fell behind.
+        A whole frame waiting in the pipe settles it; when the pipe cannot hold a whole frame (1280x720 bgr24 is 2.6 MiB,
+        the default pipe-max-size 1 MiB), ffmpeg is instead taken to have decoded the next frame if it starts to arrive straight away.
+
+        Arguments
+        - fd: file descriptor of the pipe
+        - pipe_size: size of the pipe (bytes), 0 if unknown
+
+        Returns
+        - True if a newer frame is waiting, False if unknown
+        """
+
+        frame_size = self.frame_buffer.frame_size
+
+        if pipe_size >= frame_size:
+            return self._pending_bytes(fd) >= frame_size
+
+        if fcntl is None:
+            return False
+
+        try:
+            readable, _, _ = select.select([fd], [], [], NEXT_FRAME_WAIT)
+        except (OSError, ValueError):
+            return False
+
+        return bool(readable)
+
+    @staticmethod
+    def _resize_pipe(fd: int, frame_size: int) -> int:
+        """
+        Enlarges a pipe to hold two frames where possible (up to /proc/sys/fs/pipe-max-size, 1 MiB by default),
+        so that ffmpeg is not held up by a frame being read and frames waiting can be detected
+
+        Arguments
+        - fd: file descriptor of the pipe
+        - frame_size: size of a frame (bytes)
+
+        Returns
+        - size of the pipe (bytes), 0 if unknown
+        """
+
+        if fcntl is None:
+            return 0
+
+        try:
+            with open("/proc/sys/fs/pipe-max-size", "r") as file:
+                max_size = int(file.read())
+            fcntl.fcntl(fd, F_SETPIPE_SZ, min(2 * frame_size, max_size))
+        except (OSError, ValueError):
+            pass
+
+        try:
+            return fcntl.fcntl(fd, F_GETPIPE_SZ)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _pending_bytes(fd: int) -> int:
+        """
+        Number of bytes waiting to be read from a pipe
+
+        Arguments
+        - fd: file descriptor of the pipe
+
+        Returns
+        - number of bytes, 0 if unknown
+        """
+
+        if fcntl is None:
+            return 0
+
+        try:
+            buf = array.array("i", [0])
+            fcntl.ioctl(fd, termios.FIONREAD, buf, True)
+            return buf[0]
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _read_frame(stream: BinaryIO, frame: np.ndarray) -> bool:
+        """
+        Reads exactly one frame from a stream into a preallocated array
+
+        Arguments
+        - stream: stdout pipe of ffmpeg subprocess
+        - frame: C-contiguous array to be filled in place
+
+        Returns
+        - True if a whole frame was read, False if the stream ended midway
+        """
+
+        view = memoryview(frame.reshape(-1))
+        filled = 0
+
+        while filled < len(view):
+            num_read = stream.readinto(view[filled:])
+            if not num_read:
+                return False
+            filled += num_read
+
+        return True
+
+    def _create_broadcast_hub(self) -> BroadcastHub:
+        """Creates the MJPEG broadcast hub for the current frame buffer"""
+
+        return BroadcastHub(
+            self.frame_buffer,
+            width=self.broadcast_width,
+            quality=self.broadcast_quality,
+            max_fps=self.broadcast_fps,
+            pix_fmt=self.pix_fmt,
+        )
 
     def cleanup(self, sig, f) -> None:
         """Sets event to trigger termination of ffmpeg subprocess"""
@@ -130,6 +478,12 @@ class VideoPlayer:
 
         self.is_started = True
         self.end_event = threading.Event()
+        self.frame_buffer = FrameBuffer(self.width, self.height, self.channels)
+        self.broadcast_hub = self._create_broadcast_hub()
+        self.stage_timer.clear()
+        self.reconnects = 0
+        self.stale_dropped = 0
+        self.last_frame_time = None
         self.streamThread = threading.Thread(target=self._handleRTSP, args=(stream_src,))
         self.streamThread.daemon = True
         self.streamThread.start()
@@ -151,10 +505,4 @@ class VideoPlayer:
         - Generator yielding video frames proccessed from ffmpeg
         """
 
-        while self.streamThread.is_alive():
-            with self.vid_lock:
-                frame_bytes = self.frame_bytes
-            yield (
-                b"--frame\r\n"
-                b"Content-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n"
-            )
\ No newline at end of file
+        yield from self.broadcast_hub.subscribe(self.streamThread.is_alive)
\ No newline at end of file
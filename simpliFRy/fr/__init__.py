@@ -1,4 +1,6 @@
+from fr.FrameBuffer import FrameBuffer
 from fr.VideoPlayer import VideoPlayer
-from fr.FRVidPlayer import FRVidPlayer
+from fr.FRVidPlayer import FRVidPlayer, DEFAULT_STREAM_SETTINGS, CAPTURE_PROFILES
+from fr.CameraRegistry import CameraRegistry, DEFAULT_CAM_ID
 
-__all__ = ['VideoPlayer', 'FRVidPlayer']
\ No newline at end of file
+__all__ = ['FrameBuffer', 'VideoPlayer', 'FRVidPlayer', 'DEFAULT_STREAM_SETTINGS', 'CAPTURE_PROFILES', 'CameraRegistry', 'DEFAULT_CAM_ID']
\ No newline at end of file
@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Generator
+
+# Applied to every connection: write-ahead logging lets readers carry on while a writer commits, and syncing at checkpoints only is safe in WAL mode
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA mmap_size = 268435456",
+]
+
+
+class ConnectionPool:
+    """
+    Class keeping connections to a SQLite database open between uses, each used by one thread at a time.
+    Connections are not tied to the thread that opened them, so they are reused across Flask's per-request threads.
+    """
+
+    def __init__(self, db_fp: str, max_idle: int = 4) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - db_fp: file path to the SQLite database
+        - max_idle: maximum number of connections kept open while not in use (more are closed when returned)
+        """
+
+        self.db_fp = db_fp
+        self.max_idle = max_idle
+
+        self._idle: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        """Opens and tunes a connection, which may be used from any thread (though by one at a time)"""
+
+        conn = sqlite3.connect(self.db_fp, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+
+        return conn
+
+    @contextmanager
+    def connection(self) -> Generator[sqlite3.Connection, any, any]:
+        """
+        Provides a connection for the duration of the context, returning it to the pool afterwards
+
+        Returns
+        - A generator yielding an idle connection, or a new one if none is idle
+        """
+
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+
+        if conn is None:
+            conn = self._open()
+
+        try:
+            yield conn
+        finally:
+            # A transaction left open would hold its locks while the connection is idle
+            if conn.in_transaction:
+                conn.rollback()
+
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(conn)
+                    conn = None
+
+            if conn is not None:
+                conn.close()
+
+    def close(self) -> None:
+        """Closes the idle connections"""
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for conn in idle:
+            conn.close()
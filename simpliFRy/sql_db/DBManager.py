@@ -1,17 +1,24 @@
+import hashlib
+import os
 import sqlite3
+import threading
 from contextlib import contextmanager
 from typing import Generator, TypedDict
 
 import numpy as np
 
+from sql_db.ConnectionPool import ConnectionPool
 from utils import log_info
 
 DB_FP = "Embeddings.db"
 
 
-class PersonRecord(TypedDict):
+class ImageRecord(TypedDict):
     name: str
-    ave_embedding: np.ndarray
+    image: str
+    hash: str
+    embedding: np.ndarray | None
+    error: str | None
 
 
 def adapt_array(arr: np.ndarray) -> bytes:
@@ -26,35 +33,72 @@ def convert_array(blob):
     return np.frombuffer(blob, dtype=np.float32)
 
 
+# Register adapters to handle numpy arrays as BLOBs
+sqlite3.register_adapter(np.ndarray, adapt_array)
+sqlite3.register_converter("NP_ARRAY", convert_array)
+
+# Pools of open connections, one per database file
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_fp: str) -> ConnectionPool:
+    """
+    Provides the pool of connections to a SQLite database, creating it on first use
+
+    Arguments
+    - db_fp: file path to the SQLite database
+
+    Returns
+    - pool of connections to the SQLite database, shared by all threads
+    """
+
+    # Keyed by absolute path, as the working directory may change between calls
+    db_fp = os.path.abspath(db_fp)
+
+    with _pools_lock:
+        if db_fp not in _pools:
+            _pools[db_fp] = ConnectionPool(db_fp)
+
+        return _pools[db_fp]
+
+
 @contextmanager
 def get_db() -> Generator[sqlite3.Connection, any, any]:
     """
     Provides the connection to SQLite database
 
     Returns
-    - A generator yielding the connection to the SQLite database storing embeddings for FR
+    - A generator yielding a pooled connection to the SQLite database storing embeddings for FR
     """
 
-    # Register adapters to handle numpy arrays as BLOBs
-    sqlite3.register_adapter(np.ndarray, adapt_array)
-    sqlite3.register_converter("NP_ARRAY", convert_array)
+    with get_pool(DB_FP).connection() as conn:
+        try:
+            yield conn
+        except sqlite3.Error as err:
+            conn.rollback()
+            log_info(f"Error connecting to database: {err}")
+            raise
 
-    conn = sqlite3.connect(DB_FP, detect_types=sqlite3.PARSE_DECLTYPES)
 
-    try:
-        yield conn
-    except sqlite3.Error as err:
-        log_info(f"Error connecting to database: {err}")
-    finally:
-        conn.close()
+def _bump_revision(conn: sqlite3.Connection) -> None:
+    """
+    Increments the revision number of the database within the current transaction, marking snapshots of the embeddings as stale
+
+    Arguments
+    - conn: connection to SQLite database
+    """
+
+    revision = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.execute(f"PRAGMA user_version = {revision + 1}")
 
 
-def recreate_table(conn: sqlite3.Connection) -> None:
+def create_tables(conn: sqlite3.Connection) -> None:
     """
-    Delete all current records and create table storing embeddings if it does not exist
+    Create tables storing embeddings (per person and per source image) and details of how they were formed if they do not exist
 
     Arguments
-    - conn: connection to SQLite database 
+    - conn: connection to SQLite database
     """
 
     cursor = conn.cursor()
@@ -65,41 +109,178 @@ def recreate_table(conn: sqlite3.Connection) -> None:
             embedding NP_ARRAY NOT NULL
        )
     """)
-    cursor.execute("DELETE FROM Embeddings")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ImageEmbeddings (
+            name TEXT NOT NULL,
+            image TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            embedding NP_ARRAY,
+            error TEXT,
+            PRIMARY KEY (name, image)
+       )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Metadata (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+       )
+    """)
     conn.commit()
-    log_info("DATABASE RESETTED")
 
 
-def save_record(conn: sqlite3.Connection, name: str, ave_embedding: np.ndarray) -> None:
+def fetch_all_embeddings(conn: sqlite3.Connection) -> tuple[list[str], np.ndarray]:
     """
-    Adds a person to the SQLite database (name and embedding representation of face)
+    Fetch all embeddings from SQLite database in a single pass, as one matrix
 
     Arguments
     - conn: connection to SQLite database
-    - name: name of person
-    - ave_embedding: embedding representation of face (average from all images of the person)
+
+    Returns
+    - names of the people, in order of their ids
+    - contiguous (N, 512) float32 array of their embeddings, in the same order
     """
 
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO Embeddings (name, embedding) VALUES (?, ?)", (name, ave_embedding)
-    )
-    conn.commit()
+    # Cast so that the rows are returned as raw bytes instead of being converted into an array each
+    rows = conn.execute(
+        "SELECT name, CAST(embedding AS BLOB) FROM Embeddings ORDER BY id"
+    ).fetchall()
+
+    names = [row[0] for row in rows]
+    embeddings = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(-1, 512)
 
+    return names, embeddings
 
-def fetch_records(conn: sqlite3.Connection) -> list[PersonRecord]:
+
+def fetch_image_records(conn: sqlite3.Connection, name: str | None = None) -> list[ImageRecord]:
     """
-    Fetch all embeddings from SQLite database and returns them in a python dictionary
+    Fetch the embedding and content hash of every enrolled source image
 
     Arguments
     - conn: connection to SQLite database
+    - name: only fetch the source images of this person, None for everyone
 
     Returns
-    - A list of python dictionaries; each dictionary stores the name and embedding representation of the face of an individual
+    - A list of python dictionaries; each dictionary stores the name of the person, the image file name, the content hash of the image, and its embedding (or the reason it has none)
     """
 
+    query = "SELECT name, image, hash, embedding, error FROM ImageEmbeddings"
+    params: tuple = ()
+
+    if name is not None:
+        query += " WHERE name = ?"
+        params = (name,)
+
     cursor = conn.cursor()
-    cursor.execute("SELECT name, embedding FROM Embeddings")
+    cursor.execute(query, params)
     results = cursor.fetchall()
 
-    return [{"name": result[0], "ave_embedding": result[1]} for result in results]
+    return [
+        {"name": result[0], "image": result[1], "hash": result[2], "embedding": result[3], "error": result[4]}
+        for result in results
+    ]
+
+
+def sync_records(
+    conn: sqlite3.Connection,
+    new_images: list[ImageRecord],
+    removed_images: list[tuple[str, str]],
+    people: list[tuple[str, np.ndarray]],
+    stale_names: list[str],
+) -> None:
+    """
+    Applies the changes of an incremental enrolment in a single transaction
+
+    Arguments
+    - conn: connection to SQLite database
+    - new_images: source images that are new or whose content changed
+    - removed_images: name and image file name of source images that are no longer enrolled (or whose content changed)
+    - people: name and average embedding of each person whose images changed
+    - stale_names: names whose average embeddings are to be deleted (people whose images changed, and people removed)
+    """
+
+    with conn:
+        conn.executemany(
+            "DELETE FROM ImageEmbeddings WHERE name = ? AND image = ?", removed_images
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO ImageEmbeddings (name, image, hash, embedding, error) VALUES (?, ?, ?, ?, ?)",
+            [
+                (record["name"], record["image"], record["hash"], record["embedding"], record["error"])
+                for record in new_images
+            ],
+        )
+        conn.executemany(
+            "DELETE FROM Embeddings WHERE name = ?", [(name,) for name in stale_names]
+        )
+        conn.executemany(
+            "INSERT INTO Embeddings (name, embedding) VALUES (?, ?)", people
+        )
+        _bump_revision(conn)
+
+
+def fetch_names(conn: sqlite3.Connection) -> list[str]:
+    """
+    Fetch the names of everyone with an embedding in the SQLite database
+
+    Arguments
+    - conn: connection to SQLite database
+
+    Returns
+    - A list of distinct names
+    """
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT name FROM Embeddings")
+
+    return [result[0] for result in cursor.fetchall()]
+
+
+def fetch_checksum(conn: sqlite3.Connection) -> str:
+    """
+    Computes a checksum of the embeddings in the SQLite database, which changes whenever they are modified
+
+    Arguments
+    - conn: connection to SQLite database
+
+    Returns
+    - hex digest of the revision number of the database and the id and name of every embedding
+    """
+
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(str(conn.execute("PRAGMA user_version").fetchone()[0]).encode())
+
+    for row_id, name in conn.execute("SELECT id, name FROM Embeddings ORDER BY id"):
+        hasher.update(f"{row_id}:{name}\n".encode())
+
+    return hasher.hexdigest()
+
+
+def fetch_metadata(conn: sqlite3.Connection, key: str) -> str | None:
+    """
+    Fetch a detail of how the embeddings in the SQLite database were formed
+
+    Arguments
+    - conn: connection to SQLite database
+    - key: name of the detail (e.g. model)
+
+    Returns
+    - value of the detail, None if it was never saved
+    """
+
+    row = conn.execute("SELECT value FROM Metadata WHERE key = ?", (key,)).fetchone()
+
+    return row[0] if row is not None else None
+
+
+def save_metadata(conn: sqlite3.Connection, key: str, value: str) -> None:
+    """
+    Saves a detail of how the embeddings in the SQLite database were formed
+
+    Arguments
+    - conn: connection to SQLite database
+    - key: name of the detail (e.g. model)
+    - value: value of the detail
+    """
+
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO Metadata (key, value) VALUES (?, ?)", (key, value))
@@ -0,0 +1,162 @@
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Generator, TypedDict
+
+from sql_db.DBManager import get_pool
+from utils import log_info
+
+# Kept in the data folder (volume mounted in docker) so that the history outlives the container
+DETECTIONS_DB_FP = os.path.join("data", "Detections.db")
+
+
+class DetectionRecord(TypedDict):
+    time: float
+    camera: str
+    name: str
+    score: float
+    bbox: list[float] | None
+
+
+class AttendanceRecord(TypedDict):
+    name: str
+    first_seen: float
+    last_seen: float
+    detections: int
+
+
+@contextmanager
+def get_detections_db() -> Generator[sqlite3.Connection, any, any]:
+    """
+    Provides the connection to the SQLite database storing detections (in write-ahead logging mode, so that queries are not blocked by the batch writer)
+
+    Returns
+    - A generator yielding a pooled connection to the SQLite database storing detections
+    """
+
+    os.makedirs(os.path.dirname(DETECTIONS_DB_FP), exist_ok=True)
+
+    with get_pool(DETECTIONS_DB_FP).connection() as conn:
+        try:
+            yield conn
+        except sqlite3.Error as err:
+            conn.rollback()
+            log_info(f"Error connecting to detections database: {err}")
+            raise
+
+
+def create_detections_table(conn: sqlite3.Connection) -> None:
+    """
+    Create table storing detections, indexed by time and by name, if it does not exist
+
+    Arguments
+    - conn: connection to SQLite database
+    """
+
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Detections (
+            id INTEGER PRIMARY KEY,
+            time REAL NOT NULL,
+            camera TEXT NOT NULL,
+            name TEXT NOT NULL,
+            score REAL NOT NULL,
+            bbox TEXT
+       )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS DetectionsByTime ON Detections (time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS DetectionsByName ON Detections (name, time)")
+    conn.commit()
+
+
+def save_detections(conn: sqlite3.Connection, records: list[DetectionRecord]) -> None:
+    """
+    Adds many detections to the SQLite database in a single transaction
+
+    Arguments
+    - conn: connection to SQLite database
+    - records: time (unix timestamp), camera, name, score and bounding box of each detection
+    """
+
+    with conn:
+        conn.executemany(
+            "INSERT INTO Detections (time, camera, name, score, bbox) VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    record["time"],
+                    record["camera"],
+                    record["name"],
+                    record["score"],
+                    json.dumps(record["bbox"]) if record["bbox"] is not None else None,
+                )
+                for record in records
+            ],
+        )
+
+
+def fetch_attendance(
+    conn: sqlite3.Connection, start: float, end: float, camera: str | None = None
+) -> list[AttendanceRecord]:
+    """
+    Fetch when each person was first and last seen in a time window
+
+    Arguments
+    - conn: connection to SQLite database
+    - start: start of the time window (unix timestamp)
+    - end: end of the time window (unix timestamp)
+    - camera: only count detections from this camera, None for all cameras
+
+    Returns
+    - A list of python dictionaries, in order of first sighting; each dictionary stores the name of a person, the times they were first and last seen, and their number of detections
+    """
+
+    query = "SELECT name, MIN(time), MAX(time), COUNT(*) FROM Detections WHERE time BETWEEN ? AND ?"
+    params: list = [start, end]
+
+    if camera is not None:
+        query += " AND camera = ?"
+        params.append(camera)
+
+    cursor = conn.cursor()
+    cursor.execute(query + " GROUP BY name ORDER BY MIN(time)", params)
+
+    return [
+        {"name": result[0], "first_seen": result[1], "last_seen": result[2], "detections": result[3]}
+        for result in cursor.fetchall()
+    ]
+
+
+def fetch_detections(
+    conn: sqlite3.Connection, name: str, start: float, end: float, limit: int = 1000
+) -> list[DetectionRecord]:
+    """
+    Fetch the detections of a person in a time window
+
+    Arguments
+    - conn: connection to SQLite database
+    - name: name of the person
+    - start: start of the time window (unix timestamp)
+    - end: end of the time window (unix timestamp)
+    - limit: maximum number of detections returned (the earliest are returned first)
+
+    Returns
+    - A list of python dictionaries, in order of time; each dictionary stores the time, camera, name, score and bounding box of a detection
+    """
+
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT time, camera, name, score, bbox FROM Detections WHERE name = ? AND time BETWEEN ? AND ? ORDER BY time LIMIT ?",
+        (name, start, end, limit),
+    )
+
+    return [
+        {
+            "time": result[0],
+            "camera": result[1],
+            "name": result[2],
+            "score": result[3],
+            "bbox": json.loads(result[4]) if result[4] is not None else None,
+        }
+        for result in cursor.fetchall()
+    ]
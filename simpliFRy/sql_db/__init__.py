@@ -1,3 +1,35 @@
-from sql_db.DBManager import get_db, recreate_table, fetch_records, save_record
+from sql_db.DBManager import (
+    get_db,
+    create_tables,
+    fetch_all_embeddings,
+    fetch_image_records,
+    fetch_names,
+    fetch_checksum,
+    fetch_metadata,
+    save_metadata,
+    sync_records,
+)
+from sql_db.DetectionsManager import (
+    get_detections_db,
+    create_detections_table,
+    save_detections,
+    fetch_attendance,
+    fetch_detections,
+)
 
-__all__ = ['get_db', 'recreate_table', 'fetch_records', 'save_record']
\ No newline at end of file
+__all__ = [
+    'get_db',
+    'create_tables',
+    'fetch_all_embeddings',
+    'fetch_image_records',
+    'fetch_names',
+    'fetch_checksum',
+    'fetch_metadata',
+    'save_metadata',
+    'sync_records',
+    'get_detections_db',
+    'create_detections_table',
+    'save_detections',
+    'fetch_attendance',
+    'fetch_detections',
+]
\ No newline at end of file
@@ -36,7 +36,7 @@ const checkAlive = (no_stream_callback = () => {}) => {
 }
 
 document.getElementById("init").onsubmit = async (event) => {
-    // Handles form submission (stream url and data file)
+    // Handles form submission (stream url, data file and capture profile)
 
     event.preventDefault()
 
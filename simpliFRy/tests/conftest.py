@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# Modules are imported as they are by app.py, from the simpliFRy folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db_fp(tmp_path, monkeypatch):
+    """Points the embeddings database at a new file"""
+
+    import sql_db.DBManager
+
+    db_fp = str(tmp_path / "Embeddings.db")
+    monkeypatch.setattr(sql_db.DBManager, "DB_FP", db_fp)
+    return db_fp
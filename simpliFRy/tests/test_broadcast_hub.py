@@ -0,0 +1,143 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from fr.BroadcastHub import BroadcastHub
+from fr.FrameBuffer import FrameBuffer
+
+
+def write_frame(frame_buffer: FrameBuffer, value: int) -> None:
+    frame = frame_buffer.begin_write()
+    frame[:] = value
+    frame_buffer.commit_write()
+
+
+def frame_value(part: bytes) -> float:
+    """Mean pixel value of the JPEG in a multipart chunk"""
+
+    jpeg = part.split(b"\r\n\r\n", 1)[1][:-2]
+    return float(cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR).mean())
+
+
+def wait_until(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def start_viewer(hub: BroadcastHub, stopped: threading.Event, pause: threading.Event | None = None) -> list[bytes]:
+    """
+    Watches the broadcast in a thread, like a /vidFeed response being sent
+
+    Arguments
+    - hub: broadcast to watch
+    - stopped: set to end the stream
+    - pause: if given, the viewer is held after each chunk until it is set, like a slow client
+
+    Returns
+    - chunks received so far (appended to by the viewer)
+    """
+
+    received = []
+
+    def watch():
+        for part in hub.subscribe(lambda: not stopped.is_set()):
+            received.append(part)
+            if pause is not None:
+                pause.wait(timeout=5)
+
+    viewerThread = threading.Thread(target=watch)
+    viewerThread.daemon = True
+    viewerThread.start()
+
+    return received
+
+
+def make_hub() -> tuple[BroadcastHub, FrameBuffer, list[float]]:
+    """Hub without a frame rate limit, and the values of the frames it encoded"""
+
+    frame_buffer = FrameBuffer(32, 16)
+    hub = BroadcastHub(frame_buffer, max_fps=0)
+
+    encoded_values = []
+    encode = hub._encode
+
+    def _encode(frame):
+        encoded_values.append(float(frame.mean()))
+        return encode(frame)
+
+    hub._encode = _encode
+    return hub, frame_buffer, encoded_values
+
+
+def test_each_frame_encoded_once_for_all_viewers():
+    hub, frame_buffer, encoded_values = make_hub()
+    stopped = threading.Event()
+
+    viewers = [start_viewer(hub, stopped) for _ in range(3)]
+    wait_until(lambda: hub.viewers == 3)
+
+    for idx, value in enumerate([0, 80, 160, 240]):
+        write_frame(frame_buffer, value)
+        wait_until(lambda: all(len(received) == idx + 1 for received in viewers))
+
+    stopped.set()
+    hub.close()
+
+    assert encoded_values == [0, 80, 160, 240]
+    assert hub.encoded == 4 and hub.dropped == 0
+
+    # Every viewer is sent the same chunks
+    assert viewers[0] == viewers[1] == viewers[2]
+    assert [round(frame_value(part) / 80) * 80 for part in viewers[0]] == [0, 80, 160, 240]
+
+
+def test_slow_viewer_skips_to_latest_frame():
+    hub, frame_buffer, encoded_values = make_hub()
+    stopped = threading.Event()
+    pause = threading.Event()
+
+    fast = start_viewer(hub, stopped)
+    slow = start_viewer(hub, stopped, pause)
+    wait_until(lambda: hub.viewers == 2)
+
+    write_frame(frame_buffer, 0)
+    wait_until(lambda: len(fast) == len(slow) == 1)
+
+    # Frames keep being encoded and sent to the fast viewer while the slow viewer is still sending
+    for idx, value in enumerate([60, 120, 180, 240], 2):
+        write_frame(frame_buffer, value)
+        wait_until(lambda: len(fast) == idx)
+    assert len(slow) == 1
+
+    pause.set()
+    wait_until(lambda: len(slow) == 2)
+
+    stopped.set()
+    hub.close()
+
+    assert hub.encoded == 5 and len(encoded_values) == 5
+    assert slow[1] == fast[4]
+    assert hub.dropped == 3
+
+
+def test_encoder_stops_when_last_viewer_leaves():
+    hub, frame_buffer, _ = make_hub()
+    stopped = threading.Event()
+
+    start_viewer(hub, stopped)
+    wait_until(lambda: hub.viewers == 1)
+
+    write_frame(frame_buffer, 100)
+    wait_until(lambda: hub.encoded == 1)
+
+    stopped.set()
+    wait_until(lambda: hub.viewers == 0 and not hub._encoder_running)
+
+    # Frames published without viewers are not encoded
+    write_frame(frame_buffer, 200)
+    time.sleep(0.1)
+    assert hub.encoded == 1
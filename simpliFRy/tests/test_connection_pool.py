@@ -0,0 +1,62 @@
+import threading
+
+from sql_db.ConnectionPool import ConnectionPool
+
+
+def test_connections_are_tuned(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "test.db"))
+
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+
+    pool.close()
+
+
+def test_connection_reused_across_threads(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "test.db"))
+    with pool.connection() as conn:
+        first = conn
+
+    used = []
+
+    def use():
+        with pool.connection() as conn:
+            conn.execute("SELECT 1")
+            used.append(conn)
+
+    thread = threading.Thread(target=use)
+    thread.start()
+    thread.join()
+
+    assert used == [first]
+    pool.close()
+
+
+def test_connections_in_use_at_once_are_distinct(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "test.db"), max_idle=1)
+
+    with pool.connection() as conn1, pool.connection() as conn2:
+        assert conn1 is not conn2
+
+    # Only max_idle connections are kept once returned
+    assert len(pool._idle) == 1
+    pool.close()
+    assert pool._idle == []
+
+
+def test_open_transaction_rolled_back_on_return(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "test.db"))
+
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE Items (name TEXT)")
+        conn.commit()
+        conn.execute("INSERT INTO Items VALUES ('left open')")
+        assert conn.in_transaction
+
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM Items").fetchone()[0] == 0
+
+    pool.close()
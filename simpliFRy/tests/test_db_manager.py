@@ -0,0 +1,113 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from sql_db import (
+    create_tables,
+    fetch_all_embeddings,
+    fetch_checksum,
+    fetch_image_records,
+    fetch_names,
+    get_db,
+    sync_records,
+)
+
+
+def embedding(value: float) -> np.ndarray:
+    return np.full(512, value, dtype=np.float32)
+
+
+def image_record(name: str, image: str, value: float | None) -> dict:
+    return {
+        "name": name,
+        "image": image,
+        "hash": f"{image}-{value}",
+        "embedding": embedding(value) if value is not None else None,
+        "error": None if value is not None else "No detectable faces",
+    }
+
+
+def enrol_jane_and_john(conn) -> None:
+    sync_records(
+        conn,
+        new_images=[image_record("Jane Smith", "jane1.png", 1.0), image_record("John Doe", "john1.png", None)],
+        removed_images=[],
+        people=[("Jane Smith", embedding(1.0)), ("John Doe", embedding(2.0))],
+        stale_names=[],
+    )
+
+
+def test_sync_records_applies_changes(db_fp):
+    with get_db() as conn:
+        create_tables(conn)
+        enrol_jane_and_john(conn)
+
+        sync_records(
+            conn,
+            new_images=[image_record("Jane Smith", "jane2.png", 3.0)],
+            removed_images=[("Jane Smith", "jane1.png")],
+            people=[("Jane Smith", embedding(3.0))],
+            stale_names=["Jane Smith", "John Doe"],
+        )
+
+        assert fetch_names(conn) == ["Jane Smith"]
+        records = sorted(fetch_image_records(conn), key=lambda record: record["image"])
+
+    assert [(record["name"], record["image"]) for record in records] == [
+        ("Jane Smith", "jane2.png"), ("John Doe", "john1.png")
+    ]
+    np.testing.assert_array_equal(records[0]["embedding"], embedding(3.0))
+    assert records[1]["embedding"] is None and records[1]["error"] == "No detectable faces"
+
+
+def test_fetch_all_embeddings_in_id_order(db_fp):
+    with get_db() as conn:
+        create_tables(conn)
+        assert fetch_all_embeddings(conn)[1].shape == (0, 512)
+
+        enrol_jane_and_john(conn)
+        names, embeddings = fetch_all_embeddings(conn)
+
+    assert names == ["Jane Smith", "John Doe"]
+    assert embeddings.dtype == np.float32 and embeddings.flags["C_CONTIGUOUS"]
+    np.testing.assert_array_equal(embeddings, [embedding(1.0), embedding(2.0)])
+
+
+def test_checksum_changes_with_every_change(db_fp):
+    with get_db() as conn:
+        create_tables(conn)
+        checksums = [fetch_checksum(conn)]
+
+        enrol_jane_and_john(conn)
+        checksums.append(fetch_checksum(conn))
+        assert fetch_checksum(conn) == checksums[-1]
+
+        # Replacing an embedding with one of the same name and id order still changes the checksum
+        sync_records(
+            conn, new_images=[], removed_images=[], people=[("John Doe", embedding(4.0))], stale_names=["John Doe"]
+        )
+        checksums.append(fetch_checksum(conn))
+
+    assert len(set(checksums)) == 3
+
+
+def test_failed_transaction_is_rolled_back(db_fp):
+    with get_db() as conn:
+        create_tables(conn)
+        enrol_jane_and_john(conn)
+        checksum = fetch_checksum(conn)
+
+        # Names are required, so the last statement fails after the others have run
+        with pytest.raises(sqlite3.IntegrityError):
+            sync_records(
+                conn,
+                new_images=[image_record("Jane Smith", "jane2.png", 3.0)],
+                removed_images=[],
+                people=[(None, embedding(3.0))],
+                stale_names=["Jane Smith"],
+            )
+
+        assert fetch_checksum(conn) == checksum
+        assert fetch_names(conn) == ["Jane Smith", "John Doe"]
+        assert len(fetch_image_records(conn)) == 2
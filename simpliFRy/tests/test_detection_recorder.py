@@ -0,0 +1,129 @@
+import pytest
+
+import fr.DetectionRecorder as detection_recorder_module
+import sql_db.DetectionsManager
+from fr.DetectionRecorder import DetectionRecorder
+from sql_db import create_detections_table, fetch_attendance, fetch_detections, get_detections_db, save_detections
+
+
+@pytest.fixture
+def detections_db_fp(tmp_path, monkeypatch):
+    detections_db_fp = str(tmp_path / "data" / "Detections.db")
+    monkeypatch.setattr(sql_db.DetectionsManager, "DETECTIONS_DB_FP", detections_db_fp)
+    return detections_db_fp
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(detection_recorder_module.time, "time", lambda: now[0])
+    return now
+
+
+def detection(time: float, name: str, camera: str = "door") -> dict:
+    return {"time": time, "camera": camera, "name": name, "score": 0.3, "bbox": [0.1, 0.1, 0.2, 0.2]}
+
+
+def test_recorded_detections_are_written(detections_db_fp, clock):
+    recorder = DetectionRecorder(interval=5, flush_interval=0.05)
+    recorder.start()
+
+    recorder.record("door", "Jane Smith", 0.3, [0.1, 0.1, 0.2, 0.2])
+    recorder.record("hall", "Jane Smith", 0.4, [0.5, 0.5, 0.6, 0.6])
+    recorder.stop()
+
+    assert recorder.recorded == 2 and recorder.dropped == 0 and recorder.error is None
+
+    with get_detections_db() as conn:
+        detections = fetch_detections(conn, "Jane Smith", 0, 2000)
+
+    assert [(record["camera"], record["score"], record["bbox"]) for record in detections] == [
+        ("door", 0.3, [0.1, 0.1, 0.2, 0.2]), ("hall", 0.4, [0.5, 0.5, 0.6, 0.6])
+    ]
+
+
+def test_person_recorded_once_per_interval_per_camera(detections_db_fp, clock):
+    recorder = DetectionRecorder(interval=5, flush_interval=0.05)
+    recorder.start()
+
+    for seconds in [0, 1, 4.9, 5, 6, 10]:
+        clock[0] = 1000 + seconds
+        recorder.record("door", "Jane Smith", 0.3, None)
+    recorder.stop()
+
+    with get_detections_db() as conn:
+        times = [record["time"] for record in fetch_detections(conn, "Jane Smith", 0, 2000)]
+
+    assert times == [1000, 1005, 1010]
+
+
+def test_detections_dropped_when_queue_is_full(detections_db_fp, clock):
+    recorder = DetectionRecorder(interval=0, max_queued=2)
+
+    for name in ["a", "b", "c", "d"]:
+        recorder.record("door", name, 0.3, None)
+
+    assert recorder.dropped == 2
+
+    recorder.start()
+    recorder.stop()
+    assert recorder.recorded == 2
+
+
+def test_detections_written_in_batches(detections_db_fp, clock):
+    recorder = DetectionRecorder(interval=0, max_batch=3)
+    for idx in range(7):
+        recorder.record("door", f"Person {idx}", 0.3, None)
+
+    recorder.start()
+    recorder.stop()
+
+    assert recorder.recorded == 7
+    with get_detections_db() as conn:
+        assert len(fetch_attendance(conn, 0, 2000)) == 7
+
+
+def test_recording_stops_when_database_cannot_be_opened(tmp_path, monkeypatch, clock):
+    # The data folder is a file, so the database cannot be created in it
+    (tmp_path / "data").write_text("")
+    monkeypatch.setattr(sql_db.DetectionsManager, "DETECTIONS_DB_FP", str(tmp_path / "data" / "Detections.db"))
+
+    recorder = DetectionRecorder(interval=0)
+    recorder.record("door", "Jane Smith", 0.3, None)
+    recorder.start()
+    recorder.stop()
+
+    assert recorder.error is not None
+    assert recorder.recorded == 0 and recorder.dropped == 1
+
+    # Nothing more is queued
+    recorder.record("door", "John Doe", 0.3, None)
+    assert recorder._queue.empty()
+
+
+def test_attendance_gives_first_and_last_sightings(detections_db_fp):
+    with get_detections_db() as conn:
+        create_detections_table(conn)
+        save_detections(conn, [
+            detection(100, "John Doe"),
+            detection(50, "Jane Smith"),
+            detection(300, "Jane Smith", camera="hall"),
+            detection(200, "John Doe", camera="hall"),
+            detection(900, "Jane Smith"),
+        ])
+
+        attendance = fetch_attendance(conn, 0, 500)
+        door_attendance = fetch_attendance(conn, 0, 1000, camera="door")
+        late_attendance = fetch_attendance(conn, 150, 1000)
+
+    assert attendance == [
+        {"name": "Jane Smith", "first_seen": 50, "last_seen": 300, "detections": 2},
+        {"name": "John Doe", "first_seen": 100, "last_seen": 200, "detections": 2},
+    ]
+    assert door_attendance == [
+        {"name": "Jane Smith", "first_seen": 50, "last_seen": 900, "detections": 2},
+        {"name": "John Doe", "first_seen": 100, "last_seen": 100, "detections": 1},
+    ]
+    assert [(record["name"], record["first_seen"]) for record in late_attendance] == [
+        ("John Doe", 200), ("Jane Smith", 300)
+    ]
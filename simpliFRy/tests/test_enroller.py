@@ -0,0 +1,209 @@
+import math
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from fr.Enroller import Enroller
+
+
+class StubEnroller(Enroller):
+    """Enroller whose embeddings are derived from the image file contents, recording which images were embedded"""
+
+    def __init__(self, pack: str = "buffalo_l") -> None:
+        model = SimpleNamespace(
+            det_model=None,
+            models={"recognition": SimpleNamespace(model_file=f"/models/{pack}/w600k_r50.onnx", input_size=(112, 112))},
+        )
+        super().__init__(model, num_workers=2)
+
+        self.embedded: list[str] = []
+
+    def embed_images(self, img_fps, on_progress=None):
+        outcomes = []
+        for idx, img_fp in enumerate(img_fps):
+            self.embedded.append(os.path.basename(img_fp))
+
+            with open(img_fp, "rb") as file:
+                contents = file.read()
+
+            if contents == b"no face":
+                outcomes.append((None, "No detectable faces"))
+            else:
+                outcomes.append((np.full(512, len(contents), dtype=np.float32), None))
+
+            if on_progress is not None:
+                on_progress(idx + 1)
+
+        return outcomes
+
+
+@pytest.fixture
+def img_folder(tmp_path):
+    for img_name, contents in [("jane1.png", b"a"), ("jane2.png", b"bbb"), ("john1.png", b"cc")]:
+        (tmp_path / img_name).write_bytes(contents)
+
+    return tmp_path
+
+
+DETAILS = [
+    {"name": "Jane Smith", "images": ["jane1.png", "jane2.png"]},
+    {"name": "John Doe", "images": ["john1.png"]},
+]
+
+
+def enrol_again(enroller: StubEnroller, img_folder, details: list[dict], changes: dict, enrolled_names: list[str]):
+    enroller.embedded = []
+    return enroller.enrol(str(img_folder), details, changes["new_images"], enrolled_names)
+
+
+def test_first_enrolment_embeds_every_image(img_folder):
+    enroller = StubEnroller()
+
+    changes, summary = enroller.enrol(str(img_folder), DETAILS, [], [])
+
+    assert sorted(enroller.embedded) == ["jane1.png", "jane2.png", "john1.png"]
+    assert {record["image"] for record in changes["new_images"]} == {"jane1.png", "jane2.png", "john1.png"}
+    assert changes["stale_names"] == ["Jane Smith", "John Doe"]
+
+    people = dict(changes["people"])
+    np.testing.assert_allclose(people["Jane Smith"], np.full(512, 2.0))
+    np.testing.assert_allclose(people["John Doe"], np.full(512, 2.0))
+
+    assert summary["enrolled"] == 2
+    assert summary["embedded"] == 3
+    assert summary["cached"] == 0
+    assert enroller.progress == {"done": 3, "total": 3}
+
+
+def test_unchanged_images_are_not_embedded_again(img_folder):
+    enroller = StubEnroller()
+    first_changes, _ = enroller.enrol(str(img_folder), DETAILS, [], [])
+
+    changes, summary = enrol_again(enroller, img_folder, DETAILS, first_changes, ["Jane Smith", "John Doe"])
+
+    assert enroller.embedded == []
+    assert changes == {"new_images": [], "removed_images": [], "people": [], "stale_names": []}
+    assert summary["cached"] == 3
+    assert summary["enrolled"] == 2
+
+
+def test_only_changed_image_is_embedded(img_folder):
+    enroller = StubEnroller()
+    first_changes, _ = enroller.enrol(str(img_folder), DETAILS, [], [])
+
+    (img_folder / "jane2.png").write_bytes(b"ddddd")
+    changes, summary = enrol_again(enroller, img_folder, DETAILS, first_changes, ["Jane Smith", "John Doe"])
+
+    assert enroller.embedded == ["jane2.png"]
+    assert changes["removed_images"] == [("Jane Smith", "jane2.png")]
+    assert changes["stale_names"] == ["Jane Smith"]
+
+    people = dict(changes["people"])
+    assert list(people) == ["Jane Smith"]
+    np.testing.assert_allclose(people["Jane Smith"], np.full(512, 3.0))
+    assert summary["cached"] == 2
+
+
+def test_removed_person_is_deleted(img_folder):
+    enroller = StubEnroller()
+    first_changes, _ = enroller.enrol(str(img_folder), DETAILS, [], [])
+
+    changes, summary = enrol_again(enroller, img_folder, DETAILS[:1], first_changes, ["Jane Smith", "John Doe"])
+
+    assert enroller.embedded == []
+    assert changes["removed_images"] == [("John Doe", "john1.png")]
+    assert changes["stale_names"] == ["John Doe"]
+    assert changes["people"] == []
+    assert summary["removed"] == 1
+
+
+def test_unusable_images_are_reported(img_folder):
+    (img_folder / "john1.png").write_bytes(b"no face")
+    details = DETAILS + [{"name": "Jane Smith", "images": ["missing.png"]}]
+
+    changes, summary = StubEnroller().enrol(str(img_folder), details, [], [])
+
+    reasons = {failure["image"]: failure["reason"] for failure in summary["failures"]}
+    assert reasons == {"missing.png": "Image file not found or unreadable", "john1.png": "No detectable faces"}
+
+    # The unusable image is cached with its reason, so it is not embedded again until it changes
+    john = [record for record in changes["new_images"] if record["name"] == "John Doe"]
+    assert john[0]["embedding"] is None and john[0]["error"] == "No detectable faces"
+    assert [name for name, _ in changes["people"]] == ["Jane Smith"]
+    assert summary["enrolled"] == 1
+
+
+def test_images_embedded_again_for_another_model(img_folder):
+    first_changes, _ = StubEnroller("buffalo_l").enrol(str(img_folder), DETAILS, [], [])
+
+    enroller = StubEnroller("buffalo_s")
+    enrol_again(enroller, img_folder, DETAILS, first_changes, ["Jane Smith", "John Doe"])
+
+    assert sorted(enroller.embedded) == ["jane1.png", "jane2.png", "john1.png"]
+
+
+class FakeRecognitionModel:
+    """Recognition model embedding each aligned face as its first pixel, recording the size of each batch"""
+
+    model_file = "/models/buffalo_l/w600k_r50.onnx"
+    input_size = (112, 112)
+
+    def __init__(self) -> None:
+        self.batches: list[int] = []
+
+    def get_feat(self, crops: list[np.ndarray]) -> np.ndarray:
+        self.batches.append(len(crops))
+        return np.array([np.full(512, crop[0, 0, 0], dtype=np.float32) for crop in crops])
+
+
+def batching_enroller(monkeypatch, batch_size: int) -> tuple[Enroller, FakeRecognitionModel]:
+    rec_model = FakeRecognitionModel()
+    model = SimpleNamespace(det_model=None, models={"recognition": rec_model})
+    enroller = Enroller(model, num_workers=3, batch_size=batch_size)
+
+    # Images are named after the value of their aligned face; "none" has no detectable face
+    def align_face(img_fp):
+        img_name = os.path.basename(img_fp)
+        if img_name == "none":
+            return None, "No detectable faces"
+        return np.full((112, 112, 3), int(img_name), dtype=np.uint8), None
+
+    monkeypatch.setattr(enroller, "_align_face", align_face)
+    return enroller, rec_model
+
+
+@pytest.mark.parametrize("num_images, batch_size", [(7, 3), (6, 3), (1, 32), (40, 32)])
+def test_faces_embedded_in_batches(monkeypatch, num_images, batch_size):
+    enroller, rec_model = batching_enroller(monkeypatch, batch_size)
+
+    outcomes = enroller.embed_images([f"/images/{idx}" for idx in range(num_images)])
+
+    assert len(rec_model.batches) == math.ceil(num_images / batch_size)
+    assert all(size == batch_size for size in rec_model.batches[:-1])
+    assert sum(rec_model.batches) == num_images
+    for idx, (embedding, reason) in enumerate(outcomes):
+        assert reason is None
+        np.testing.assert_array_equal(embedding, np.full(512, idx))
+
+
+def test_unusable_images_are_left_out_of_batches(monkeypatch):
+    enroller, rec_model = batching_enroller(monkeypatch, 2)
+    progress = []
+
+    img_fps = ["/images/1", "/images/none", "/images/2", "/images/3"]
+    outcomes = enroller.embed_images(img_fps, on_progress=progress.append)
+
+    assert rec_model.batches == [2, 1]
+    assert outcomes[1] == (None, "No detectable faces")
+    assert [embedding[0] for embedding, _ in outcomes[:1] + outcomes[2:]] == [1, 2, 3]
+    assert progress == [1, 2, 3, 4]
+
+
+def test_no_recognition_call_without_faces(monkeypatch):
+    enroller, rec_model = batching_enroller(monkeypatch, 4)
+
+    assert enroller.embed_images(["/images/none"]) == [(None, "No detectable faces")]
+    assert enroller.embed_images([]) == []
+    assert rec_model.batches == []
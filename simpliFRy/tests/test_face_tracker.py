@@ -0,0 +1,101 @@
+import numpy as np
+
+from fr.FaceTracker import FaceTracker
+
+BBOX = np.array([[0.1, 0.1, 0.3, 0.3]])
+EMBED = np.ones(512, dtype=np.float32) / np.sqrt(512)
+
+
+def recognise(tracker: FaceTracker, bboxes: np.ndarray, det_scores: list[float], label: str = "Jane Smith") -> list[bool]:
+    """Updates the tracker with a frame, recording every embedded face as recognised"""
+
+    tracks, needs_embedding = tracker.update(bboxes, np.array(det_scores))
+    for track, embedded in zip(tracks, needs_embedding):
+        if embedded:
+            FaceTracker.record(track, label, 0.3, EMBED)
+
+    return needs_embedding
+
+
+def test_new_faces_are_embedded():
+    tracker = FaceTracker()
+
+    tracks, needs_embedding = tracker.update(np.array([[0.1, 0.1, 0.3, 0.3], [0.6, 0.6, 0.8, 0.8]]), np.array([0.9, 0.8]))
+
+    assert needs_embedding == [True, True]
+    assert [track.track_id for track in tracks] == [0, 1]
+    assert tracker.embedded == 2
+
+
+def test_recognised_face_reuses_its_label():
+    tracker = FaceTracker()
+    recognise(tracker, BBOX, [0.9])
+
+    tracks, needs_embedding = tracker.update(BBOX + 0.005, np.array([0.9]))
+
+    assert needs_embedding == [False]
+    assert tracks[0].label == "Jane Smith"
+    assert tracker.reused == 1
+
+
+def test_unrecognised_face_is_embedded_again():
+    tracker = FaceTracker()
+    recognise(tracker, BBOX, [0.9], label="Unknown")
+
+    assert recognise(tracker, BBOX, [0.9]) == [True]
+
+
+def test_reembedded_after_interval():
+    tracker = FaceTracker(reembed_interval=3)
+    recognise(tracker, BBOX, [0.9])
+
+    assert [recognise(tracker, BBOX, [0.9])[0] for _ in range(4)] == [False, False, True, False]
+
+
+def test_reembedded_when_face_moves():
+    tracker = FaceTracker(reembed_iou=0.7, match_iou=0.3)
+    recognise(tracker, BBOX, [0.9])
+
+    # IoU of 0.54 with the embedded bounding box: the same track, but moved enough to be embedded again
+    tracks, needs_embedding = tracker.update(BBOX + [0.06, 0, 0.06, 0], np.array([0.9]))
+
+    assert tracks[0].track_id == 0
+    assert needs_embedding == [True]
+
+
+def test_reembedded_when_confidence_drops():
+    tracker = FaceTracker(conf_drop=0.1)
+    recognise(tracker, BBOX, [0.9])
+
+    assert recognise(tracker, BBOX, [0.85]) == [False]
+    assert recognise(tracker, BBOX, [0.7]) == [True]
+
+
+def test_track_dropped_after_max_misses():
+    tracker = FaceTracker(max_misses=2)
+    recognise(tracker, BBOX, [0.9])
+
+    for _ in range(2):
+        tracker.update(np.empty((0, 4)), np.empty(0))
+    assert len(tracker.tracks) == 1
+
+    tracker.update(np.empty((0, 4)), np.empty(0))
+    assert tracker.tracks == []
+
+
+def test_each_track_continued_by_one_detection():
+    tracker = FaceTracker()
+    recognise(tracker, BBOX, [0.9])
+
+    tracks, needs_embedding = tracker.update(np.concatenate([BBOX, BBOX + 0.01]), np.array([0.9, 0.9]))
+
+    assert len({track.track_id for track in tracks}) == 2
+    assert needs_embedding.count(True) == 1
+
+
+def test_stats():
+    tracker = FaceTracker()
+    recognise(tracker, BBOX, [0.9])
+    recognise(tracker, BBOX, [0.9])
+
+    assert tracker.stats() == [{"track_id": 0, "label": "Jane Smith", "frames": 2, "embeds": 1}]
@@ -0,0 +1,105 @@
+import threading
+
+import numpy as np
+import pytest
+
+from fr.FrameBuffer import FrameBuffer
+
+
+def write_frame(frame_buffer: FrameBuffer, value: int) -> int:
+    frame = frame_buffer.begin_write()
+    frame[:] = value
+    return frame_buffer.commit_write()
+
+
+def test_no_frame_before_first_write():
+    frame_buffer = FrameBuffer(4, 2)
+
+    with frame_buffer.read_latest() as (seq, frame):
+        assert seq == 0
+        assert frame is None
+
+
+def test_reads_latest_published_frame():
+    frame_buffer = FrameBuffer(4, 2)
+
+    write_frame(frame_buffer, 1)
+    seq = write_frame(frame_buffer, 2)
+
+    with frame_buffer.read_latest() as (latest_seq, frame):
+        assert latest_seq == seq == 2
+        assert frame.shape == (2, 4, 3)
+        assert np.all(frame == 2)
+
+        with pytest.raises(ValueError):
+            frame[0, 0, 0] = 0
+
+
+def test_aborted_write_is_not_published():
+    frame_buffer = FrameBuffer(4, 2)
+    write_frame(frame_buffer, 1)
+
+    frame = frame_buffer.begin_write()
+    frame[:] = 9
+    frame_buffer.abort_write()
+
+    with frame_buffer.read_latest() as (seq, frame):
+        assert seq == 1
+        assert np.all(frame == 1)
+
+
+def test_borrowed_frame_is_not_overwritten():
+    frame_buffer = FrameBuffer(4, 2, num_slots=3)
+    write_frame(frame_buffer, 1)
+
+    with frame_buffer.read_latest() as (_, borrowed):
+        for value in range(2, 8):
+            write_frame(frame_buffer, value)
+
+        assert np.all(borrowed == 1)
+
+    with frame_buffer.read_latest() as (seq, frame):
+        assert seq == 7
+        assert np.all(frame == 7)
+
+
+def test_frame_dropped_when_every_slot_is_in_use():
+    frame_buffer = FrameBuffer(4, 2, num_slots=2)
+    write_frame(frame_buffer, 1)
+
+    with frame_buffer.read_latest():
+        write_frame(frame_buffer, 2)
+
+        with frame_buffer.read_latest():
+            # One slot is borrowed and the other holds the latest frame, so the frame goes to scratch and is dropped
+            seq = write_frame(frame_buffer, 3)
+
+    assert seq == 2
+    assert frame_buffer.dropped == 1
+
+    with frame_buffer.read_latest() as (_, frame):
+        assert np.all(frame == 2)
+
+
+def test_published_at_until_slot_is_overwritten():
+    frame_buffer = FrameBuffer(4, 2, num_slots=2)
+    first_seq = write_frame(frame_buffer, 1)
+
+    assert frame_buffer.published_at(first_seq) is not None
+
+    write_frame(frame_buffer, 2)
+    write_frame(frame_buffer, 3)
+
+    assert frame_buffer.published_at(first_seq) is None
+
+
+def test_wait_for_frame():
+    frame_buffer = FrameBuffer(4, 2)
+
+    assert not frame_buffer.wait_for_frame(0, timeout=0.01)
+
+    writer = threading.Timer(0.05, write_frame, args=(frame_buffer, 1))
+    writer.start()
+
+    assert frame_buffer.wait_for_frame(0, timeout=5)
+    writer.join()
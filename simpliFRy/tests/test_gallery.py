@@ -0,0 +1,246 @@
+import hashlib
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import fr.Gallery as gallery_module
+from fr.Gallery import Gallery
+
+
+def image_embedding(contents: bytes) -> np.ndarray:
+    """Unit embedding derived from the contents of an image file"""
+
+    seed = int.from_bytes(hashlib.blake2b(contents, digest_size=4).digest(), "little")
+    embedding = np.random.default_rng(seed).standard_normal(512).astype(np.float32)
+    return embedding / np.linalg.norm(embedding)
+
+
+@pytest.fixture
+def make_gallery(db_fp, tmp_path, monkeypatch):
+    index_fp = str(tmp_path / "Embeddings")
+    monkeypatch.setattr(gallery_module, "INDEX_FP", index_fp)
+    monkeypatch.setattr(gallery_module, "INDEX_META_FP", index_fp + ".index.json")
+
+    def make_gallery(backend: str = "exact") -> Gallery:
+        rec_model = SimpleNamespace(model_file="/models/buffalo_l/w600k_r50.onnx", input_size=(112, 112))
+        gallery = Gallery(SimpleNamespace(det_model=None, models={"recognition": rec_model}), backend=backend)
+
+        def embed_images(img_fps, on_progress=None):
+            outcomes = []
+            for img_fp in img_fps:
+                with open(img_fp, "rb") as file:
+                    contents = file.read()
+                if contents == b"no face":
+                    outcomes.append((None, "No detectable faces"))
+                else:
+                    outcomes.append((image_embedding(contents), None))
+            return outcomes
+
+        gallery.enroller.embed_images = embed_images
+        return gallery
+
+    return make_gallery
+
+
+@pytest.fixture
+def gallery(make_gallery):
+    gallery = make_gallery()
+    gallery.load(None)
+    return gallery
+
+
+@pytest.fixture
+def write_image(tmp_path):
+    def write_image(img_name: str, contents: bytes) -> tuple[str, str]:
+        img_fp = tmp_path / img_name
+        img_fp.write_bytes(contents)
+        return img_name, str(img_fp)
+
+    return write_image
+
+
+def closest(gallery: Gallery, contents: bytes) -> tuple[str, float]:
+    names, distances = gallery.query([image_embedding(contents)], k=1)
+    return names[0][0], float(distances[0][0])
+
+
+def test_person_added_while_loaded(gallery, write_image):
+    update = gallery.put_person("Jane Smith", [write_image("jane1.png", b"jane")])
+
+    assert update["enrolled"] and update["embedded"] == 1 and update["gallery_size"] == 1
+    assert gallery.names() == ["Jane Smith"]
+
+    name, distance = closest(gallery, b"jane")
+    assert name == "Jane Smith"
+    assert distance == pytest.approx(0.0, abs=1e-5)
+
+
+def test_adding_existing_person_is_rejected(gallery, write_image):
+    gallery.put_person("Jane Smith", [write_image("jane1.png", b"jane")])
+
+    with pytest.raises(ValueError, match="already in the gallery"):
+        gallery.put_person("Jane Smith", [write_image("jane2.png", b"jane again")])
+    with pytest.raises(KeyError):
+        gallery.put_person("John Doe", [write_image("john1.png", b"john")], replace=True)
+
+
+def test_unusable_images_leave_gallery_unchanged(gallery, write_image):
+    update = gallery.put_person("Jane Smith", [write_image("jane1.png", b"no face")])
+
+    assert not update["enrolled"]
+    assert update["failures"] == [{"name": "Jane Smith", "image": "jane1.png", "reason": "No detectable faces"}]
+    assert len(gallery) == 0 and gallery.names() == []
+
+
+def test_replaced_person_is_updated_in_place(gallery, write_image):
+    gallery.put_person("Jane Smith", [write_image("jane1.png", b"jane")])
+    gallery.put_person("John Doe", [write_image("john1.png", b"john")])
+
+    update = gallery.put_person(
+        "Jane Smith", [write_image("jane1.png", b"jane"), write_image("jane2.png", b"jane again")], replace=True
+    )
+
+    # The unchanged image reuses its cached embedding; the old id is removed rather than the index rebuilt
+    assert update["embedded"] == 1 and update["cached"] == 1
+    assert len(gallery) == 2
+    assert len(gallery.vector_index) == 3
+    assert gallery.name_list == [None, "John Doe", "Jane Smith"]
+
+    expected = (image_embedding(b"jane") + image_embedding(b"jane again")) / 2
+    names, _ = gallery.query([expected], k=2)
+    assert names[0][0] == "Jane Smith"
+
+
+def test_removed_person_is_no_longer_matched(gallery, write_image):
+    gallery.put_person("Jane Smith", [write_image("jane1.png", b"jane")])
+    gallery.put_person("John Doe", [write_image("john1.png", b"john")])
+
+    gallery.remove_person("Jane Smith")
+
+    assert gallery.names() == ["John Doe"]
+    assert len(gallery) == 1
+    assert closest(gallery, b"jane")[0] == "John Doe"
+
+    with pytest.raises(KeyError):
+        gallery.remove_person("Jane Smith")
+
+
+def test_index_rebuilt_once_most_ids_are_removed(gallery, write_image):
+    gallery.put_person("Jane Smith", [write_image("jane1.png", b"jane 0")])
+
+    # Removed ids are tolerated up to max(gallery size, 100) before the index is rebuilt from the database
+    for idx in range(1, 101):
+        gallery.put_person("Jane Smith", [write_image("jane1.png", f"jane {idx}".encode())], replace=True)
+    assert len(gallery.vector_index) == 101
+
+    gallery.put_person("Jane Smith", [write_image("jane1.png", b"jane 101")], replace=True)
+
+    assert len(gallery.vector_index) == 1
+    assert gallery.name_list == ["Jane Smith"]
+    assert closest(gallery, b"jane 101") == ("Jane Smith", pytest.approx(0.0, abs=1e-5))
+
+
+def test_changes_before_loading_are_read_from_database(gallery, write_image):
+    gallery.reset()
+    gallery.put_person("Jane Smith", [write_image("jane1.png", b"jane")])
+
+    # The live index is untouched until the gallery is loaded from the database
+    assert len(gallery) == 0
+    assert gallery.names() == ["Jane Smith"]
+
+    gallery.load(None)
+    assert closest(gallery, b"jane")[0] == "Jane Smith"
+
+
+def test_reload_resets_and_loads_under_one_lock(gallery, write_image):
+    gallery.put_person("Jane Smith", [write_image("jane1.png", b"jane")])
+
+    # Another change waiting on the gallery cannot run between the reset and the load
+    states = []
+    fetch_embeddings = gallery._fetch_embeddings
+
+    def _fetch_embeddings():
+        states.append((gallery.loaded, gallery.update_lock.locked()))
+        fetch_embeddings()
+
+    gallery._fetch_embeddings = _fetch_embeddings
+    gallery.load(None, reset=True)
+
+    assert states == [(False, True)]
+    assert gallery.loaded
+    assert closest(gallery, b"jane")[0] == "Jane Smith"
+
+
+def load_counting_rebuilds(gallery: Gallery) -> int:
+    """Loads the gallery, returning how many times its index was built from the database"""
+
+    builds = []
+    build_index = gallery._build_index
+
+    def _build_index(name_list, embeddings):
+        builds.append(len(name_list))
+        return build_index(name_list, embeddings)
+
+    gallery._build_index = _build_index
+    gallery.load(None)
+    return len(builds)
+
+
+@pytest.fixture
+def saved_gallery(gallery, write_image):
+    gallery.put_person("Jane Smith", [write_image("jane1.png", b"jane")])
+    gallery.put_person("John Doe", [write_image("john1.png", b"john")])
+    return gallery
+
+
+def test_current_snapshot_is_loaded(saved_gallery, make_gallery):
+    gallery = make_gallery()
+
+    assert load_counting_rebuilds(gallery) == 0
+    assert gallery.name_list == saved_gallery.name_list
+    assert closest(gallery, b"john")[0] == "John Doe"
+
+
+def test_snapshot_rebuilt_when_database_changed(saved_gallery, make_gallery, write_image):
+    # Changed by another process (or an older version of the app) without updating the snapshot
+    saved_gallery.loaded = False
+    saved_gallery.remove_person("John Doe")
+
+    gallery = make_gallery()
+    assert load_counting_rebuilds(gallery) == 1
+    assert gallery.names() == ["Jane Smith"]
+    assert closest(gallery, b"john")[0] == "Jane Smith"
+
+
+def test_snapshot_rebuilt_for_another_backend(saved_gallery, make_gallery):
+    gallery = make_gallery(backend="voyager")
+
+    assert load_counting_rebuilds(gallery) == 1
+    assert gallery.vector_index.name == "voyager"
+    assert closest(gallery, b"jane")[0] == "Jane Smith"
+
+
+def test_snapshot_rebuilt_when_names_do_not_match_index(saved_gallery, make_gallery):
+    with open(gallery_module.INDEX_META_FP) as file:
+        meta = json.load(file)
+    meta["names"].append("Someone Else")
+    with open(gallery_module.INDEX_META_FP, "w") as file:
+        json.dump(meta, file)
+
+    gallery = make_gallery()
+    assert load_counting_rebuilds(gallery) == 1
+    assert gallery.names() == ["Jane Smith", "John Doe"]
+
+
+def test_snapshot_rebuilt_when_unreadable(saved_gallery, make_gallery):
+    with open(gallery_module.INDEX_FP + saved_gallery.vector_index.extension, "wb") as file:
+        file.write(b"not an index")
+
+    gallery = make_gallery()
+    assert load_counting_rebuilds(gallery) == 1
+    assert closest(gallery, b"jane")[0] == "Jane Smith"
+
+    # The rebuilt index replaces the unreadable snapshot
+    assert load_counting_rebuilds(make_gallery()) == 0
@@ -0,0 +1,64 @@
+from fr.InferenceScheduler import InferenceScheduler
+
+
+def test_serves_cameras_in_proportion_to_their_weights():
+    scheduler = InferenceScheduler()
+    scheduler.register("a", weight=2)
+    scheduler.register("b", weight=1)
+
+    for _ in range(30):
+        scheduler.order(["a", "b"], limit=1)
+
+    assert scheduler.grants == {"a": 20, "b": 10}
+
+
+def test_interleaves_rather_than_bunching_heavier_cameras():
+    scheduler = InferenceScheduler()
+    scheduler.register("a", weight=2)
+    scheduler.register("b", weight=1)
+
+    served = [scheduler.order(["a", "b"], limit=1)[0] for _ in range(6)]
+
+    assert served == ["a", "b", "a", "a", "b", "a"]
+
+
+def test_orders_every_candidate_once_without_limit():
+    scheduler = InferenceScheduler()
+    for cam_id in ("a", "b", "c"):
+        scheduler.register(cam_id)
+
+    ordered = scheduler.order(["a", "b", "c"])
+
+    assert sorted(ordered) == ["a", "b", "c"]
+    assert scheduler.grants == {"a": 1, "b": 1, "c": 1}
+
+
+def test_only_candidates_are_served():
+    scheduler = InferenceScheduler()
+    scheduler.register("a", weight=5)
+    scheduler.register("b")
+
+    assert scheduler.order(["b"], limit=2) == ["b"]
+    assert scheduler.grants["a"] == 0
+
+
+def test_weight_below_one_counts_as_one():
+    scheduler = InferenceScheduler()
+    scheduler.register("a", weight=0)
+    scheduler.register("b", weight=1)
+
+    for _ in range(10):
+        scheduler.order(["a", "b"], limit=1)
+
+    assert scheduler.grants == {"a": 5, "b": 5}
+
+
+def test_unregister_forgets_camera():
+    scheduler = InferenceScheduler()
+    scheduler.register("a")
+    scheduler.order(["a"])
+
+    scheduler.unregister("a")
+    scheduler.unregister("missing")
+
+    assert "a" not in scheduler.grants
@@ -0,0 +1,85 @@
+import os
+import sys
+from types import ModuleType, SimpleNamespace
+
+import numpy as np
+import pytest
+
+from fr.InferenceScheduler import InferenceScheduler
+from fr.InferenceWorkerPool import InferenceWorkerPool
+from utils.onnx_runtime import DEFAULT_RUNTIME_SETTINGS
+
+CRASH = 255
+
+
+def fake_worker_main(conn, log_queue, shm_name, slot_bytes, runtime_settings, num_threads, cpu_cores) -> None:
+    """Worker finding no faces in any frame, which exits (as if killed) on frames starting with CRASH"""
+
+    from multiprocessing.shared_memory import SharedMemory
+
+    shm = SharedMemory(name=shm_name)
+    conn.send(("ready", None))
+
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+
+        slot = msg[0]
+        if shm.buf[slot * slot_bytes] == CRASH:
+            os._exit(1)
+
+        conn.send(("embedded", (np.empty((0, 5)), np.empty((0, 5, 2)), np.empty((0, 512)), {"detect": 0.0})))
+
+    shm.close()
+
+
+class FakeWorkerPool(InferenceWorkerPool):
+    worker_main = staticmethod(fake_worker_main)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # Faces are built by the web process from the worker's results
+    common = ModuleType("insightface.app.common")
+    common.Face = SimpleNamespace
+    monkeypatch.setitem(sys.modules, "insightface.app.common", common)
+
+    pool = FakeWorkerPool(
+        InferenceScheduler(), num_workers=1, runtime_settings=dict(DEFAULT_RUNTIME_SETTINGS),
+        num_slots=2, max_frame_shape=(4, 4, 3), max_restarts=2,
+    )
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+def frame(first_byte: int = 0) -> np.ndarray:
+    img = np.zeros((4, 4, 3), dtype=np.uint8)
+    img.flat[0] = first_byte
+    return img
+
+
+def test_pool_keeps_serving_after_worker_exits(pool):
+    assert pool.infer("cam", frame()) == []
+
+    with pytest.raises(RuntimeError, match="worker exited"):
+        pool.infer("cam", frame(CRASH))
+
+    assert pool.infer("cam", frame()) == []
+    assert pool.restarts == 1
+    assert pool.lost_workers == 0
+    assert pool.ready_workers == 1
+
+
+def test_pool_stops_once_worker_exits_too_often(pool):
+    for _ in range(pool.max_restarts + 1):
+        with pytest.raises(RuntimeError, match="worker exited"):
+            pool.infer("cam", frame(CRASH))
+
+    assert pool.stop_event.wait(timeout=10)
+    assert pool.restarts == pool.max_restarts
+    assert pool.lost_workers == 1
+
+    with pytest.raises(RuntimeError, match="stopped"):
+        pool.infer("cam", frame())
@@ -0,0 +1,54 @@
+import numpy as np
+
+from utils import calc_iou_matrix
+
+
+def random_boxes(rng: np.random.Generator, num: int) -> np.ndarray:
+    corners = rng.uniform(0, 1, size=(num, 2, 2))
+    return np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1).astype(np.float32)
+
+
+def pairwise_iou(bbox1: np.ndarray, bbox2: np.ndarray) -> float:
+    inter_width = max(0.0, min(bbox1[2], bbox2[2]) - max(bbox1[0], bbox2[0]))
+    inter_height = max(0.0, min(bbox1[3], bbox2[3]) - max(bbox1[1], bbox2[1]))
+    inter_area = inter_width * inter_height
+
+    area1 = (bbox1[2] - bbox1[0]) * (bbox1[3] - bbox1[1])
+    area2 = (bbox2[2] - bbox2[0]) * (bbox2[3] - bbox2[1])
+    return inter_area / (area1 + area2 - inter_area)
+
+
+def test_matches_pairwise_iou():
+    rng = np.random.default_rng(0)
+    bboxes1, bboxes2 = random_boxes(rng, 7), random_boxes(rng, 5)
+
+    ious = calc_iou_matrix(bboxes1, bboxes2)
+
+    assert ious.shape == (7, 5)
+    expected = [[pairwise_iou(bbox1, bbox2) for bbox2 in bboxes2] for bbox1 in bboxes1]
+    np.testing.assert_allclose(ious, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_identical_and_disjoint_boxes():
+    ious = calc_iou_matrix([[0, 0, 1, 1]], [[0, 0, 1, 1], [2, 2, 3, 3], [1, 0, 2, 1]])
+
+    np.testing.assert_allclose(ious, [[1.0, 0.0, 0.0]])
+
+
+def test_partial_overlap():
+    ious = calc_iou_matrix([[0, 0, 2, 2]], [[1, 0, 3, 2]])
+
+    np.testing.assert_allclose(ious, [[2 / 6]])
+
+
+def test_zero_area_boxes_give_zero():
+    ious = calc_iou_matrix([[1, 1, 1, 1]], [[1, 1, 1, 1], [0, 0, 2, 2]])
+
+    assert not np.isnan(ious).any()
+    np.testing.assert_allclose(ious, [[0.0, 0.0]])
+
+
+def test_single_box_and_empty_sets():
+    assert calc_iou_matrix([0, 0, 1, 1], [0, 0, 1, 1]).shape == (1, 1)
+    assert calc_iou_matrix(np.empty((0, 4)), [[0, 0, 1, 1]]).shape == (0, 1)
+    assert calc_iou_matrix([[0, 0, 1, 1]], np.empty((0, 4))).shape == (1, 0)
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from fr.ReadWriteLock import ReadWriteLock
+
+
+def start(target) -> threading.Thread:
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def test_readers_hold_the_lock_together():
+    lock = ReadWriteLock()
+    both_reading = threading.Barrier(2, timeout=5)
+
+    def read():
+        with lock.read():
+            both_reading.wait()
+
+    threads = [start(read) for _ in range(2)]
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert not both_reading.broken
+
+
+def test_writer_waits_for_readers():
+    lock = ReadWriteLock()
+    events = []
+
+    def write():
+        with lock.write():
+            events.append("write")
+
+    with lock.read():
+        writer = start(write)
+        time.sleep(0.1)
+        events.append("read done")
+
+    writer.join(timeout=5)
+    assert events == ["read done", "write"]
+
+
+def test_waiting_writer_goes_before_new_readers():
+    lock = ReadWriteLock()
+    events = []
+
+    def write():
+        with lock.write():
+            events.append("write")
+
+    def read():
+        with lock.read():
+            events.append("read")
+
+    with lock.read():
+        writer = start(write)
+        time.sleep(0.1)
+
+        # Arrives while the writer is waiting for the first reader
+        reader = start(read)
+        time.sleep(0.1)
+        assert events == []
+
+    writer.join(timeout=5)
+    reader.join(timeout=5)
+    assert events == ["write", "read"]
+
+
+def test_lock_released_when_holder_raises():
+    lock = ReadWriteLock()
+
+    for hold in (lock.read, lock.write):
+        try:
+            with hold():
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+    acquired = threading.Event()
+
+    def write():
+        with lock.write():
+            acquired.set()
+
+    start(write)
+    assert acquired.wait(timeout=5)
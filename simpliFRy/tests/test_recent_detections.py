@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import fr.RecentDetections as recent_detections_module
+from fr.RecentDetections import RecentDetections
+
+
+def unit_embeddings(num: int, seed: int = 0) -> np.ndarray:
+    embeddings = np.random.default_rng(seed).standard_normal((num, 512)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(recent_detections_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_nothing_matches_an_empty_store():
+    recent = RecentDetections()
+
+    names, similarities = recent.match(np.array([[0, 0, 1, 1]]), unit_embeddings(1), 0.2)
+
+    assert names == [None]
+    np.testing.assert_array_equal(similarities, [0.0])
+
+
+def test_matches_most_similar_overlapping_detection():
+    embeddings = unit_embeddings(3)
+    recent = RecentDetections()
+    recent.update(
+        ["a", "b", "c"],
+        np.array([[0, 0, 0.2, 0.2], [0.05, 0, 0.25, 0.2], [0.7, 0.7, 0.9, 0.9]]),
+        embeddings,
+        holding_time=15,
+    )
+
+    # The first face overlaps a and b and is b; the second is c but overlaps nothing
+    names, similarities = recent.match(
+        np.array([[0.02, 0, 0.22, 0.2], [0.3, 0.3, 0.4, 0.4]]), embeddings[[1, 2]], 0.2
+    )
+
+    assert names == ["b", None]
+    assert similarities[0] == pytest.approx(1.0, abs=1e-5)
+    assert similarities[1] == -np.inf
+
+
+def test_person_seen_twice_in_a_frame_keeps_last_detection():
+    embeddings = unit_embeddings(2)
+    recent = RecentDetections()
+
+    recent.update(["a", "a"], np.array([[0, 0, 0.1, 0.1], [0.5, 0.5, 0.6, 0.6]]), embeddings, holding_time=15)
+
+    assert len(recent) == 1
+    np.testing.assert_allclose(recent.bboxes[recent.slots["a"]], [0.5, 0.5, 0.6, 0.6])
+    np.testing.assert_allclose(recent.norm_embeds[recent.slots["a"]], embeddings[1])
+
+
+def test_people_not_in_latest_frame_are_kept_for_holding_time(clock):
+    embeddings = unit_embeddings(2)
+    recent = RecentDetections()
+    recent.update(["a"], np.array([[0, 0, 0.1, 0.1]]), embeddings[:1], holding_time=15)
+
+    clock[0] += 10
+    preserved = recent.update(["b"], np.array([[0.5, 0.5, 0.6, 0.6]]), embeddings[1:], holding_time=15)
+
+    assert preserved == ["a"]
+    assert "a" in recent and "b" in recent
+
+    clock[0] += 10
+    preserved = recent.update(["b"], np.array([[0.5, 0.5, 0.6, 0.6]]), embeddings[1:], holding_time=15)
+
+    assert preserved == []
+    assert "a" not in recent
+    assert recent.names == ["b"]
+
+
+def test_clear():
+    recent = RecentDetections()
+    recent.update(["a"], np.array([[0, 0, 0.1, 0.1]]), unit_embeddings(1), holding_time=15)
+
+    recent.clear()
+
+    assert len(recent) == 0
+    assert recent.norm_embeds.shape == (0, 512)
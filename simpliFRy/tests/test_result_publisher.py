@@ -0,0 +1,49 @@
+import json
+
+from fr.ResultPublisher import ResultPublisher
+
+RESULTS = [{"bboxes": [0.1, 0.1, 0.2, 0.2], "labels": "Jane Smith", "score": 0.3}]
+
+
+def test_unchanged_results_are_not_published_again():
+    publisher = ResultPublisher()
+
+    assert publisher.publish(RESULTS)
+    assert not publisher.publish([dict(result) for result in RESULTS])
+    assert publisher.version == 1
+
+    assert publisher.publish([])
+    assert publisher.version == 2
+
+
+def test_payload_is_one_json_line():
+    publisher = ResultPublisher()
+    publisher.publish(RESULTS)
+
+    assert publisher.payload.endswith("\n")
+    assert json.loads(publisher.payload) == {"data": RESULTS}
+
+
+def test_subscriber_gets_current_then_new_versions():
+    publisher = ResultPublisher()
+    subscription = publisher.subscribe(timeout=0.01)
+
+    assert json.loads(next(subscription)) == {"data": []}
+
+    publisher.publish(RESULTS)
+    assert json.loads(next(subscription)) == {"data": RESULTS}
+
+    # Only the latest version is handed over when several are published in between
+    publisher.publish([])
+    publisher.publish(RESULTS[:1] * 2)
+    assert json.loads(next(subscription)) == {"data": RESULTS[:1] * 2}
+
+
+def test_close_ends_subscriptions():
+    publisher = ResultPublisher()
+    subscription = publisher.subscribe(timeout=0.01)
+    next(subscription)
+
+    publisher.close()
+
+    assert list(subscription) == []
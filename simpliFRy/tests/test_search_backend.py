@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from fr.SearchBackend import ExactBackend, VoyagerBackend, select_backend
+
+BACKEND_CLASSES = [ExactBackend, VoyagerBackend]
+
+
+def gallery_and_queries(
+    num_people: int = 10, per_person: int = 5, num_queries: int = 10, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Gallery of noisy embeddings of each person, and noisy queries of some of them
+
+    Voyager is approximate, so each query's k <= per_person nearest neighbours are kept well apart from the
+    unrelated embeddings, as they are for real faces
+    """
+
+    rng = np.random.default_rng(seed)
+    people = rng.standard_normal((num_people, 512)).astype(np.float32)
+    embeddings = np.repeat(people, per_person, axis=0)
+    embeddings += rng.standard_normal(embeddings.shape).astype(np.float32) * 0.5
+    queries = people[rng.integers(num_people, size=num_queries)]
+    queries = queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.5
+
+    return embeddings, queries
+
+
+def query_all(embeddings: np.ndarray, queries: np.ndarray, k: int, change=None) -> list[tuple[np.ndarray, np.ndarray]]:
+    results = []
+    for backend_cls in BACKEND_CLASSES:
+        backend = backend_cls.build(embeddings)
+        if change is not None:
+            change(backend)
+        ids, distances = backend.query(list(queries), k=k)
+        results.append((np.asarray(ids), np.asarray(distances)))
+
+    return results
+
+
+def assert_same_results(results: list[tuple[np.ndarray, np.ndarray]]) -> None:
+    (exact_ids, exact_distances), (voyager_ids, voyager_distances) = results
+
+    np.testing.assert_array_equal(voyager_ids, exact_ids)
+    np.testing.assert_allclose(voyager_distances, exact_distances, atol=1e-4)
+
+
+@pytest.mark.parametrize("k", [1, 2, 5])
+def test_backends_find_same_neighbours(k):
+    embeddings, queries = gallery_and_queries()
+
+    assert_same_results(query_all(embeddings, queries, k))
+
+
+def test_backends_agree_after_removing_and_adding():
+    embeddings, queries = gallery_and_queries()
+    extra, _ = gallery_and_queries(num_people=2, num_queries=0, seed=1)
+
+    def change(backend):
+        backend.remove(list(range(0, 50, 3)))
+        assert backend.add(extra) == list(range(50, 60))
+
+    results = query_all(embeddings, np.concatenate([queries, extra]), 2, change)
+
+    assert_same_results(results)
+    assert not np.isin(results[0][0], range(0, 50, 3)).any()
+    np.testing.assert_array_equal(results[0][0][-10:, 0], range(50, 60))
+
+
+@pytest.mark.parametrize("backend_cls", BACKEND_CLASSES)
+def test_saved_backend_gives_same_results(backend_cls, tmp_path):
+    embeddings, queries = gallery_and_queries()
+    backend = backend_cls.build(embeddings)
+    backend.remove([1, 2])
+
+    fp = str(tmp_path / f"index{backend_cls.extension}")
+    backend.save(fp)
+    loaded = backend_cls.load(fp)
+
+    assert len(loaded) == len(backend) == 50
+    for expected, actual in zip(backend.query(list(queries), k=2), loaded.query(list(queries), k=2)):
+        np.testing.assert_allclose(actual, expected)
+
+
+def test_exact_distances_are_cosine_distances():
+    embeddings, queries = gallery_and_queries(num_people=5, per_person=1, num_queries=2)
+
+    ids, distances = ExactBackend.build(embeddings).query(list(queries), k=5)
+
+    normalised = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = 1 - (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalised.T
+    np.testing.assert_allclose(distances, np.take_along_axis(expected, ids, axis=1), atol=1e-5)
+    assert (np.diff(distances, axis=1) >= 0).all()
+
+
+@pytest.mark.parametrize("gallery_size, expected", [(0, ExactBackend), (1000, ExactBackend), (1001, VoyagerBackend)])
+def test_auto_selects_by_gallery_size(gallery_size, expected):
+    assert select_backend("auto", gallery_size, exact_max_size=1000) is expected
+
+
+def test_configured_backend_used_whatever_the_size():
+    assert select_backend("exact", 10**6, exact_max_size=1000) is ExactBackend
+    assert select_backend("voyager", 1, exact_max_size=1000) is VoyagerBackend
+
+    with pytest.raises(ValueError, match="Unknown search backend"):
+        select_backend("faiss", 1, exact_max_size=1000)
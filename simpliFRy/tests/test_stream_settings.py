@@ -0,0 +1,34 @@
+import pytest
+
+from fr.FRVidPlayer import CAPTURE_PROFILES, DEFAULT_STREAM_SETTINGS, resolve_stream_settings
+
+
+def test_defaults_when_nothing_given():
+    assert resolve_stream_settings(None) == DEFAULT_STREAM_SETTINGS
+    assert resolve_stream_settings({}) == DEFAULT_STREAM_SETTINGS
+
+
+def test_capture_profile_applied_over_defaults():
+    settings = resolve_stream_settings({"capture_profile": "light"})
+
+    for key, value in CAPTURE_PROFILES["light"].items():
+        assert settings[key] == value
+    assert settings["det_size"] == DEFAULT_STREAM_SETTINGS["det_size"]
+
+
+def test_given_settings_override_capture_profile():
+    settings = resolve_stream_settings({"capture_profile": "light", "capture_fps": 12, "pix_fmt": "bgr24"})
+
+    assert settings["capture_fps"] == 12
+    assert settings["pix_fmt"] == "bgr24"
+    assert settings["capture_width"] == CAPTURE_PROFILES["light"]["capture_width"]
+
+
+def test_unknown_capture_profile():
+    with pytest.raises(ValueError, match="Unknown capture profile"):
+        resolve_stream_settings({"capture_profile": "ultra"})
+
+
+def test_unsupported_pixel_format():
+    with pytest.raises(ValueError, match="Unsupported pixel format"):
+        resolve_stream_settings({"pix_fmt": "yuv420p"})
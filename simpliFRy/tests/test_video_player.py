@@ -0,0 +1,113 @@
+import os
+import stat
+import sys
+import time
+
+import pytest
+
+from fr.VideoPlayer import VideoPlayer
+
+# Stands in for ffmpeg: writes FAKE_FFMPEG_FRAMES frames (numbered by their first byte) at once, then exits or,
+# with FAKE_FFMPEG_HOLD set, keeps the pipe open like a live stream with no new frame yet
+FAKE_FFMPEG = f"""#!{sys.executable}
+import os, re, sys, time
+
+args = sys.argv[1:]
+width, height = map(int, re.search(r"scale=(\\d+):(\\d+)", args[args.index("-vf") + 1]).groups())
+num_frames = int(os.environ["FAKE_FFMPEG_FRAMES"])
+
+with open(os.environ["FAKE_FFMPEG_LOG"], "a") as log:
+    log.write(args[args.index("-i") + 1] + "\\n")
+
+frames = b"".join(bytes([idx]) + bytes(width * height * 3 - 1) for idx in range(num_frames))
+os.write(sys.stdout.fileno(), frames)
+
+if os.environ.get("FAKE_FFMPEG_HOLD"):
+    time.sleep(60)
+"""
+
+
+@pytest.fixture
+def ffmpeg_log(tmp_path, monkeypatch):
+    ffmpeg_fp = tmp_path / "ffmpeg"
+    ffmpeg_fp.write_text(FAKE_FFMPEG)
+    ffmpeg_fp.chmod(ffmpeg_fp.stat().st_mode | stat.S_IEXEC)
+
+    log_fp = tmp_path / "ffmpeg.log"
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_FFMPEG_LOG", str(log_fp))
+    monkeypatch.setenv("FAKE_FFMPEG_FRAMES", "2")
+    return log_fp
+
+
+@pytest.fixture
+def player():
+    player = VideoPlayer(width=8, height=8, reconnect_delay=0.05, max_reconnect_delay=0.05, broadcast_fps=0)
+    yield player
+    player.end_stream()
+    player.streamThread.join(timeout=5)
+
+
+def wait_until(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.mark.parametrize("stream_src, is_live", [
+    ("rtsp://10.0.0.2:554/stream", True),
+    (" http://camera.local/video.mjpg ", True),
+    ("srt://10.0.0.2:9000", True),
+    ("videos/entrance.mp4", False),
+    ("/no/such/video.mp4", False),
+])
+def test_only_urls_are_live(stream_src, is_live):
+    assert VideoPlayer._is_live(stream_src) == is_live
+
+
+def test_missing_local_file_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Video file not found"):
+        VideoPlayer.check_source(str(tmp_path / "missing.mp4"))
+    with pytest.raises(ValueError, match="No stream source"):
+        VideoPlayer.check_source("  ")
+
+    (tmp_path / "video.mp4").write_bytes(b"")
+    VideoPlayer.check_source(str(tmp_path / "video.mp4"))
+    VideoPlayer.check_source("rtsp://10.0.0.2:554/stream")
+
+
+def test_live_stream_is_reconnected_when_it_drops(ffmpeg_log, player):
+    player.start_stream("rtsp://10.0.0.2:554/stream")
+
+    assert wait_until(lambda: player.reconnects >= 2)
+    assert player.is_started
+    assert player.frame_buffer.seq >= 2
+    assert ffmpeg_log.read_text().splitlines()[:2] == ["rtsp://10.0.0.2:554/stream"] * 2
+
+
+def test_local_file_ends_instead_of_reconnecting(ffmpeg_log, player, tmp_path):
+    video_fp = tmp_path / "video.mp4"
+    video_fp.write_bytes(b"")
+
+    player.start_stream(str(video_fp))
+
+    assert wait_until(lambda: not player.is_started)
+    assert player.reconnects == 0
+    assert ffmpeg_log.read_text().splitlines() == [str(video_fp)]
+
+
+def test_stale_frames_are_skipped_for_the_newest(ffmpeg_log, player, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_FRAMES", "10")
+    monkeypatch.setenv("FAKE_FFMPEG_HOLD", "1")
+
+    player.start_stream("rtsp://10.0.0.2:554/stream")
+
+    assert player.frame_buffer.wait_for_frame(0, timeout=5)
+    assert wait_until(lambda: player.stale_dropped == 9)
+
+    with player.frame_buffer.read_latest() as (seq, frame):
+        assert seq == 1
+        assert frame.flat[0] == 9
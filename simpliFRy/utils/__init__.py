@@ -1,4 +1,8 @@
-from utils.iou import calc_iou
-from utils.logger import log_info
+from utils.detection import detect_faces
+from utils.iou import calc_iou_matrix
+from utils.logger import forward_logs, get_worker_log_queue, log_detection, log_info
+from utils.onnx_runtime import DEFAULT_RUNTIME_SETTINGS, MODEL_PACKS, load_model, model_identity, resolve_providers, warm_up
+from utils.pixel_format import PIXEL_FORMAT_CHANNELS, frame_to_bgr, frame_to_gray, frame_to_rgb
+from utils.prometheus import format_metric, histogram_samples
 
-__all__ = ['calc_iou', 'log_info']
\ No newline at end of file
+__all__ = ['detect_faces', 'calc_iou_matrix', 'log_info', 'log_detection', 'forward_logs', 'get_worker_log_queue', 'DEFAULT_RUNTIME_SETTINGS', 'MODEL_PACKS', 'load_model', 'model_identity', 'resolve_providers', 'warm_up', 'PIXEL_FORMAT_CHANNELS', 'frame_to_rgb', 'frame_to_bgr', 'frame_to_gray', 'format_metric', 'histogram_samples']
\ No newline at end of file
@@ -0,0 +1,67 @@
+import numpy as np
+
+from utils.iou import calc_iou_matrix
+
+
+def detect_faces(
+    det_model,
+    img: np.ndarray,
+    det_size: int | None = None,
+    rois: list[list[float]] | None = None,
+    nms_threshold: float = 0.4,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Detects faces in an image, or only in regions of interest of the image
+
+    Arguments
+    - det_model: insightface detection model
+    - img: image
+    - det_size: size (pixels) of the square the image (or each region of interest) is resized into for detection, None for the model's default
+    - rois: regions of interest in xyxy format (fraction of the image), None or empty for the whole image
+    - nms_threshold: faces detected in overlapping regions of interest with a higher IoU than this are merged
+
+    Returns
+    - (N, 5) array of bounding boxes (xyxy, in pixels of the whole image) and detection scores
+    - (N, 5, 2) array of facial keypoints (in pixels of the whole image)
+    """
+
+    input_size = (det_size, det_size) if det_size else None
+
+    if not rois:
+        return det_model.detect(img, input_size=input_size, max_num=0, metric='default')
+
+    height, width = img.shape[:2]
+    bboxes_list, kpss_list = [np.empty((0, 5), dtype=np.float32)], [np.empty((0, 5, 2), dtype=np.float32)]
+
+    for roi in rois:
+        x_min, y_min = int(roi[0] * width), int(roi[1] * height)
+        x_max, y_max = int(round(roi[2] * width)), int(round(roi[3] * height))
+        if x_max <= x_min or y_max <= y_min:
+            continue
+
+        bboxes, kpss = det_model.detect(
+            img[y_min:y_max, x_min:x_max], input_size=input_size, max_num=0, metric='default'
+        )
+
+        # Map back from the region of interest to the whole image
+        bboxes[:, 0:4] += [x_min, y_min, x_min, y_min]
+        kpss += [x_min, y_min]
+
+        bboxes_list.append(bboxes)
+        kpss_list.append(kpss)
+
+    bboxes, kpss = np.concatenate(bboxes_list), np.concatenate(kpss_list)
+
+    if len(rois) == 1 or len(bboxes) < 2:
+        return bboxes, kpss
+
+    # Faces in the overlap of 2 regions of interest are detected twice; keep the more confident detection
+    order = np.argsort(-bboxes[:, 4])
+    ious = calc_iou_matrix(bboxes[order, 0:4], bboxes[order, 0:4])
+
+    keep = []
+    for idx in range(len(order)):
+        if all(ious[idx, kept] <= nms_threshold for kept in keep):
+            keep.append(idx)
+
+    return bboxes[order[keep]], kpss[order[keep]]
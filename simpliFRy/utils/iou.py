@@ -1,40 +1,32 @@
-def calc_box_area(bbox: list[float]) -> float:
+import numpy as np
+
+
+def calc_iou_matrix(bboxes1: np.ndarray, bboxes2: np.ndarray) -> np.ndarray:
     """
-    Calculates the area of a bounding box
+    Calculate Intersection-Over-Union values between every pair of bounding boxes from 2 sets
 
     Arguments
-    - bbox: bounding box in xyxy format 
+    - bboxes1: (M, 4) array of bounding boxes in xyxy format
+    - bboxes2: (N, 4) array of bounding boxes in xyxy format
 
     Returns
-    - Area of bounding box
+    - (M, N) array of intersection-over-union values
     """
 
-    x_min, y_min, x_max, y_max = bbox
-    return max(0, x_max - x_min) * max(0, y_max - y_min)
+    bboxes1 = np.asarray(bboxes1, dtype=np.float32).reshape(-1, 1, 4)
+    bboxes2 = np.asarray(bboxes2, dtype=np.float32).reshape(1, -1, 4)
 
-def calc_iou(bbox1: list[float], bbox2: list[float]) -> float:
-    """
-    Calculate Intersection-Over-Union value of 2 bounding boxes
+    # Calculate intersection area of every pair, clipped to 0 where bounding boxes do not intersect
+    inter_width = np.clip(
+        np.minimum(bboxes1[..., 2], bboxes2[..., 2]) - np.maximum(bboxes1[..., 0], bboxes2[..., 0]), 0, None
+    )
+    inter_height = np.clip(
+        np.minimum(bboxes1[..., 3], bboxes2[..., 3]) - np.maximum(bboxes1[..., 1], bboxes2[..., 1]), 0, None
+    )
+    inter_area = inter_width * inter_height
 
-    Arguments
-    - bbox1: bounding box in xyxy format
-    - bbox2: bounding box in xyxy format
+    area1 = np.clip(bboxes1[..., 2] - bboxes1[..., 0], 0, None) * np.clip(bboxes1[..., 3] - bboxes1[..., 1], 0, None)
+    area2 = np.clip(bboxes2[..., 2] - bboxes2[..., 0], 0, None) * np.clip(bboxes2[..., 3] - bboxes2[..., 1], 0, None)
+    union_area = area1 + area2 - inter_area
 
-    Returns
-    - intersection-over-union value
-    """
-    
-    # Calculate intersection area bounding box values
-    x_min = max(bbox1[0], bbox2[0])
-    y_min = max(bbox1[1], bbox2[1])
-    x_max = min(bbox1[2], bbox2[2])
-    y_max = min(bbox1[3], bbox2[3])
-
-    # If bounding boxes do not intersect, return 0
-    if x_min >= x_max or y_min >= y_max: 
-        return 0.0
-
-    inter_area = calc_box_area([x_min, y_min, x_max, y_max])
-    union_area = calc_box_area(bbox1) + calc_box_area(bbox2) - inter_area
-    
-    return inter_area / union_area
+    return np.divide(inter_area, union_area, out=np.zeros_like(inter_area), where=union_area > 0)
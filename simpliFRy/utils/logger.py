@@ -1,24 +1,217 @@
+import atexit
+import json
 import logging
+import multiprocessing
+import multiprocessing.queues
 import os
+import queue
+import threading
+import time
 from datetime import datetime
+from logging.handlers import QueueHandler, RotatingFileHandler
 
 log_folder = os.path.join('data', 'logs')
 
-os.makedirs(log_folder, exist_ok=True)
+# Spawned worker processes import this module too, but only the main process writes the log files; workers forward their records to it
+is_main_process = multiprocessing.current_process().name == "MainProcess"
 
 curr_time = datetime.now().strftime('%Y-%m-%d %H-%M-%S')
 
 log_filename = os.path.join(log_folder, f"Logs {curr_time}.logs")
 
+# Detection events (one JSON object per line), rolled over by size and age
+detections_filename = os.path.join(log_folder, "detections.jsonl")
+DETECTIONS_MAX_BYTES = 50 * 1024 * 1024
+DETECTIONS_MAX_AGE = 24 * 60 * 60
+DETECTIONS_BACKUP_COUNT = 30
+
+
+class BatchFileHandler(RotatingFileHandler):
+    """
+    File handler rolled over once the file exceeds a size or an age, whichever comes first.
+    Records are written without flushing; the log writer flushes once per batch of records.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 0, max_age: float = 0, backup_count: int = 0) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - filename: path to the log file
+        - max_bytes: size (bytes) at which the file is rolled over, 0 for no limit
+        - max_age: age (seconds) at which the file is rolled over, 0 for no limit
+        - backup_count: number of rolled over files kept
+        """
+
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+
+        self.max_age = max_age
+        self.opened_at = time.time()
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.max_age > 0 and time.time() - self.opened_at >= self.max_age:
+            return True
+
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self.opened_at = time.time()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class DetectionFormatter(logging.Formatter):
+    """Formats a detection event as one JSON line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds")
+        return json.dumps({"timestamp": timestamp, **record.event})
+
+
+class LogWriter:
+    """
+    Writes log records queued by the inference and web threads to their files in a background thread, so that logging never waits on disk I/O.
+    Records queued while a batch is being written are written together in the next batch, followed by a single flush.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, handlers: dict[str, logging.Handler], max_batch: int = 512) -> None:
+        """
+        Initialises the class
+
+        Arguments
+        - log_queue: queue the loggers put their records in
+        - handlers: handler writing the records of each logger, by logger name
+        - max_batch: maximum number of records written per flush
+        """
+
+        self.queue = log_queue
+        self.handlers = handlers
+        self.max_batch = max_batch
+
+    def start(self) -> None:
+        """Starts writing records in a separate thread"""
+
+        self.writerThread = threading.Thread(target=self._loopWrite)
+        self.writerThread.daemon = True
+        self.writerThread.start()
+
+    def stop(self) -> None:
+        """Writes the records still queued and stops the writer"""
+
+        self.queue.put(None)
+        self.writerThread.join(timeout=5)
+
+    def _loopWrite(self) -> None:
+        """Repeatedly writes the queued records in batches"""
+
+        stopped = False
+
+        while not stopped:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for record in batch:
+                if record is None:
+                    stopped = True
+                    continue
+
+                handler = self.handlers.get(record.name)
+                if handler is not None:
+                    handler.handle(record)
+
+            for handler in self.handlers.values():
+                handler.flush()
+
+
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
 logger = logging.getLogger('detections')
 logger.setLevel(logging.INFO)
-logger_handler = logging.FileHandler(log_filename)
-logger_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-logger_handler.setFormatter(logger_formatter)
-logger.addHandler(logger_handler)
+logger.propagate = False
+
+detection_logger = logging.getLogger('detection_events')
+detection_logger.setLevel(logging.INFO)
+detection_logger.propagate = False
+
+# Queue worker processes forward their records on, created when the first worker is started
+worker_queue: multiprocessing.queues.Queue | None = None
+worker_queue_lock = threading.Lock()
+
+if is_main_process:
+    os.makedirs(log_folder, exist_ok=True)
+
+    logger.addHandler(QueueHandler(log_queue))
+    detection_logger.addHandler(QueueHandler(log_queue))
+
+    logger_handler = BatchFileHandler(log_filename)
+    logger_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    detection_handler = BatchFileHandler(
+        detections_filename,
+        max_bytes=DETECTIONS_MAX_BYTES,
+        max_age=DETECTIONS_MAX_AGE,
+        backup_count=DETECTIONS_BACKUP_COUNT,
+    )
+    detection_handler.setFormatter(DetectionFormatter())
+
+    log_writer = LogWriter(log_queue, {logger.name: logger_handler, detection_logger.name: detection_handler})
+    log_writer.start()
+    atexit.register(log_writer.stop)
+
+    print(f"\nLogging to file: {log_filename}\n")
+
+
+def _loopForward(forward_queue: multiprocessing.queues.Queue) -> None:
+    """Repeatedly moves the records forwarded by worker processes to the log writer"""
+
+    while True:
+        log_queue.put(forward_queue.get())
+
+
+def get_worker_log_queue() -> multiprocessing.queues.Queue:
+    """
+    Provides the queue worker processes forward their log records on (to be passed to them when they are started), in the main process
+
+    Returns
+    - queue of log records, read by a background thread handing them to the log writer
+    """
+
+    global worker_queue
+
+    with worker_queue_lock:
+        if worker_queue is None:
+            worker_queue = multiprocessing.get_context("spawn").Queue()
+
+            forwardThread = threading.Thread(target=_loopForward, args=(worker_queue,))
+            forwardThread.daemon = True
+            forwardThread.start()
+
+    return worker_queue
+
+
+def forward_logs(forward_queue: multiprocessing.queues.Queue) -> None:
+    """
+    Sends the log records of a worker process to the main process, which writes them to its log files
+
+    Arguments
+    - forward_queue: queue from get_worker_log_queue in the main process
+    """
+
+    for forwarded_logger in (logger, detection_logger):
+        forwarded_logger.handlers.clear()
+        forwarded_logger.addHandler(QueueHandler(forward_queue))
 
-print(f"\nLogging to file: {log_filename}\n")
-    
 
 def log_info(message: str) -> None:
     """
@@ -27,5 +220,19 @@ def log_info(message: str) -> None:
     Arguments
     - message: message to be logged
     """
-    
+
     logger.info(message)
+
+
+def log_detection(cam_id: str, name: str, score: float, bbox: list[float]) -> None:
+    """
+    Logs the recognition of a person in the detection event stream
+
+    Arguments
+    - cam_id: identifier of the camera the person was recognised on
+    - name: name of the person
+    - score: distance (cosine) of the face to the person's face in the database
+    - bbox: bounding box of the face in xyxy format (fraction of the frame)
+    """
+
+    detection_logger.info(name, extra={"event": {"camera": cam_id, "name": name, "score": score, "bbox": bbox}})
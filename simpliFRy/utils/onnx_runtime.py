@@ -0,0 +1,217 @@
+import os
+from typing import TypedDict
+
+import numpy as np
+
+
+class ModelPack(TypedDict):
+    """insightface model pack, its detection and recognition model files, and whether its recognition model is quantised"""
+
+    pack: str
+    det_file: str
+    rec_file: str
+    int8: bool
+
+
+# Selectable models, from the most accurate to the fastest (only the detection and recognition models of each pack are loaded)
+MODEL_PACKS: dict[str, ModelPack] = {
+    "buffalo_l": {"pack": "buffalo_l", "det_file": "det_10g.onnx", "rec_file": "w600k_r50.onnx", "int8": False},
+    "buffalo_l_int8": {"pack": "buffalo_l", "det_file": "det_10g.onnx", "rec_file": "w600k_r50.onnx", "int8": True},
+    "buffalo_s": {"pack": "buffalo_s", "det_file": "det_500m.onnx", "rec_file": "w600k_mbf.onnx", "int8": False},
+    "buffalo_s_int8": {"pack": "buffalo_s", "det_file": "det_500m.onnx", "rec_file": "w600k_mbf.onnx", "int8": True},
+}
+
+
+class RuntimeSettings(TypedDict):
+    """Model pack, and ONNX Runtime settings of the sessions running its models"""
+
+    model_pack: str
+    providers: list[str]
+    intra_op_threads: int
+    inter_op_threads: int
+    graph_optimization: str
+    cpu_mem_arena: bool
+
+
+DEFAULT_RUNTIME_SETTINGS: RuntimeSettings = {
+    "model_pack": "buffalo_l",
+    "providers": [],
+    "intra_op_threads": 0,
+    "inter_op_threads": 1,
+    "graph_optimization": "all",
+    "cpu_mem_arena": True,
+}
+
+# Names of the graph optimisation levels of ONNX Runtime
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+def resolve_providers(providers: list[str]) -> list[str]:
+    """
+    Checks the requested execution providers against those ONNX Runtime was built with
+
+    Arguments
+    - providers: execution providers in order of preference, empty to use CUDA if available and the CPU otherwise
+
+    Returns
+    - execution providers to create sessions with
+    """
+
+    import onnxruntime
+
+    available = onnxruntime.get_available_providers()
+
+    if not providers:
+        return [provider for provider in ("CUDAExecutionProvider", "CPUExecutionProvider") if provider in available]
+
+    unavailable = [provider for provider in providers if provider not in available]
+    if unavailable:
+        raise ValueError(f"Execution providers not available: {', '.join(unavailable)} (available: {', '.join(available)})")
+
+    return providers
+
+
+def create_session_options(settings: RuntimeSettings, num_threads: int = 0):
+    """
+    Creates the options of an ONNX Runtime session
+
+    Arguments
+    - settings: ONNX Runtime settings
+    - num_threads: number of threads running each operator, 0 for the setting (or ONNX Runtime's default of one per physical core if that is also 0)
+
+    Returns
+    - session options
+    """
+
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+
+    intra_op_threads = num_threads or settings["intra_op_threads"]
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = settings["inter_op_threads"]
+
+    options.graph_optimization_level = getattr(
+        onnxruntime.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[settings["graph_optimization"]]
+    )
+
+    # The arena keeps memory freed by one inference for the next, at the cost of holding on to the peak
+    options.enable_cpu_mem_arena = settings["cpu_mem_arena"]
+
+    return options
+
+
+def quantize_model(model_file: str) -> str:
+    """
+    Quantises the weights of an ONNX model to int8, unless it was already quantised
+
+    Arguments
+    - model_file: path to the ONNX model
+
+    Returns
+    - path to the quantised model, next to the original
+    """
+
+    quantized_file = os.path.splitext(model_file)[0] + "_int8.onnx"
+    if os.path.exists(quantized_file):
+        return quantized_file
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    # Written to a temporary file first, as worker processes may be loading the same pack
+    quantize_dynamic(model_file, quantized_file + ".tmp", weight_type=QuantType.QInt8)
+    os.replace(quantized_file + ".tmp", quantized_file)
+
+    return quantized_file
+
+
+def model_identity(model) -> str:
+    """
+    Identifies the recognition model of a loaded insightface model, as embeddings of different models cannot be compared
+
+    Arguments
+    - model: prepared insightface model
+
+    Returns
+    - model pack and file name of the recognition model, e.g. buffalo_l/w600k_r50.onnx
+    """
+
+    model_file = model.models["recognition"].model_file
+
+    return f"{os.path.basename(os.path.dirname(model_file))}/{os.path.basename(model_file)}"
+
+
+def load_model(settings: RuntimeSettings, num_threads: int = 0):
+    """
+    Loads the detection and recognition models of the model pack, with ONNX Runtime sessions created from the settings
+
+    Arguments
+    - settings: model pack and ONNX Runtime settings
+    - num_threads: number of threads running each operator, 0 for the setting
+
+    Returns
+    - prepared insightface model
+    """
+
+    import onnxruntime
+    from insightface.app import FaceAnalysis
+    from insightface.model_zoo import ArcFaceONNX, RetinaFace
+    from insightface.utils import ensure_available
+
+    model_pack = MODEL_PACKS[settings["model_pack"]]
+    providers = resolve_providers(settings["providers"])
+    options = create_session_options(settings, num_threads)
+
+    onnxruntime.set_default_logger_severity(3)
+
+    # Downloaded on first use, as FaceAnalysis does
+    model_dir = ensure_available("models", model_pack["pack"], root="~/.insightface")
+    det_file = os.path.join(model_dir, model_pack["det_file"])
+    rec_file = os.path.join(model_dir, model_pack["rec_file"])
+
+    # The quantised model keeps the inputs, outputs and normalisation of the original, which insightface reads from the original
+    session_rec_file = quantize_model(rec_file) if model_pack["int8"] else rec_file
+
+    # Each session is created once, with the tuned options (FaceAnalysis would create default sessions for the whole pack first)
+    det_model = RetinaFace(
+        model_file=det_file, session=onnxruntime.InferenceSession(det_file, sess_options=options, providers=providers)
+    )
+    rec_model = ArcFaceONNX(
+        model_file=rec_file, session=onnxruntime.InferenceSession(session_rec_file, sess_options=options, providers=providers)
+    )
+    rec_model.model_file = session_rec_file
+
+    # Landmark and attribute models are never used
+    model = FaceAnalysis.__new__(FaceAnalysis)
+    model.model_dir = model_dir
+    model.models = {"detection": det_model, "recognition": rec_model}
+    model.det_model = det_model
+
+    # A non-negative ctx_id keeps the sessions' providers (a negative one would recreate them on the CPU)
+    model.prepare(ctx_id=0)
+
+    return model
+
+
+def warm_up(model, det_size: int = 640) -> None:
+    """
+    Runs the detection and recognition models once on blank input, so that the first frame of a camera does not pay for
+    ONNX Runtime allocating its buffers and picking its kernels
+
+    Arguments
+    - model: prepared insightface model
+    - det_size: size (pixels) of the square input of the detection model
+    """
+
+    rec_model = model.models["recognition"]
+
+    model.det_model.detect(
+        np.zeros((det_size, det_size, 3), dtype=np.uint8), input_size=(det_size, det_size), max_num=0, metric='default'
+    )
+    rec_model.get_feat([np.zeros((rec_model.input_size[1], rec_model.input_size[0], 3), dtype=np.uint8)])
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+
+# Raw pixel formats ffmpeg can be asked to decode into, with their number of channels
+PIXEL_FORMAT_CHANNELS = {
+    "bgr24": 3,
+    "rgb24": 3,
+    "gray": 1,
+}
+
+
+def frame_to_rgb(frame: np.ndarray, pix_fmt: str) -> np.ndarray:
+    """
+    Converts a decoded frame to RGB, as used by the insightface models
+
+    Arguments
+    - frame: frame (height x width x channels) in the given pixel format
+    - pix_fmt: pixel format the frame was decoded into
+
+    Returns
+    - RGB frame (the frame itself if it is already RGB)
+    """
+
+    if pix_fmt == "rgb24":
+        return frame
+    if pix_fmt == "gray":
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
+
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def frame_to_bgr(frame: np.ndarray, pix_fmt: str) -> np.ndarray:
+    """
+    Converts a decoded frame to BGR (or grayscale), as used by OpenCV for encoding
+
+    Arguments
+    - frame: frame (height x width x channels) in the given pixel format
+    - pix_fmt: pixel format the frame was decoded into
+
+    Returns
+    - BGR frame (the frame itself if it is already BGR or grayscale)
+    """
+
+    if pix_fmt == "rgb24":
+        return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+
+    return frame
+
+
+def frame_to_gray(frame: np.ndarray, pix_fmt: str) -> np.ndarray:
+    """
+    Converts a decoded frame to grayscale
+
+    Arguments
+    - frame: frame (height x width x channels) in the given pixel format
+    - pix_fmt: pixel format the frame was decoded into
+
+    Returns
+    - grayscale frame (height x width)
+    """
+
+    if pix_fmt == "gray":
+        return frame.reshape(frame.shape[:2])
+    if pix_fmt == "rgb24":
+        return cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
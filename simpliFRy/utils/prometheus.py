@@ -0,0 +1,90 @@
+import math
+
+# Sample of a metric: suffix of the metric name (e.g. "_bucket"), labels and value
+Sample = tuple[str, dict[str, str], float]
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    """
+    Formats labels of a sample in the Prometheus text format
+
+    Arguments
+    - labels: label names and values
+
+    Returns
+    - labels in braces, or an empty string if there are none
+    """
+
+    if not labels:
+        return ""
+
+    formatted = []
+    for name, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        formatted.append(f'{name}="{escaped}"')
+
+    return "{" + ",".join(formatted) + "}"
+
+
+def _format_value(value: float) -> str:
+    """
+    Formats the value of a sample in the Prometheus text format
+
+    Arguments
+    - value: value of the sample
+
+    Returns
+    - value as text (infinities as +Inf and -Inf)
+    """
+
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_metric(name: str, metric_type: str, help_text: str, samples: list[Sample]) -> str:
+    """
+    Formats a metric and its samples in the Prometheus text exposition format
+
+    Arguments
+    - name: name of the metric
+    - metric_type: "counter", "gauge" or "histogram"
+    - help_text: description of the metric
+    - samples: suffix of the metric name, labels and value of each sample
+
+    Returns
+    - HELP and TYPE lines followed by one line per sample
+    """
+
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    lines += [
+        f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}" for suffix, labels, value in samples
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def histogram_samples(
+    labels: dict[str, str], buckets: list[tuple[float, int]], count: int, total: float
+) -> list[Sample]:
+    """
+    Forms the samples of one histogram in the Prometheus text format
+
+    Arguments
+    - labels: labels of the histogram
+    - buckets: upper bound and cumulative count of each bucket, the last bound being infinity
+    - count: number of observations
+    - total: sum of observations
+
+    Returns
+    - bucket, sum and count samples
+    """
+
+    samples: list[Sample] = [
+        ("_bucket", {**labels, "le": _format_value(bound)}, cumulative) for bound, cumulative in buckets
+    ]
+    samples.append(("_sum", labels, total))
+    samples.append(("_count", labels, count))
+
+    return samples